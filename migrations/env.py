@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from api.db_pool import disable_statement_timeout
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -95,6 +97,9 @@ def run_migrations_online():
         conf_args["process_revision_directives"] = process_revision_directives
 
     connectable = get_engine()
+    # Data migrations backfill whole tables; DB_STATEMENT_TIMEOUT_MS is meant
+    # for web requests and would cancel them.
+    disable_statement_timeout(connectable)
 
     with connectable.connect() as connection:
         context.configure(
@@ -0,0 +1,95 @@
+"""full-text search entries
+
+Revision ID: 23534c31fd43
+Revises: 27c26d7887d8
+Create Date: 2026-10-16 23:44:00.024733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '23534c31fd43'
+down_revision = '27c26d7887d8'
+branch_labels = None
+depends_on = None
+
+# The full-text structures and documents as of this revision, kept here so
+# later changes to api.search cannot change what this migration creates.
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_entry_fts USING fts5(
+        title, body, content='search_entry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_entry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_entry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS search_entry_au",
+    "DROP TRIGGER IF EXISTS search_entry_ad",
+    "DROP TRIGGER IF EXISTS search_entry_ai",
+    "DROP TABLE IF EXISTS search_entry_fts",
+]
+POSTGRES_DDL = [
+    """ALTER TABLE search_entry ADD COLUMN IF NOT EXISTS document tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') ||
+            setweight(to_tsvector('simple', body), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_search_entry_document ON search_entry USING GIN (document)",
+]
+POSTGRES_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_search_entry_document",
+    "ALTER TABLE search_entry DROP COLUMN IF EXISTS document",
+]
+INDEX_DOCUMENTS = [
+    """INSERT INTO search_entry (entity_type, entity_id, title, body)
+        SELECT 'poi', poi.id, poi.name, poi.description || ' ' || city.name || ' ' || country.name
+        FROM poi JOIN city ON poi.city_id = city.id JOIN country ON city.country_id = country.id""",
+    """INSERT INTO search_entry (entity_type, entity_id, title, body)
+        SELECT 'city', city.id, city.name, country.name
+        FROM city JOIN country ON city.country_id = country.id""",
+    """INSERT INTO search_entry (entity_type, entity_id, title, body)
+        SELECT 'country', country.id, country.name, ''
+        FROM country""",
+]
+
+
+def run_ddl(connection, ddl):
+    for statement in ddl.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('search_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.String(length=36), nullable=False),
+    sa.Column('title', sa.String(length=240), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('entity_type', 'entity_id', name='uq_search_entry_entity')
+    )
+    # ### end Alembic commands ###
+    connection = op.get_bind()
+    run_ddl(connection, {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL})
+    for statement in INDEX_DOCUMENTS:
+        connection.exec_driver_sql(statement)
+
+
+def downgrade():
+    run_ddl(op.get_bind(), {'sqlite': SQLITE_DROP_DDL, 'postgresql': POSTGRES_DROP_DDL})
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('search_entry')
+    # ### end Alembic commands ###
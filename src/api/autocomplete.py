@@ -0,0 +1,474 @@
+import heapq
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from sqlalchemy import func, select
+from api.models import db, Country, City, Poi, Tag, PoiTag, Favorite, Visited, PoiPopularity
+from api.worker_index import WorkerIndex
+
+# Tables whose rows are entries of the index; a write to one of them from
+# another worker triggers a rebuild on the next request.
+ENTRY_TABLES = ('country', 'city', 'poi', 'tag')
+# Tables only feeding the popularity scores; writes from other workers are
+# picked up by a rebuild once the index is older than POPULARITY_MAX_AGE.
+POPULARITY_TABLES = ('poi_tag', 'favorite', 'visited')
+AUTOCOMPLETE_TABLES = ENTRY_TABLES + POPULARITY_TABLES
+POPULARITY_MAX_AGE = 300
+# Most suggestions returned by a lookup.
+MAX_AUTOCOMPLETE_RESULTS = 20
+# Precomputed lists keep spare entries, so one that loses an entry is
+# completed from the list itself instead of ranking its whole key range.
+PRECOMPUTED_RESULTS = 2 * MAX_AUTOCOMPLETE_RESULTS
+# Prefixes up to this length always have their ranking precomputed; longer
+# ones only when they match more than SCAN_LIMIT keys, so a lookup either
+# reads a precomputed list or ranks a short range of the key array.
+PRECOMPUTED_PREFIX_LENGTH = 3
+SCAN_LIMIT = 1000
+# Commits with more operations (a bulk import) rebuild the index in the
+# background rather than being replayed on it.
+MAX_INCREMENTAL_OPERATIONS = 200
+# Each of the first words of a name starts a key, so "Museo del Prado" is
+# found by "prado" too.
+MAX_WORD_KEYS = 4
+# Sorts after every character, so prefix + PREFIX_END bounds the keys starting with prefix.
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    """
+    Fold a name or a user query for prefix matching.
+    Args:
+        text (str): Raw text.
+    Returns:
+        str: Lowercase text without accents, words separated by single spaces.
+    """
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def entry_keys(name):
+    """Keys under which a name is indexed: the name from each of its first words on."""
+    key = normalize(name)
+    keys = set()
+    while key and len(keys) < MAX_WORD_KEYS:
+        keys.add(key)
+        key = key.partition(' ')[2]
+    return keys
+
+
+def _prefixes(keys):
+    return {key[:length] for key in keys for length in range(1, len(key) + 1)}
+
+
+class _Index:
+    """Sorted key array plus per-entity columns, addressed by integer refs."""
+
+    def __init__(self):
+        self.keys = []
+        self.refs = array('l')
+        self.kinds = []
+        self.ids = []
+        self.names = []
+        self.scores = array('l')
+        self.parents = []
+        self.refs_by_entity = {kind: {} for kind in ENTRY_TABLES}
+        self.top = {}
+        # Prefixes matching more entries than their precomputed list holds.
+        self.truncated = set()
+        # Set when a precomputed list can only be completed by a rebuild.
+        self.stale = False
+
+    def rank_key(self, ref):
+        return (-self.scores[ref], self.names[ref], ref)
+
+    def rank(self, refs, limit=MAX_AUTOCOMPLETE_RESULTS):
+        return heapq.nsmallest(limit, set(refs), key=self.rank_key)
+
+    def key_range(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        return start, bisect_left(self.keys, prefix + PREFIX_END, start)
+
+    def new_ref(self, kind, entity_id, name, parent, score):
+        ref = len(self.kinds)
+        self.kinds.append(kind)
+        self.ids.append(entity_id)
+        self.names.append(name)
+        self.scores.append(score)
+        self.parents.append(parent)
+        self.refs_by_entity[kind][entity_id] = ref
+        return ref
+
+    def ref_of(self, kind, entity_id):
+        return self.refs_by_entity[kind].get(entity_id)
+
+    def build(self, entities):
+        """Fill the index from (kind, id, name, parent, score) tuples."""
+        pairs = []
+        for entity in entities:
+            ref = self.new_ref(*entity)
+            pairs.extend((key, ref) for key in entry_keys(entity[2]))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.refs = array('l', (ref for _, ref in pairs))
+        # Rank every entity once, then rank the groups by comparing plain ints.
+        ranked = sorted(range(len(self.names)), key=self.rank_key)
+        positions = array('l', bytes(len(ranked) * array('l').itemsize))
+        for position, ref in enumerate(ranked):
+            positions[ref] = position
+        self.precompute(0, len(self.keys), 1, ranked, positions)
+
+    def precompute(self, start, end, length, ranked, positions):
+        """Rank the prefixes of the given length found in keys[start:end], descending into large ones."""
+        while start < end:
+            prefix = self.keys[start][:length]
+            if len(prefix) < length:
+                # A shorter key sorts right before the longer ones it prefixes.
+                start += 1
+                continue
+            group_end = bisect_left(self.keys, prefix + PREFIX_END, start, end)
+            if length <= PRECOMPUTED_PREFIX_LENGTH or group_end - start > SCAN_LIMIT:
+                best = sorted({positions[ref] for ref in self.refs[start:group_end]})
+                self.top[prefix] = [ranked[position] for position in best[:PRECOMPUTED_RESULTS]]
+                if len(best) > PRECOMPUTED_RESULTS:
+                    self.truncated.add(prefix)
+            if length < PRECOMPUTED_PREFIX_LENGTH or group_end - start > SCAN_LIMIT:
+                self.precompute(start, group_end, length + 1, ranked, positions)
+            start = group_end
+
+    def lookup(self, text, limit):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        if prefix in self.top or len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return self.top.get(prefix, [])[:limit]
+        start, end = self.key_range(prefix)
+        return self.rank(self.refs[start:end], limit)
+
+    # Incremental maintenance
+
+    def key_changes(self, operations):
+        """
+        Net key edits of a batch of operations, computed without modifying the index.
+        Args:
+            operations (list): Operations about to be applied, in order.
+        Returns:
+            tuple: Sorted (key, ref) pairs to insert and (key, ref) pairs to remove.
+        """
+        refs = {}
+        names = {}
+        next_ref = len(self.kinds)
+        for name, *args in operations:
+            if name not in ('add', 'rename', 'remove'):
+                continue
+            entity = tuple(args[:2])
+            ref = refs[entity] if entity in refs else self.ref_of(*entity)
+            if name == 'remove':
+                if ref is not None:
+                    names[ref] = refs[entity] = None
+            elif ref is not None:
+                names[ref] = args[2]
+            elif name == 'add':
+                # Refs are handed out in order, as add does.
+                names[next_ref] = args[2]
+                refs[entity] = next_ref
+                next_ref += 1
+        inserted, removed = [], []
+        for ref, name in names.items():
+            old = entry_keys(self.names[ref]) if ref < len(self.names) else set()
+            new = entry_keys(name) if name is not None else set()
+            inserted.extend((key, ref) for key in new - old)
+            removed.extend((key, ref) for key in old - new)
+        return sorted(inserted), removed
+
+    def merged_keys(self, inserted, removed):
+        """Return new key and ref arrays with the given pairs inserted and removed, copied in one pass."""
+        edits = [(bisect_right(self.keys, key), 0, key, ref) for key, ref in inserted]
+        for key, ref in removed:
+            position = bisect_left(self.keys, key)
+            while self.refs[position] != ref:
+                position += 1
+            edits.append((position, 1, None, None))
+        # At the same position an insertion goes first, before the old key is skipped.
+        edits.sort(key=lambda edit: edit[:2])
+        keys, refs = [], array('l')
+        copied = 0
+        for position, removal, key, ref in edits:
+            keys += self.keys[copied:position]
+            refs += self.refs[copied:position]
+            if removal:
+                copied = position + 1
+            else:
+                keys.append(key)
+                refs.append(ref)
+                copied = position
+        keys += self.keys[copied:]
+        refs += self.refs[copied:]
+        return keys, refs
+
+    def rank_prefix(self, prefix, refs):
+        # Keys are installed before a batch is applied; its new refs get offered when added.
+        refs = {ref for ref in refs if ref < len(self.kinds)}
+        self.top[prefix] = self.rank(refs, PRECOMPUTED_RESULTS)
+        if len(refs) > PRECOMPUTED_RESULTS:
+            self.truncated.add(prefix)
+        else:
+            self.truncated.discard(prefix)
+
+    def refill(self, prefix):
+        """Complete a precomputed list that ran out of spare entries."""
+        start, end = self.key_range(prefix)
+        if end - start > SCAN_LIMIT:
+            # Ranking a long range here would stall the request; rebuild instead.
+            self.stale = True
+        elif len(prefix) > PRECOMPUTED_PREFIX_LENGTH:
+            # Short enough for lookups to rank it.
+            del self.top[prefix]
+            self.truncated.discard(prefix)
+        else:
+            self.rank_prefix(prefix, self.refs[start:end])
+
+    def offer(self, ref):
+        """Re-rank the precomputed lists after ref got added or more popular."""
+        for prefix in _prefixes(entry_keys(self.names[ref])):
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                if len(prefix) > PRECOMPUTED_PREFIX_LENGTH:
+                    continue
+                ranked = self.top[prefix] = []
+            if ref not in ranked:
+                # A truncated list only holds what ranks above everything left out.
+                if prefix in self.truncated and \
+                        (not ranked or self.rank_key(ref) > self.rank_key(ranked[-1])):
+                    continue
+                ranked.append(ref)
+            ranked.sort(key=self.rank_key)
+            if len(ranked) > PRECOMPUTED_RESULTS:
+                del ranked[PRECOMPUTED_RESULTS:]
+                self.truncated.add(prefix)
+
+    def withdraw(self, ref, prefixes, removed):
+        """Re-rank the precomputed lists holding ref after it lost popularity or left the prefixes."""
+        for prefix in prefixes:
+            ranked = self.top.get(prefix)
+            if not ranked or ref not in ranked:
+                continue
+            if removed:
+                ranked.remove(ref)
+            else:
+                ranked.sort(key=self.rank_key)
+                if prefix in self.truncated and ranked[-1] == ref:
+                    # Entries left out of the list may now rank above ref.
+                    ranked.pop()
+            if prefix in self.truncated and len(ranked) < MAX_AUTOCOMPLETE_RESULTS:
+                self.refill(prefix)
+
+    def add(self, kind, entity_id, name, parent):
+        if self.ref_of(kind, entity_id) is not None:
+            self.rename(kind, entity_id, name)
+            return
+        ref = self.new_ref(kind, entity_id, name, parent, 0)
+        self.offer(ref)
+
+    def remove(self, kind, entity_id):
+        ref = self.refs_by_entity[kind].pop(entity_id, None)
+        if ref is None:
+            return
+        self.withdraw(ref, _prefixes(entry_keys(self.names[ref])), True)
+
+    def rename(self, kind, entity_id, name):
+        ref = self.ref_of(kind, entity_id)
+        if ref is None or self.names[ref] == name:
+            return
+        old = _prefixes(entry_keys(self.names[ref]))
+        new = _prefixes(entry_keys(name))
+        self.names[ref] = name
+        self.withdraw(ref, old - new, True)
+        # Names break ties, so where ref stays listed it may rank lower too.
+        self.withdraw(ref, new, False)
+        self.offer(ref)
+
+    def add_score(self, kind, entity_id, delta):
+        ref = self.ref_of(kind, entity_id)
+        if ref is None or not delta:
+            return
+        self.scores[ref] += delta
+        if delta > 0:
+            self.offer(ref)
+        else:
+            self.withdraw(ref, _prefixes(entry_keys(self.names[ref])), False)
+
+    def add_poi_count(self, city_id, delta):
+        ref = self.ref_of('city', city_id)
+        if ref is None:
+            return
+        self.add_score('city', city_id, delta)
+        self.add_score('country', self.parents[ref], delta)
+
+    def move(self, kind, entity_id, parent):
+        ref = self.ref_of(kind, entity_id)
+        if ref is None or self.parents[ref] == parent:
+            return
+        if kind == 'poi':
+            self.add_poi_count(self.parents[ref], -1)
+            self.add_poi_count(parent, 1)
+        elif kind == 'city':
+            self.add_score('country', self.parents[ref], -self.scores[ref])
+            self.add_score('country', parent, self.scores[ref])
+        self.parents[ref] = parent
+
+
+def _load_entities():
+    """
+    Read every indexed entity with its popularity.
+
+    Countries and cities rank by their number of POIs, tags by the POIs
+    carrying them and POIs by how often they were favorited or visited.
+    Returns:
+        list: (kind, id, name, parent_id, score) tuples.
+    """
+    session = db.session
+    city_pois = dict(session.execute(
+        select(Poi.city_id, func.count()).group_by(Poi.city_id)).all())
+    tag_pois = dict(session.execute(
+        select(PoiTag.tag_id, func.count()).group_by(PoiTag.tag_id)).all())
+    poi_scores = dict(session.execute(select(
+        PoiPopularity.poi_id, PoiPopularity.favorite_count + PoiPopularity.visited_count)).all())
+
+    entities = []
+    country_pois = {}
+    for city_id, name, country_id in session.execute(select(City.id, City.name, City.country_id)):
+        score = city_pois.get(city_id, 0)
+        country_pois[country_id] = country_pois.get(country_id, 0) + score
+        entities.append(('city', city_id, name, country_id, score))
+    for country_id, name in session.execute(select(Country.id, Country.name)):
+        entities.append(('country', country_id, name, None, country_pois.get(country_id, 0)))
+    for tag_id, name in session.execute(select(Tag.id, Tag.name)):
+        entities.append(('tag', tag_id, name, None, tag_pois.get(tag_id, 0)))
+    for poi_id, name, city_id in session.execute(
+            select(Poi.id, Poi.name, Poi.city_id).execution_options(yield_per=5000)):
+        entities.append(('poi', poi_id, name, city_id, poi_scores.get(poi_id, 0)))
+    return entities
+
+
+class AutocompleteIndex(WorkerIndex):
+    """Per-worker prefix index over country, city, POI and tag names.
+
+    Names are kept in a sorted array searched with bisect; the best entries
+    of every short prefix are precomputed so the most common lookups are a
+    dict access. While a rebuild runs the previous index keeps answering.
+    """
+
+    def __init__(self):
+        super().__init__('autocomplete', AUTOCOMPLETE_TABLES, MAX_INCREMENTAL_OPERATIONS)
+
+    def load(self):
+        index = _Index()
+        index.build(_load_entities())
+        return index
+
+    def record(self, session):
+        return _record_changes(session)
+
+    def record_bulk(self, model, rows):
+        return _record_bulk(model, rows)
+
+    def prepare(self, index, operations):
+        return index.merged_keys(*index.key_changes(operations))
+
+    def install(self, index, prepared):
+        # The operations below rank against the keys they leave behind.
+        index.keys, index.refs = prepared
+
+    def apply(self, index, operation):
+        name, *args = operation
+        getattr(index, name)(*args)
+
+    def is_stale(self, versions):
+        if self._data.stale or any(self._versions[name] != versions[name] for name in ENTRY_TABLES):
+            return True
+        popularity_changed = any(self._versions[name] != versions[name]
+                                 for name in POPULARITY_TABLES)
+        return popularity_changed and self.age() > POPULARITY_MAX_AGE
+
+    def suggest(self, text, limit=10):
+        """
+        Return the most popular entities with a name starting with the given text.
+        Args:
+            text (str): What the user typed so far; any word of a name may match.
+            limit (int): Number of suggestions, at most MAX_AUTOCOMPLETE_RESULTS.
+        Returns:
+            list: Dicts with type, id and name, most popular first.
+        """
+        index = self.current()
+        with self.lock:
+            return [{'type': index.kinds[ref], 'id': index.ids[ref], 'name': index.names[ref]}
+                    for ref in index.lookup(text, limit)]
+
+    def stats(self):
+        index = self._data
+        return {
+            **super().stats(),
+            'entities': sum(map(len, index.refs_by_entity.values())) if index else 0,
+            'keys': len(index.keys) if index else 0,
+        }
+
+
+ENTRY_MODELS = (Country, City, Poi, Tag)
+PARENT_ATTRIBUTES = {'city': 'country_id', 'poi': 'city_id'}
+
+
+def _parent(obj):
+    attribute = PARENT_ATTRIBUTES.get(obj.__tablename__)
+    return getattr(obj, attribute) if attribute else None
+
+
+def _record_changes(session):
+    """Operations replaying on the index what the flushing session wrote."""
+    additions, changes, scores, removals = [], [], [], []
+    for obj in session.new:
+        if isinstance(obj, ENTRY_MODELS):
+            additions.append(('add', obj.__tablename__, obj.id, obj.name, _parent(obj)))
+            if isinstance(obj, Poi):
+                scores.append(('add_poi_count', obj.city_id, 1))
+        elif isinstance(obj, PoiTag):
+            scores.append(('add_score', 'tag', obj.tag_id, 1))
+        elif isinstance(obj, (Favorite, Visited)):
+            scores.append(('add_score', 'poi', obj.poi_id, 1))
+    for obj in session.dirty:
+        if isinstance(obj, ENTRY_MODELS) and session.is_modified(obj, include_collections=False):
+            changes.append(('rename', obj.__tablename__, obj.id, obj.name))
+            if obj.__tablename__ in PARENT_ATTRIBUTES:
+                changes.append(('move', obj.__tablename__, obj.id, _parent(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, ENTRY_MODELS):
+            removals.append(('remove', obj.__tablename__, obj.id))
+            if isinstance(obj, Poi):
+                scores.append(('add_poi_count', obj.city_id, -1))
+        elif isinstance(obj, PoiTag):
+            scores.append(('add_score', 'tag', obj.tag_id, -1))
+        elif isinstance(obj, (Favorite, Visited)):
+            scores.append(('add_score', 'poi', obj.poi_id, -1))
+    # Removals last, so the POI count of a deleted city still reaches its country.
+    return additions + changes + scores + removals
+
+
+def _record_bulk(model, rows):
+    """Operations replaying on the index rows inserted by bulk_insert."""
+    if model in ENTRY_MODELS:
+        kind = model.__tablename__
+        attribute = PARENT_ATTRIBUTES.get(kind)
+        operations = [('add', kind, row['id'], row['name'], row[attribute] if attribute else None)
+                      for row in rows]
+        if model is Poi:
+            operations.extend(('add_poi_count', row['city_id'], 1) for row in rows)
+        return operations
+    if model is PoiTag:
+        return [('add_score', 'tag', row['tag_id'], 1) for row in rows]
+    if model in (Favorite, Visited):
+        return [('add_score', 'poi', row['poi_id'], 1) for row in rows]
+    return []
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,165 @@
+from sqlalchemy import bindparam, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db
+
+# Rows sent per executemany call.
+BULK_CHUNK_SIZE = 1000
+
+_listeners = []
+_update_listeners = []
+
+
+def on_bulk_insert(listener):
+    """
+    Register a function called as listener(session, model, rows) after bulk_insert.
+
+    bulk_insert bypasses the ORM unit of work, so the session hooks keeping
+    table versions, search entries, popularity rows and worker indexes in
+    sync never see its rows; they register here as well.
+    Args:
+        listener: The function; usable as a decorator.
+    Returns:
+        The listener.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def on_bulk_update(listener):
+    """
+    Register a function called as listener(session, model, rows) after
+    bulk_upsert updated existing rows.
+    Args:
+        listener: The function; usable as a decorator.
+    Returns:
+        The listener.
+    """
+    _update_listeners.append(listener)
+    return listener
+
+
+def _insert_statement(table, dialect_name, ignore_conflicts):
+    if ignore_conflicts and dialect_name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if ignore_conflicts and dialect_name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def bulk_insert(model, rows, ignore_conflicts=False):
+    """
+    Insert plain dict rows with executemany, in the session's transaction.
+
+    Column defaults and ORM events such as Poi's geohash are not applied, so
+    rows must carry every non-nullable column.
+    Args:
+        model: The model whose table receives the rows.
+        rows (list): Dicts keyed by column name, all with the same keys.
+        ignore_conflicts (bool): Skip rows violating a unique constraint
+            (ON CONFLICT DO NOTHING) on SQLite and Postgres instead of failing.
+    Returns:
+        list: The rows actually written.
+    """
+    session = db.session
+    connection = session.connection()
+    table = model.__table__
+    primary_key = list(table.primary_key.columns)
+    statement = _insert_statement(table, connection.dialect.name, ignore_conflicts)
+    written = []
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        if ignore_conflicts:
+            result = connection.execute(statement.returning(*primary_key), chunk)
+            inserted = {tuple(row) for row in result}
+            written.extend(row for row in chunk
+                           if tuple(row[column.name] for column in primary_key) in inserted)
+        else:
+            connection.execute(statement, chunk)
+            written.extend(chunk)
+    if written:
+        for listener in _listeners:
+            listener(session, model, written)
+    return written
+
+
+def _key(row, key_columns):
+    if len(key_columns) == 1:
+        return row[key_columns[0]]
+    return tuple(row[name] for name in key_columns)
+
+
+def _stored_ids(connection, table, key_columns, rows):
+    """Map the unique key of each given row to the id stored under it, if any."""
+    columns = [table.c[name] for name in key_columns]
+    target = columns[0] if len(columns) == 1 else tuple_(*columns)
+    result = connection.execute(select(table.c.id, *columns).where(
+        target.in_([_key(row, key_columns) for row in rows])))
+    return {_key(dict(zip(key_columns, key)), key_columns): stored_id
+            for stored_id, *key in result}
+
+
+def bulk_upsert(model, rows, key_columns, update_columns=()):
+    """
+    Insert rows, or update the stored row with the same unique key.
+
+    Uses INSERT ... ON CONFLICT on SQLite and Postgres; other databases get
+    an UPDATE of the rows found by key followed by an INSERT of the rest.
+    Insert listeners see the new rows, update listeners the existing ones.
+    Args:
+        model: The model whose table receives the rows; its primary key must be id.
+        rows (list): Dicts keyed by column name with a freshly generated id.
+            Keys must be unique within the list.
+        key_columns (tuple): Columns of the unique constraint rows are matched on.
+        update_columns (tuple): Columns overwritten on existing rows; none
+            means existing rows are left as they are.
+    Returns:
+        tuple: (inserted, updated) lists of rows. The id of updated rows is
+        replaced with the stored one.
+    """
+    session = db.session
+    connection = session.connection()
+    table = model.__table__
+    dialect_name = connection.dialect.name
+    inserted, updated = [], []
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        if dialect_name in ('postgresql', 'sqlite'):
+            dialect = postgresql if dialect_name == 'postgresql' else sqlite
+            statement = dialect.insert(table)
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=list(key_columns),
+                    set_={name: statement.excluded[name] for name in update_columns})
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=list(key_columns))
+            connection.execute(statement, chunk)
+            stored = _stored_ids(connection, table, key_columns, chunk)
+        else:
+            stored = _stored_ids(connection, table, key_columns, chunk)
+            new = [row for row in chunk if _key(row, key_columns) not in stored]
+            if new:
+                connection.execute(insert(table), new)
+            existing = [row for row in chunk if _key(row, key_columns) in stored]
+            if existing and update_columns:
+                connection.execute(
+                    update(table).where(table.c.id == bindparam('stored_id')).values(
+                        {name: bindparam(f'new_{name}') for name in update_columns}),
+                    [{'stored_id': stored[_key(row, key_columns)],
+                      **{f'new_{name}': row[name] for name in update_columns}}
+                     for row in existing])
+            stored.update((_key(row, key_columns), row['id']) for row in new)
+        for row in chunk:
+            stored_id = stored[_key(row, key_columns)]
+            if stored_id == row['id']:
+                inserted.append(row)
+            else:
+                row['id'] = stored_id
+                updated.append(row)
+    if inserted:
+        for listener in _listeners:
+            listener(session, model, inserted)
+    if updated and update_columns:
+        for listener in _update_listeners:
+            listener(session, model, updated)
+    return inserted, updated
+
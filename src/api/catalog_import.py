@@ -0,0 +1,313 @@
+import json
+import math
+import os
+import time
+import uuid
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from api.models import db, Country, City, Tag, Poi, PoiTag, PoiImage
+from api.bulk import bulk_insert, bulk_upsert
+from api.geo import encode_geohash
+
+# Records committed together unless the command says otherwise.
+IMPORT_CHUNK_SIZE = 1000
+# Keys per IN (...) clause when resolving names to ids.
+LOOKUP_CHUNK_SIZE = 500
+REQUIRED_FIELDS = {
+    'country': ('name', 'img'),
+    'tag': ('name',),
+    'city': ('name', 'season', 'country_name'),
+    'poi': ('name', 'description', 'latitude', 'longitude', 'country_name', 'city_name'),
+    'poi_image': ('url', 'poi_name', 'city_name', 'country_name'),
+}
+
+
+class CatalogImportError(Exception):
+    """A line of the catalog file cannot be imported."""
+
+    def __init__(self, line_number, message, offset=None):
+        where = f'line {line_number}' if offset is None else f'line {line_number} (byte {offset})'
+        super().__init__(f'{where}: {message}')
+        self.line_number = line_number
+        self.offset = offset
+
+
+def _parse(line_number, line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise CatalogImportError(line_number, 'invalid JSON')
+    if not isinstance(record, dict):
+        raise CatalogImportError(line_number, 'each line must be a JSON object')
+    kind = record.get('type')
+    if kind not in REQUIRED_FIELDS:
+        raise CatalogImportError(
+            line_number, f"type must be one of {', '.join(REQUIRED_FIELDS)}")
+    for field in REQUIRED_FIELDS[kind]:
+        if record.get(field) in (None, ''):
+            raise CatalogImportError(line_number, f'{field} is required')
+    if kind == 'poi':
+        try:
+            record['latitude'] = float(record['latitude'])
+            record['longitude'] = float(record['longitude'])
+        except (TypeError, ValueError):
+            raise CatalogImportError(line_number, 'latitude/longitude must be numeric')
+        if not math.isfinite(record['latitude']) or not math.isfinite(record['longitude']):
+            raise CatalogImportError(line_number, 'latitude/longitude must be numeric')
+        for field in ('tags', 'poiimages'):
+            values = record.setdefault(field, [])
+            if not isinstance(values, list) or not all(isinstance(v, str) and v for v in values):
+                raise CatalogImportError(line_number, f'{field} must be a list of non-empty strings')
+    return kind, record
+
+
+def _lookup(query, key_columns, keys):
+    """
+    Map keys to ids with one query per LOOKUP_CHUNK_SIZE keys.
+    Args:
+        query: Select of the id followed by key_columns.
+        key_columns (list): Columns forming the key.
+        keys (list): Distinct keys; tuples when the key has several columns.
+    Returns:
+        dict: Key -> id for the keys found.
+    """
+    target = key_columns[0] if len(key_columns) == 1 else tuple_(*key_columns)
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        rows = db.session.execute(query.where(target.in_(keys[start:start + LOOKUP_CHUNK_SIZE])))
+        for stored_id, *key in rows:
+            found[key[0] if len(key) == 1 else tuple(key)] = stored_id
+    return found
+
+
+def _resolve(records, found, key, message):
+    for line_number, record in records:
+        if key(record) not in found:
+            raise CatalogImportError(line_number, message(record))
+
+
+def _latest(records, key):
+    """Keep the last record of each key, so a chunk never writes a key twice."""
+    latest = {}
+    for line_number, record in records:
+        latest[key(record)] = (line_number, record)
+    return list(latest.values())
+
+
+def import_chunk(records, totals):
+    """
+    Upsert one chunk of parsed records in the current transaction.
+
+    Countries, tags, cities and POIs are matched on their unique names
+    (uq_city_name_country, uq_poi_name_city for cities and POIs); existing
+    rows get their other columns overwritten. POI tags and images are only
+    ever added, so replaying a chunk changes nothing.
+    Args:
+        records (list): (line_number, kind, record) tuples.
+        totals (dict): Per kind 'inserted'/'existing' counters, updated in place.
+    Raises:
+        CatalogImportError: If a record references a missing country, city, POI or tag.
+    """
+    by_kind = {kind: [] for kind in REQUIRED_FIELDS}
+    for line_number, kind, record in records:
+        by_kind[kind].append((line_number, record))
+
+    def count(kind, inserted, updated):
+        totals[kind]['inserted'] += len(inserted)
+        totals[kind]['existing'] += len(updated)
+
+    countries = _latest(by_kind['country'], lambda r: r['name'])
+    count('country', *bulk_upsert(Country, [
+        {'id': str(uuid.uuid4()), 'name': r['name'], 'img': r['img']} for _, r in countries],
+        ('name',), ('img',)))
+    tags = _latest(by_kind['tag'], lambda r: r['name'])
+    count('tag', *bulk_upsert(Tag, [
+        {'id': str(uuid.uuid4()), 'name': r['name']} for _, r in tags], ('name',)))
+
+    cities = _latest(by_kind['city'], lambda r: (r['name'], r['country_name']))
+    country_ids = _lookup(select(Country.id, Country.name), [Country.name],
+                          list({r['country_name'] for _, r in cities}))
+    _resolve(cities, country_ids, lambda r: r['country_name'],
+             lambda r: f"Country '{r['country_name']}' not found")
+    count('city', *bulk_upsert(City, [
+        {'id': str(uuid.uuid4()), 'name': r['name'], 'season': r['season'],
+         'country_id': country_ids[r['country_name']]} for _, r in cities],
+        ('name', 'country_id'), ('season',)))
+
+    pois = _latest(by_kind['poi'], lambda r: (r['name'], r['city_name'], r['country_name']))
+    city_ids = _lookup(
+        select(City.id, City.name, Country.name).join(Country, Country.id == City.country_id),
+        [City.name, Country.name], list({(r['city_name'], r['country_name']) for _, r in pois}))
+    _resolve(pois, city_ids, lambda r: (r['city_name'], r['country_name']),
+             lambda r: f"City '{r['city_name']}' in country '{r['country_name']}' not found")
+    tag_ids = _lookup(select(Tag.id, Tag.name), [Tag.name],
+                      list({name for _, r in pois for name in r['tags']}))
+    for line_number, record in pois:
+        for name in record['tags']:
+            if name not in tag_ids:
+                raise CatalogImportError(line_number, f"Tag '{name}' not found")
+    poi_rows = [
+        {'id': str(uuid.uuid4()), 'name': r['name'], 'description': r['description'],
+         'latitude': r['latitude'], 'longitude': r['longitude'],
+         'geohash': encode_geohash(r['latitude'], r['longitude']),
+         'city_id': city_ids[(r['city_name'], r['country_name'])]} for _, r in pois]
+    count('poi', *bulk_upsert(Poi, poi_rows, ('name', 'city_id'),
+                              ('description', 'latitude', 'longitude', 'geohash')))
+    # bulk_upsert replaced the generated ids of existing POIs with the stored ones.
+    bulk_insert(PoiTag, [{'poi_id': row['id'], 'tag_id': tag_ids[name]}
+                         for row, (_, r) in zip(poi_rows, pois) for name in dict.fromkeys(r['tags'])],
+                ignore_conflicts=True)
+
+    image_keys = {(row['id'], url) for row, (_, r) in zip(poi_rows, pois) for url in r['poiimages']}
+    images = by_kind['poi_image']
+    poi_ids = _lookup(
+        select(Poi.id, Poi.name, City.name, Country.name).join(City, City.id == Poi.city_id).join(
+            Country, Country.id == City.country_id),
+        [Poi.name, City.name, Country.name],
+        list({(r['poi_name'], r['city_name'], r['country_name']) for _, r in images}))
+    _resolve(images, poi_ids, lambda r: (r['poi_name'], r['city_name'], r['country_name']),
+             lambda r: f"POI '{r['poi_name']}' in city '{r['city_name']}' not found")
+    image_keys.update((poi_ids[(r['poi_name'], r['city_name'], r['country_name'])], r['url'])
+                      for _, r in images)
+    stored = set()
+    poi_id_list = list({poi_id for poi_id, _ in image_keys})
+    for start in range(0, len(poi_id_list), LOOKUP_CHUNK_SIZE):
+        stored.update(tuple(row) for row in db.session.execute(
+            select(PoiImage.poi_id, PoiImage.url).where(
+                PoiImage.poi_id.in_(poi_id_list[start:start + LOOKUP_CHUNK_SIZE]))))
+    new_images = [{'id': str(uuid.uuid4()), 'poi_id': poi_id, 'url': url}
+                  for poi_id, url in sorted(image_keys - stored)]
+    bulk_insert(PoiImage, new_images)
+    totals['poi_image']['inserted'] += len(new_images)
+
+
+def _replay(records):
+    """Import records and roll them back; return the database error, if any."""
+    totals = {kind: {'inserted': 0, 'existing': 0} for kind in REQUIRED_FIELDS}
+    try:
+        import_chunk(records, totals)
+        db.session.flush()
+    except SQLAlchemyError as error:
+        return error
+    finally:
+        db.session.rollback()
+    return None
+
+
+def _rejected_record(records, error):
+    """
+    Find the record of a chunk the database rejected.
+
+    Bisects on the shortest failing prefix of the chunk, so references to
+    earlier records still resolve; every replay is rolled back.
+    Args:
+        records (list): (line_number, kind, record) tuples of the chunk.
+        error: The error the whole chunk failed with.
+    Returns:
+        tuple: (line_number, error) of the record ending the shortest failing prefix.
+    """
+    passing, failing = 0, len(records)
+    while failing - passing > 1:
+        middle = (passing + failing) // 2
+        failure = _replay(records[:middle])
+        if failure is None:
+            passing = middle
+        else:
+            failing, error = middle, failure
+    return records[failing - 1][0], error
+
+
+def read_checkpoint(checkpoint_path, path):
+    """
+    Read where a previous import of the file stopped.
+    Args:
+        checkpoint_path (str): The checkpoint file.
+        path (str): The catalog file being imported.
+    Returns:
+        tuple: (byte offset, line number) after the last committed chunk,
+        (0, 0) when there is no checkpoint for this file.
+    """
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return 0, 0
+    if checkpoint.get('file') != os.path.abspath(path):
+        return 0, 0
+    return checkpoint['offset'], checkpoint['lines']
+
+
+def write_checkpoint(checkpoint_path, path, offset, lines):
+    """Record atomically that everything up to offset is committed."""
+    temporary_path = f'{checkpoint_path}.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump({'file': os.path.abspath(path), 'offset': offset, 'lines': lines},
+                  checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def import_catalog(path, chunk_size=IMPORT_CHUNK_SIZE, checkpoint_path=None, restart=False,
+                   report=print):
+    """
+    Stream an NDJSON catalog file into the database, one transaction per chunk.
+
+    Each line is an object whose type is country, tag, city, poi or
+    poi_image, with the fields of the matching POST endpoint; POIs may list
+    tags and poiimages, standalone images name their POI by poi_name,
+    city_name and country_name. Records may reference anything defined on an
+    earlier line or in the same chunk. After every commit the position in the
+    file is saved to the checkpoint, and a later run resumes from there.
+    Args:
+        path (str): The NDJSON file.
+        chunk_size (int): Records per transaction.
+        checkpoint_path (str, optional): Defaults to path + '.checkpoint'.
+        restart (bool): Ignore an existing checkpoint and start from the top.
+        report: Called with a progress line after each chunk.
+    Raises:
+        CatalogImportError: On the first invalid record or the first one the
+            database rejects (e.g. a value too long for its column); the
+            failing chunk is rolled back, earlier ones stay committed.
+    Returns:
+        dict: Per record type, the number of rows inserted and of existing rows matched.
+    """
+    checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+    offset, line_number = (0, 0) if restart else read_checkpoint(checkpoint_path, path)
+    if offset:
+        report(f'Resuming after line {line_number}')
+    totals = {kind: {'inserted': 0, 'existing': 0} for kind in REQUIRED_FIELDS}
+    started = time.monotonic()
+    imported = 0
+    with open(path, 'rb') as catalog:
+        catalog.seek(offset)
+        while True:
+            records = []
+            offsets = {}
+            while len(records) < chunk_size:
+                offsets[line_number + 1] = catalog.tell()
+                line = catalog.readline()
+                if not line:
+                    break
+                line_number += 1
+                if line.strip():
+                    records.append((line_number, *_parse(line_number, line)))
+            if not records:
+                break
+            try:
+                import_chunk(records, totals)
+                db.session.commit()
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                rejected, rejection = _rejected_record(records, error)
+                message = str(getattr(rejection, 'orig', None) or rejection).splitlines()[0]
+                raise CatalogImportError(
+                    rejected, f'rejected by the database: {message}', offsets[rejected]) from error
+            except Exception:
+                db.session.rollback()
+                raise
+            write_checkpoint(checkpoint_path, path, catalog.tell(), line_number)
+            imported += len(records)
+            elapsed = time.monotonic() - started
+            report(f'{line_number} lines, {imported} records, {imported / elapsed:.0f} records/s')
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return totals
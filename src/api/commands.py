@@ -1,12 +1,31 @@
 
+import functools
+import time
 import click
 from api.models import db, User
+from api.db_pool import disable_statement_timeout
+from api.search import rebuild_search_index
+from api.popularity import rebuild_popularity
+from api.recommendations import rebuild_similarities
+from api.catalog_import import import_catalog, CatalogImportError, IMPORT_CHUNK_SIZE
+from api.test_data import generate_test_data, TEST_DATA_CHUNK_SIZE, TEST_USER_PASSWORD
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
 Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration 
 with youy database, for example: Import the price of bitcoin every night as 12am
 """
+
+
+def without_statement_timeout(command):
+    """Run a maintenance command without the statement timeout applied to web requests."""
+    @functools.wraps(command)
+    def run(*args, **kwargs):
+        disable_statement_timeout(db.engine)
+        return command(*args, **kwargs)
+    return run
+
+
 def setup_commands(app):
     
     """ 
@@ -29,7 +48,77 @@ def setup_commands(app):
 
         print("All test users created")
 
+    @app.cli.command("rebuild-search-index")
+    @without_statement_timeout
+    def rebuild_search_index_command():
+        """Rebuild the full-text search entries of every POI, city and country."""
+        with db.engine.begin() as connection:
+            rebuild_search_index(connection)
+        print("Search index rebuilt")
+
+    @app.cli.command("rebuild-popularity")
+    @without_statement_timeout
+    def rebuild_popularity_command():
+        """Recompute the popularity counters of every POI from favorites and visits."""
+        with db.engine.begin() as connection:
+            rebuild_popularity(connection)
+        print("POI popularity rebuilt")
+
+    @app.cli.command("rebuild-similarities")
+    @without_statement_timeout
+    def rebuild_similarities_command():
+        """Recompute the similar POIs of every POI; run it periodically, e.g. from cron."""
+        with db.engine.begin() as connection:
+            rows = rebuild_similarities(connection)
+        print(f"POI similarities rebuilt: {rows} rows")
+
+    @app.cli.command("import-catalog")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--chunk-size", default=IMPORT_CHUNK_SIZE, show_default=True,
+                  type=click.IntRange(min=1), help="Records committed per transaction.")
+    @click.option("--checkpoint", default=None,
+                  help="Progress file used to resume. Defaults to PATH.checkpoint.")
+    @click.option("--restart", is_flag=True, help="Ignore the checkpoint and start from the first line.")
+    @without_statement_timeout
+    def import_catalog_command(path, chunk_size, checkpoint, restart):
+        """Upsert countries, tags, cities, POIs and images from an NDJSON file."""
+        started = time.monotonic()
+        try:
+            totals = import_catalog(path, chunk_size, checkpoint, restart, report=print)
+        except CatalogImportError as error:
+            raise click.ClickException(f"{error} (committed chunks are kept; rerun to resume)")
+        elapsed = time.monotonic() - started
+        records = sum(counts['inserted'] + counts['existing'] for counts in totals.values())
+        for kind, counts in totals.items():
+            print(f"{kind}: {counts['inserted']} inserted, {counts['existing']} existing")
+        print(f"Catalog imported in {elapsed:.1f}s ({records / max(elapsed, 1e-9):.0f} rows/s)")
+
     @app.cli.command("insert-test-data")
-    def insert_test_data():
-        pass
-    
\ No newline at end of file
+    @click.option("--countries", default=10, show_default=True, type=click.IntRange(min=0))
+    @click.option("--cities", default=200, show_default=True, type=click.IntRange(min=0))
+    @click.option("--pois", default=10000, show_default=True, type=click.IntRange(min=0))
+    @click.option("--tags", default=30, show_default=True, type=click.IntRange(min=0))
+    @click.option("--users", default=1000, show_default=True, type=click.IntRange(min=0))
+    @click.option("--images-per-poi", default=2, show_default=True, type=click.IntRange(min=0))
+    @click.option("--favorites", default=20000, show_default=True, type=click.IntRange(min=0))
+    @click.option("--visits", default=50000, show_default=True, type=click.IntRange(min=0))
+    @click.option("--seed", default=42, show_default=True, help="Same seed and sizes, same rows.")
+    @click.option("--chunk-size", default=TEST_DATA_CHUNK_SIZE, show_default=True,
+                  type=click.IntRange(min=1), help="Rows per bulk insert and commit.")
+    @click.option("--similarities/--no-similarities", default=True, show_default=True,
+                  help="Compute the similar POIs once the data is in.")
+    @without_statement_timeout
+    def insert_test_data(similarities, **sizes):
+        """Fill an empty database with a reproducible synthetic dataset for benchmarks."""
+        started = time.monotonic()
+        try:
+            counts = generate_test_data(**sizes, report=print)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        if similarities:
+            with db.engine.begin() as connection:
+                counts['poi_similarity'] = rebuild_similarities(connection)
+        for table, rows in counts.items():
+            print(f"{table}: {rows} rows")
+        print(f"Test data created in {time.monotonic() - started:.1f}s; "
+              f"users log in with password '{TEST_USER_PASSWORD}'")
@@ -0,0 +1,134 @@
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from api.metrics import worker_metrics
+
+# Defaults of the DB_* environment variables read by engine_options.
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 5
+# Seconds a request waits for a free connection before failing with a 503.
+DB_POOL_TIMEOUT = 10
+# Seconds after which a connection is replaced, before the server or a proxy
+# drops it for being idle.
+DB_POOL_RECYCLE = 1800
+DB_POOL_PRE_PING = True
+# Milliseconds a Postgres statement may run before the server cancels it;
+# 0 disables the limit.
+DB_STATEMENT_TIMEOUT_MS = 30000
+# SQLSTATE of a statement cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+DATABASE_BUSY_MESSAGE = 'The database is busy, please retry shortly'
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool reporting checkout waits, timeouts and usage to api.metrics."""
+
+    def __init__(self, creator, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        # A negative max_overflow means no limit; only the pool size is counted then.
+        self.capacity = pool_size + max(max_overflow, 0)
+
+    def _report_usage(self):
+        worker_metrics.set_gauge('api_db_pool_connections_in_use', self.checkedout())
+        worker_metrics.set_gauge('api_db_pool_capacity', self.capacity)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            worker_metrics.increment('api_db_pool_timeouts_total')
+            raise
+        finally:
+            worker_metrics.observe('api_db_pool_checkout_wait_seconds', time.perf_counter() - started)
+            self._report_usage()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._report_usage()
+
+
+def _setting(settings, name, default, parse=int):
+    value = settings.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        raise ValueError(f'{name} must be {"an integer" if parse is int else "true or false"}, got {value!r}')
+
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+def engine_options(database_url, settings):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS from DB_* settings.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds), DB_POOL_RECYCLE
+    (seconds) and DB_POOL_PRE_PING apply to every database but in-memory
+    SQLite, which keeps its single shared connection. DB_STATEMENT_TIMEOUT_MS
+    sets statement_timeout on every Postgres connection, so a runaway query
+    frees its connection instead of holding it until the pool runs dry.
+    Args:
+        database_url (str): The SQLALCHEMY_DATABASE_URI.
+        settings (Mapping): Where to read the DB_* values, usually os.environ.
+    Raises:
+        ValueError: If a setting is not a valid number or flag.
+    Returns:
+        dict: Keyword arguments for create_engine.
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': _setting(settings, 'DB_POOL_SIZE', DB_POOL_SIZE),
+        'max_overflow': _setting(settings, 'DB_MAX_OVERFLOW', DB_MAX_OVERFLOW),
+        'pool_timeout': _setting(settings, 'DB_POOL_TIMEOUT', DB_POOL_TIMEOUT),
+        'pool_recycle': _setting(settings, 'DB_POOL_RECYCLE', DB_POOL_RECYCLE),
+        'pool_pre_ping': _setting(settings, 'DB_POOL_PRE_PING', DB_POOL_PRE_PING, parse=_flag),
+    }
+    if backend == 'postgresql':
+        statement_timeout = _setting(settings, 'DB_STATEMENT_TIMEOUT_MS', DB_STATEMENT_TIMEOUT_MS)
+        if statement_timeout > 0:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def disable_statement_timeout(engine):
+    """
+    Lift DB_STATEMENT_TIMEOUT_MS on the connections engine hands out from now on.
+
+    For maintenance commands: their bulk statements may legitimately run far
+    longer than a web request is allowed to.
+    Args:
+        engine: The engine of the current app; nothing is done unless it is Postgres.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+
+    @event.listens_for(engine, 'checkout')
+    def _no_statement_timeout(dbapi_connection, connection_record, connection_proxy):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('SET statement_timeout = 0')
+        finally:
+            cursor.close()
+        # Committed, so rolling back the command's transaction keeps the setting.
+        dbapi_connection.commit()
+
+
+def is_database_busy(error):
+    """Whether error means the database is overloaded: no free pooled connection, or a statement timed out."""
+    if isinstance(error, exc.TimeoutError):
+        return True
+    return isinstance(error, exc.OperationalError) and \
+        getattr(error.orig, 'pgcode', None) == QUERY_CANCELED
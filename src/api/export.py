@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from sqlalchemy import select
+from api.models import db, Poi, City, Country, PoiImage, PoiTag, Tag
+
+# POIs per server-side cursor batch; their tags and images are loaded with one
+# IN (...) query each, so this also bounds those clauses.
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_FIELDS = ('id', 'name', 'description', 'latitude', 'longitude',
+                 'city_id', 'city_name', 'country_name', 'tags', 'images')
+# Separator of the tags and images of a POI inside one CSV cell.
+CSV_LIST_SEPARATOR = '|'
+
+
+def _grouped(statement):
+    grouped = defaultdict(list)
+    for poi_id, value in db.session.execute(statement):
+        grouped[poi_id].append(value)
+    return grouped
+
+
+def export_batches(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Read the whole POI catalog in batches, in id order.
+
+    The POI rows come from one server-side cursor (yield_per), so only one
+    batch is ever held in memory whatever the size of the catalog.
+    Args:
+        chunk_size (int): POIs per batch.
+    Yields:
+        list: Dicts with the EXPORT_FIELDS of each POI of the batch.
+    """
+    rows = db.session.execute(
+        select(Poi.id, Poi.name, Poi.description, Poi.latitude, Poi.longitude, Poi.city_id,
+               City.name.label('city_name'), Country.name.label('country_name'))
+        .join(City, City.id == Poi.city_id)
+        .join(Country, Country.id == City.country_id)
+        .order_by(Poi.id)
+        .execution_options(yield_per=chunk_size))
+    for batch in rows.partitions():
+        poi_ids = [row.id for row in batch]
+        tags = _grouped(select(PoiTag.poi_id, Tag.name).join(Tag, Tag.id == PoiTag.tag_id)
+                        .where(PoiTag.poi_id.in_(poi_ids)).order_by(PoiTag.poi_id, Tag.name))
+        images = _grouped(select(PoiImage.poi_id, PoiImage.url)
+                          .where(PoiImage.poi_id.in_(poi_ids)).order_by(PoiImage.poi_id, PoiImage.url))
+        yield [{**row._asdict(), 'tags': tags.get(row.id, []), 'images': images.get(row.id, [])}
+               for row in batch]
+
+
+def ndjson_chunks(batches):
+    """Render batches as NDJSON, one string per batch."""
+    for batch in batches:
+        yield ''.join(json.dumps(poi) + '\n' for poi in batch)
+
+
+def csv_chunks(batches):
+    """Render batches as CSV with a header row, one string per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for batch in batches:
+        for poi in batch:
+            writer.writerow([CSV_LIST_SEPARATOR.join(poi[field]) if field in ('tags', 'images')
+                             else poi[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
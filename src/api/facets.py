@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import func, literal, select, union_all
+from api.models import db, Poi, City, Country, Tag, PoiTag
+
+# Facet results kept per worker, keyed by filter signature and table versions.
+FACET_CACHE_SIZE = 256
+# Ids per IN (...) clause when the filtered POIs are given as an id list.
+FACET_CHUNK_SIZE = 500
+FACET_KEYS = {'tag': 'tags', 'country': 'countries', 'season': 'seasons'}
+
+
+def _facet_rows(matching):
+    """
+    Run the grouped facet query over a set of POIs.
+    Args:
+        matching: Select of (id, city_id) of the POIs to count.
+    Returns:
+        list: (facet, value, count) rows; facet 'total' carries the POI count.
+    """
+    pois = matching.cte('matching_poi')
+    by_tag = select(literal('tag'), Tag.name, func.count()).select_from(pois).join(
+        PoiTag, PoiTag.poi_id == pois.c.id).join(Tag, Tag.id == PoiTag.tag_id).group_by(Tag.name)
+    by_country = select(literal('country'), Country.name, func.count()).select_from(pois).join(
+        City, City.id == pois.c.city_id).join(Country, Country.id == City.country_id).group_by(Country.name)
+    by_season = select(literal('season'), City.season, func.count()).select_from(pois).join(
+        City, City.id == pois.c.city_id).group_by(City.season)
+    total = select(literal('total'), literal(''), func.count()).select_from(pois)
+    return db.session.execute(union_all(total, by_tag, by_country, by_season)).all()
+
+
+def count_facets(q=None, poi_ids=None):
+    """
+    Count the POIs of a filter per tag, per country and per city season.
+
+    A filtered query is counted by a single statement; an explicit id list
+    (full-text or radius results) by one statement per FACET_CHUNK_SIZE ids.
+    Args:
+        q: POI query with the filters applied, or None when poi_ids is given.
+        poi_ids (list, optional): Ids of the POIs to count.
+    Returns:
+        dict: total plus tags, countries and seasons mappings of value to count.
+    """
+    if poi_ids is None:
+        batches = [q.with_entities(Poi.id.label('id'), Poi.city_id.label('city_id')).statement]
+    else:
+        batches = [select(Poi.id, Poi.city_id).where(Poi.id.in_(poi_ids[start:start + FACET_CHUNK_SIZE]))
+                   for start in range(0, len(poi_ids), FACET_CHUNK_SIZE)]
+    facets = {'total': 0, **{key: {} for key in FACET_KEYS.values()}}
+    for matching in batches:
+        for facet, value, count in _facet_rows(matching):
+            if facet == 'total':
+                facets['total'] += count
+            else:
+                counts = facets[FACET_KEYS[facet]]
+                counts[value] = counts.get(value, 0) + count
+    return facets
+
+
+class FacetCache:
+    """Small per-worker LRU of facet results.
+
+    Keys include the table versions, so entries of outdated data are simply
+    never hit again and age out.
+    """
+
+    def __init__(self, size=FACET_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            facets = self._entries.get(key)
+            if facets is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return facets
+
+    def put(self, key, facets):
+        with self._lock:
+            self._entries[key] = facets
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+facet_cache = FacetCache()
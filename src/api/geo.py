@@ -0,0 +1,185 @@
+import math
+from sqlalchemy import and_, or_
+
+EARTH_RADIUS_KM = 6371.0088
+# Stored geohash length: cells of roughly 4.8 m x 4.8 m.
+GEOHASH_PRECISION = 9
+# Upper bound of geohash cells OR'ed together to cover a search box.
+MAX_COVER_CELLS = 16
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encode a coordinate as a geohash string.
+
+    Nearby points share long common prefixes, so an ordinary B-tree index on
+    the stored hash answers "which rows fall inside this cell" as a range scan.
+    Args:
+        latitude (float): Latitude in degrees.
+        longitude (float): Longitude in degrees.
+        precision (int): Length of the resulting hash.
+    Returns:
+        str: The geohash.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def _cell_size(precision):
+    """Return (lat_degrees, lon_degrees) covered by one cell of the given precision."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between two coordinates.
+    Args:
+        lat1, lon1, lat2, lon2 (float): Coordinates in degrees.
+    Returns:
+        float: Distance in kilometres.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_boxes(latitude, longitude, radius_km):
+    """
+    Bounding boxes enclosing a circle on the sphere, split at the antimeridian.
+    Args:
+        latitude, longitude (float): Centre of the circle in degrees.
+        radius_km (float): Radius in kilometres.
+    Returns:
+        list: (min_lat, min_lon, max_lat, max_lon) tuples.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    lat = math.radians(latitude)
+    min_lat = math.degrees(lat - angular)
+    max_lat = math.degrees(lat + angular)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # The circle contains a pole, so it spans every longitude.
+        return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+    d_lon = math.degrees(math.asin(math.sin(angular) / math.cos(lat)))
+    return split_box(min_lat, longitude - d_lon, max_lat, longitude + d_lon)
+
+
+def split_box(min_lat, min_lon, max_lat, max_lon):
+    """
+    Normalise a box whose longitudes may cross the antimeridian.
+    Args:
+        min_lat, min_lon, max_lat, max_lon (float): Box corners; min_lon > max_lon
+            or values outside [-180, 180] mean the box wraps around.
+    Returns:
+        list: One or two boxes with longitudes inside [-180, 180].
+    """
+    if min_lon < -180.0:
+        return [(min_lat, min_lon + 360.0, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, min_lon, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon - 360.0)]
+    if min_lon > max_lon:
+        return [(min_lat, min_lon, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def covering_prefixes(boxes):
+    """
+    Geohash prefixes whose cells together cover the given boxes.
+
+    Uses the longest prefix length that keeps the number of cells at or
+    below MAX_COVER_CELLS, so every prefix becomes one short index range scan.
+    Args:
+        boxes (list): (min_lat, min_lon, max_lat, max_lon) tuples.
+    Returns:
+        list: Sorted geohash prefixes; [''] means the whole world.
+    """
+    best = ['']
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lat_size, lon_size = _cell_size(precision)
+        cells = set()
+        for min_lat, min_lon, max_lat, max_lon in boxes:
+            lat_start = int((min_lat + 90.0) // lat_size)
+            lat_end = int(min((max_lat + 90.0) // lat_size, (180.0 / lat_size) - 1))
+            lon_start = int((min_lon + 180.0) // lon_size)
+            lon_end = int(min((max_lon + 180.0) // lon_size, (360.0 / lon_size) - 1))
+            if (lat_end - lat_start + 1) * (lon_end - lon_start + 1) > MAX_COVER_CELLS:
+                return best
+            for lat_index in range(lat_start, lat_end + 1):
+                for lon_index in range(lon_start, lon_end + 1):
+                    cells.add(encode_geohash(
+                        (lat_index + 0.5) * lat_size - 90.0,
+                        (lon_index + 0.5) * lon_size - 180.0,
+                        precision))
+        if len(cells) > MAX_COVER_CELLS:
+            return best
+        best = sorted(cells)
+    return best
+
+
+def prefix_range(prefix):
+    """
+    Inclusive (low, high) bounds of the stored hashes starting with prefix.
+    Args:
+        prefix (str): Geohash prefix.
+    Returns:
+        tuple: (low, high) strings of GEOHASH_PRECISION characters.
+    """
+    padding = GEOHASH_PRECISION - len(prefix)
+    return (prefix + GEOHASH_ALPHABET[0] * padding,
+            prefix + GEOHASH_ALPHABET[-1] * padding)
+
+
+def geo_predicate(geohash_column, latitude_column, longitude_column, boxes):
+    """
+    SQL condition selecting the rows inside any of the given boxes.
+
+    The geohash ranges let the database use the geohash index on both
+    SQLite and Postgres; the latitude/longitude comparison then trims the
+    cells' overhang so the box itself is matched exactly.
+    Args:
+        geohash_column: Column storing encode_geohash(latitude, longitude).
+        latitude_column: Latitude column.
+        longitude_column: Longitude column.
+        boxes (list): (min_lat, min_lon, max_lat, max_lon) tuples.
+    Returns:
+        ColumnElement: The SQL condition.
+    """
+    clauses = []
+    prefixes = covering_prefixes(boxes)
+    if prefixes != ['']:
+        clauses.append(or_(*(
+            geohash_column.between(*prefix_range(prefix)) for prefix in prefixes)))
+    clauses.append(or_(*(
+        and_(latitude_column.between(min_lat, max_lat),
+             longitude_column.between(min_lon, max_lon))
+        for min_lat, min_lon, max_lat, max_lon in boxes)))
+    return and_(*clauses)
@@ -0,0 +1,353 @@
+import fcntl
+import hmac
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from flask import Response, request
+from api.sql_stats import request_sql_stats
+
+# Upper bounds, in seconds, of the request latency and DB time buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds, in bytes, of the response size buckets.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Upper bounds, in seconds, of the connection pool checkout wait buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+# Seconds between two dumps of a worker's metrics to its file.
+METRICS_FLUSH_INTERVAL = 1.0
+# Endpoint label of requests that matched no route, so unknown paths cannot
+# create new series.
+UNMATCHED_ENDPOINT = 'unmatched'
+ENDPOINT_ENVIRON_KEY = 'api.metrics.endpoint'
+# Clients allowed to scrape /metrics when no METRICS_TOKEN is configured.
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+ROUTE_LABELS = ('endpoint', 'method')
+# name: (help, label names)
+COUNTERS = {
+    'api_http_requests_total': ('Requests handled, by endpoint, method and status.', ROUTE_LABELS + ('status',)),
+    'api_db_pool_timeouts_total': ('Connection checkouts that gave up waiting for a free connection.', ()),
+}
+# name: help. Gauges are summed over the live workers.
+GAUGES = {
+    'api_http_requests_in_flight': 'Requests being handled right now.',
+    'api_db_pool_connections_in_use': 'Database connections checked out of the pools.',
+    'api_db_pool_capacity': 'Connections the pools may hold (pool size plus overflow), summed over workers.',
+}
+# name: (help, label names, bucket upper bounds)
+HISTOGRAMS = {
+    'api_http_request_duration_seconds': (
+        'Time from receiving a request to sending the last byte.', ROUTE_LABELS, LATENCY_BUCKETS),
+    'api_http_response_size_bytes': ('Size of the response bodies.', ROUTE_LABELS, SIZE_BUCKETS),
+    'api_http_request_db_seconds': (
+        'Time spent in database statements per request.', ROUTE_LABELS, LATENCY_BUCKETS),
+    'api_db_pool_checkout_wait_seconds': (
+        'Time spent waiting for a database connection from the pool.', (), WAIT_BUCKETS),
+}
+
+
+def _empty_state():
+    return {'counters': {name: {} for name in COUNTERS},
+            'gauges': dict.fromkeys(GAUGES, 0),
+            'histograms': {name: {} for name in HISTOGRAMS}}
+
+
+def _merge(total, state):
+    """Add the counters and histograms of state into total (not the gauges)."""
+    for name, series in state['counters'].items():
+        target = total['counters'].setdefault(name, {})
+        for key, count in series.items():
+            target[key] = target.get(key, 0) + count
+    for name, series in state['histograms'].items():
+        target = total['histograms'].setdefault(name, {})
+        for key, (counts, value_sum) in series.items():
+            if key in target:
+                merged = target[key]
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += value_sum
+            else:
+                target[key] = [list(counts), value_sum]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class WorkerMetrics:
+    """Metrics of one process, shared with the other workers through files.
+
+    Every gunicorn worker keeps its counters in memory and dumps them to
+    <directory>/<master pid>/worker-<pid>.json at most every
+    METRICS_FLUSH_INTERVAL, from a background thread. A scrape, served by
+    any worker, dumps that worker's own state and sums every file, so the
+    totals cover all workers. Files of workers that died are folded into
+    archive.json: their counters keep counting, their gauges do not. Other
+    workers' figures can lag by up to one interval. Directories of servers
+    that are gone are removed.
+    """
+
+    def __init__(self, directory):
+        self.root = directory
+        self.lock = threading.Lock()
+        self._pid = None
+        self._dirty = False
+
+    def _ensure_process(self):
+        """Reset the state in a new process (e.g. after gunicorn forked a worker)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self.lock:
+            if self._pid == pid:
+                return
+            self.state = _empty_state()
+            # Workers of one server share the master's pid; a restarted
+            # server gets a new directory and counts from zero.
+            self.directory = os.path.join(self.root, str(os.getppid()))
+            os.makedirs(self.directory, exist_ok=True)
+            for name in os.listdir(self.root):
+                if name.isdigit() and not _pid_alive(int(name)):
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            self.path = os.path.join(self.directory, f'worker-{pid}.json')
+            self._pid = pid
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def increment(self, name, labels=(), amount=1):
+        """Add amount to the counter name with the given label values."""
+        self._ensure_process()
+        key = json.dumps(list(labels))
+        with self.lock:
+            series = self.state['counters'][name]
+            series[key] = series.get(key, 0) + amount
+            self._dirty = True
+
+    def set_gauge(self, name, value):
+        self._ensure_process()
+        with self.lock:
+            self.state['gauges'][name] = value
+            self._dirty = True
+
+    def add_to_gauge(self, name, amount):
+        self._ensure_process()
+        with self.lock:
+            self.state['gauges'][name] += amount
+            self._dirty = True
+
+    def observe(self, name, value, labels=()):
+        """Record value in the histogram name with the given label values."""
+        self._ensure_process()
+        key = json.dumps(list(labels))
+        buckets = HISTOGRAMS[name][2]
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self.lock:
+            series = self.state['histograms'][name].get(key)
+            if series is None:
+                series = self.state['histograms'][name][key] = [[0] * (len(buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+            self._dirty = True
+
+    def flush(self):
+        """Write this worker's state to its file, atomically."""
+        with self.lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'pid': self._pid, **self.state})
+            self._dirty = False
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as metrics_file:
+            metrics_file.write(data)
+        os.replace(temporary_path, self.path)
+
+    def _flush_periodically(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _archive_dead_workers(self, names):
+        """Fold the files of dead workers into archive.json; returns the remaining names."""
+        dead = [name for name in names if not _pid_alive(int(name[len('worker-'):-len('.json')]))]
+        if not dead:
+            return names
+        archive_path = os.path.join(self.directory, 'archive.json')
+        with open(os.path.join(self.directory, 'archive.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive = _empty_state()
+            if os.path.exists(archive_path):
+                with open(archive_path) as archive_file:
+                    _merge(archive, json.load(archive_file))
+            for name in dead:
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path) as metrics_file:
+                        _merge(archive, json.load(metrics_file))
+                except (OSError, ValueError):
+                    continue
+                temporary_path = f'{archive_path}.tmp'
+                with open(temporary_path, 'w') as archive_file:
+                    json.dump(archive, archive_file)
+                os.replace(temporary_path, archive_path)
+                os.remove(path)
+        return [name for name in names if name not in dead]
+
+    def collect(self):
+        """
+        Sum the metrics of every worker of this server.
+        Returns:
+            dict: The merged state, with the gauges summed over live workers.
+        """
+        self._ensure_process()
+        self.flush()
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith('worker-') and name.endswith('.json'))
+        names = self._archive_dead_workers(names)
+        total = _empty_state()
+        for name in names + ['archive.json']:
+            try:
+                with open(os.path.join(self.directory, name)) as metrics_file:
+                    state = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            _merge(total, state)
+            if name != 'archive.json':
+                for gauge, value in state['gauges'].items():
+                    total['gauges'][gauge] = total['gauges'].get(gauge, 0) + value
+        return total
+
+    def render(self):
+        """Render the merged metrics in the Prometheus text exposition format."""
+        total = self.collect()
+        lines = []
+        for name, (description, label_names) in COUNTERS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for key, count in sorted(total['counters'].get(name, {}).items()):
+                lines.append(f'{name}{_labels(label_names, json.loads(key))} {count}')
+        for name, description in GAUGES.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} gauge',
+                      f"{name} {total['gauges'].get(name, 0)}"]
+        for name, (description, label_names, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for key, (counts, value_sum) in sorted(total['histograms'].get(name, {}).items()):
+                values = json.loads(key)
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = f'le="{_format_bound(bound)}"'
+                    lines.append(f'{name}_bucket{_labels(label_names, values, le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, values)} {value_sum}')
+                lines.append(f'{name}_count{_labels(label_names, values)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+worker_metrics = WorkerMetrics(os.path.join(tempfile.gettempdir(), 'api-metrics'))
+
+
+class _InstrumentedBody:
+    """Iterable around a WSGI response body recording the request once it is fully sent."""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close(self.size)
+
+
+def setup_metrics(app):
+    """
+    Instrument every request of app and serve the merged metrics on /metrics.
+
+    The WSGI app is wrapped so the latency and size cover streamed bodies
+    until their last byte. The endpoint label is the URL rule, so all POIs
+    share '/api/pois/<string:poi_id>'. The DB time comes from api.sql_stats,
+    which must be set up too. Set METRICS_DIR to keep the worker
+    files somewhere other than the temporary directory.
+
+    Scrapes must send METRICS_TOKEN as a bearer token; without a token
+    configured, /metrics only answers requests from the machine itself.
+    """
+    if app.config.get('METRICS_DIR'):
+        worker_metrics.root = app.config['METRICS_DIR']
+
+    @app.before_request
+    def label_request():
+        rule = request.url_rule
+        request.environ[ENDPOINT_ENVIRON_KEY] = rule.rule if rule is not None else UNMATCHED_ENDPOINT
+
+    wsgi_app = app.wsgi_app
+
+    def instrumented(environ, start_response):
+        started = time.perf_counter()
+        status = []
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[:] = [status_line.split(' ', 1)[0]]
+            return start_response(status_line, headers, exc_info)
+
+        def finished(size):
+            labels = (environ.get(ENDPOINT_ENVIRON_KEY, UNMATCHED_ENDPOINT), environ.get('REQUEST_METHOD', ''))
+            sql_stats = request_sql_stats(environ)
+            worker_metrics.add_to_gauge('api_http_requests_in_flight', -1)
+            worker_metrics.increment('api_http_requests_total', labels + (status[0] if status else '500',))
+            worker_metrics.observe('api_http_request_duration_seconds', time.perf_counter() - started, labels)
+            worker_metrics.observe('api_http_response_size_bytes', size, labels)
+            worker_metrics.observe('api_http_request_db_seconds', sql_stats.db_time if sql_stats else 0.0, labels)
+
+        worker_metrics.add_to_gauge('api_http_requests_in_flight', 1)
+        try:
+            body = wsgi_app(environ, recording_start_response)
+        except Exception:
+            finished(0)
+            raise
+        return _InstrumentedBody(body, finished)
+
+    app.wsgi_app = instrumented
+
+    def scrape_allowed():
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            return request.remote_addr in LOOPBACK_ADDRESSES
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                   f'Bearer {token}'.encode())
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        if not scrape_allowed():
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(worker_metrics.render(), mimetype='text/plain; version=0.0.4')
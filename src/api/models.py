@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import String, Float
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, Float, event
+from sqlalchemy.orm import Mapped, mapped_column, selectinload
 from typing import List
+from api.geo import encode_geohash, GEOHASH_PRECISION
 
 db = SQLAlchemy()
 
@@ -31,6 +32,14 @@ class User(db.Model):
     visited: Mapped[List["Visited"]] = db.relationship(
         'Visited', back_populates='user', cascade='all, delete-orphan')
 
+    @staticmethod
+    def serialize_options():
+        """Loader options that fetch everything serialize() reads in bulk."""
+        return (
+            selectinload(User.favorites).load_only(Favorite.poi_id),
+            selectinload(User.visited).load_only(Visited.poi_id),
+        )
+
     def serialize(self):
         return {
             "id": self.id,
@@ -57,6 +66,13 @@ class Country(db.Model):
     cities: Mapped[List["City"]] = db.relationship(
         'City', back_populates='country', cascade='all, delete-orphan')
 
+    @staticmethod
+    def serialize_options():
+        """Loader options that fetch everything serialize() reads in bulk."""
+        return (
+            selectinload(Country.cities).load_only(City.id),
+        )
+
     def serialize(self):
         return {
             "id": self.id,
@@ -74,6 +90,7 @@ class City(db.Model):
     __tablename__ = 'city'
     __table_args__ = (
         db.UniqueConstraint('name', 'country_id', name='uq_city_name_country'),
+        db.Index('ix_city_name_id', 'name', 'id'),
     )
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     name: Mapped[str] = mapped_column(String(120), nullable=False)
@@ -85,6 +102,13 @@ class City(db.Model):
     pois: Mapped[List["Poi"]] = db.relationship(
         'Poi', back_populates='city', cascade='all, delete-orphan')
 
+    @staticmethod
+    def serialize_options():
+        """Loader options that fetch everything serialize() reads in bulk."""
+        return (
+            selectinload(City.pois).load_only(Poi.id),
+        )
+
     def serialize(self):
         return {
             "id": self.id,
@@ -130,12 +154,16 @@ class Poi(db.Model):
     __tablename__ = 'poi'
     __table_args__ = (
         db.UniqueConstraint('name', 'city_id', name='uq_poi_name_city'),
+        db.Index('ix_poi_name_id', 'name', 'id'),
     )
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     name: Mapped[str] = mapped_column(String(120), nullable=False)
     description: Mapped[str] = mapped_column(String(500), nullable=False)
     latitude: Mapped[float] = mapped_column(Float, nullable=False)
     longitude: Mapped[float] = mapped_column(Float, nullable=False)
+    # Derived from latitude/longitude on every insert/update, see _set_poi_geohash.
+    geohash: Mapped[str] = mapped_column(
+        String(GEOHASH_PRECISION), nullable=False, index=True)
     city_id: Mapped[str] = mapped_column(
         db.ForeignKey('city.id'), nullable=False)
     city: Mapped["City"] = db.relationship('City', back_populates='pois')
@@ -147,6 +175,20 @@ class Poi(db.Model):
         'Favorite', back_populates='poi', cascade='all, delete-orphan')
     visited_by: Mapped[List["Visited"]] = db.relationship(
         'Visited', back_populates='poi', cascade='all, delete-orphan')
+    popularity: Mapped["PoiPopularity"] = db.relationship(
+        'PoiPopularity', back_populates='poi', uselist=False, cascade='all, delete-orphan')
+    similar_pois: Mapped[List["PoiSimilarity"]] = db.relationship(
+        'PoiSimilarity', foreign_keys='PoiSimilarity.poi_id', cascade='all, delete-orphan')
+    similar_to: Mapped[List["PoiSimilarity"]] = db.relationship(
+        'PoiSimilarity', foreign_keys='PoiSimilarity.similar_poi_id', cascade='all, delete-orphan')
+
+    @staticmethod
+    def serialize_options():
+        """Loader options that fetch everything serialize() reads in bulk."""
+        return (
+            selectinload(Poi.images),
+            selectinload(Poi.poi_tags).joinedload(PoiTag.tag),
+        )
 
     def serialize(self):
         return {
@@ -161,9 +203,18 @@ class Poi(db.Model):
         }
 
 
+@event.listens_for(Poi, 'before_insert')
+@event.listens_for(Poi, 'before_update')
+def _set_poi_geohash(mapper, connection, target):
+    target.geohash = encode_geohash(target.latitude, target.longitude)
+
+
 class PoiImage(db.Model):
     """Image URL associated with a specific POI."""
     __tablename__ = 'poi_image'
+    __table_args__ = (
+        db.Index('ix_poi_image_poi_id_url', 'poi_id', 'url'),
+    )
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     url: Mapped[str] = mapped_column(String(240), nullable=False)
     poi_id: Mapped[str] = mapped_column(
@@ -210,3 +261,66 @@ class Visited(db.Model):
             "user_id": self.user_id,
             "poi_id": self.poi_id
         }
+
+
+class PoiPopularity(db.Model):
+    """Favorite and visit counters of a POI with the score they add up to.
+
+    One row per POI, kept current by api.popularity; ranking by score reads
+    ix_poi_popularity_score instead of aggregating favorite and visited.
+    """
+    __tablename__ = 'poi_popularity'
+    __table_args__ = (
+        db.Index('ix_poi_popularity_score', 'score', 'poi_id'),
+    )
+    poi_id: Mapped[str] = mapped_column(
+        db.ForeignKey('poi.id'), primary_key=True)
+    favorite_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    visited_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    score: Mapped[int] = mapped_column(nullable=False, default=0)
+    poi: Mapped["Poi"] = db.relationship('Poi', back_populates='popularity')
+
+
+class PoiSimilarity(db.Model):
+    """Precomputed similarity between two POIs, kept for the top matches of each POI.
+
+    Rows are written by api.recommendations from favorite and visited
+    co-occurrences; ix_poi_similarity_rank serves a POI's list in score order.
+    """
+    __tablename__ = 'poi_similarity'
+    __table_args__ = (
+        db.Index('ix_poi_similarity_rank', 'poi_id', 'score'),
+    )
+    poi_id: Mapped[str] = mapped_column(
+        db.ForeignKey('poi.id'), primary_key=True)
+    similar_poi_id: Mapped[str] = mapped_column(
+        db.ForeignKey('poi.id'), primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class TableVersion(db.Model):
+    """Change counter per table, bumped right after each transaction writing it commits.
+
+    Used to derive ETags and to detect stale per-worker caches.
+    """
+    __tablename__ = 'table_version'
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class SearchEntry(db.Model):
+    """Text of a POI, city or country as seen by the full-text search.
+
+    Rows are maintained by api.search; the dialect-specific index (an FTS5
+    table on SQLite, a tsvector column with a GIN index on Postgres) is
+    created alongside this table.
+    """
+    __tablename__ = 'search_entry'
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_entry_entity'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    entity_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    title: Mapped[str] = mapped_column(String(240), nullable=False)
+    body: Mapped[str] = mapped_column(db.Text, nullable=False)
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import json
+from flask import request
+from sqlalchemy import and_, false, or_, tuple_
+from api.utils import APIException
+
+MAX_PAGE_LIMIT = 1000
+# Sort keys read per statement while looking for the rows of a page that
+# pass an in-memory row filter.
+SCAN_BATCH_SIZE = 1000
+# Rows looked at in memory per page; the rest of the page is left to the
+# row filter's SQL condition.
+MAX_SCANNED_ROWS = 20000
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of the last returned row as an opaque cursor.
+    Args:
+        values (list): Values of the sort columns for the last row of a page.
+    Returns:
+        str: URL-safe cursor string.
+    """
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _column_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return object
+
+
+def _has_type(value, expected):
+    # JSON turns 1.0 into 1, and bool is an int subclass.
+    if isinstance(value, bool):
+        return expected is bool or expected is object
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor, types):
+    """
+    Decode a cursor produced by encode_cursor.
+    Args:
+        cursor (str): The opaque cursor received from the client.
+        types (list): Python type of each sort key value the cursor must contain.
+    Raises:
+        APIException: If the cursor is malformed or a value has the wrong type.
+    Returns:
+        list: The sort key values stored in the cursor.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, ValueError, UnicodeError):
+        raise APIException('Invalid cursor', status_code=400)
+    if not isinstance(values, list) or len(values) != len(types):
+        raise APIException('Invalid cursor', status_code=400)
+    if not all(_has_type(value, expected) for value, expected in zip(values, types)):
+        raise APIException('Invalid cursor', status_code=400)
+    return values
+
+
+def get_page_args():
+    """
+    Read the keyset pagination parameters from the query string.
+    Query Parameters:
+        - limit (int, optional): Page size. Pagination is only enabled when present.
+        - cursor (str, optional): Cursor returned as next_cursor by the previous page.
+    Raises:
+        APIException: If limit is not a positive integer or a cursor is sent without a limit.
+    Returns:
+        tuple: (limit, cursor). limit is None when pagination was not requested.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None:
+        if cursor:
+            raise APIException('cursor requires limit', status_code=400)
+        return None, None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise APIException('limit must be an integer', status_code=400)
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise APIException(
+            f'limit must be between 1 and {MAX_PAGE_LIMIT}', status_code=400)
+    return limit, cursor or None
+
+
+def _scan_page(q, sort_columns, row_filter, limit):
+    """
+    Fetch the first limit + 1 rows of q that pass row_filter.
+
+    Only the sort keys are read while walking q in order, SCAN_BATCH_SIZE at
+    a time. After MAX_SCANNED_ROWS keys the page is completed by the database
+    with row_filter.condition, starting after the last key looked at.
+    """
+    keys = q.with_entities(*(column.label(column.key) for column in sort_columns))
+    matched = []
+    last = None
+    scanned = 0
+    exhausted = False
+    while len(matched) <= limit and scanned < MAX_SCANNED_ROWS:
+        batch_q = keys if last is None else keys.filter(tuple_(*sort_columns) > tuple_(*last))
+        batch = batch_q.order_by(*sort_columns).limit(SCAN_BATCH_SIZE).all()
+        for row in batch:
+            if row_filter.contains(getattr(row, row_filter.column.key)):
+                matched.append(getattr(row, row_filter.column.key))
+            last = tuple(row)
+            if len(matched) > limit:
+                break
+        scanned += len(batch)
+        if len(batch) < SCAN_BATCH_SIZE:
+            exhausted = True
+            break
+    condition = row_filter.column.in_(matched) if matched else false()
+    if len(matched) <= limit and not exhausted:
+        condition = or_(condition, and_(
+            row_filter.condition, tuple_(*sort_columns) > tuple_(*last)))
+    return q.filter(condition).order_by(*sort_columns).limit(limit + 1).all()
+
+
+def paginate_query(q, sort_columns, row_filter=None):
+    """
+    Run a query, applying a keyset page when the client asked for one.
+
+    Rows are ordered by sort_columns, which must end with a unique column so
+    the order is total. The cursor holds the sort key of the last row already
+    sent and the next page starts strictly after it, so no OFFSET is needed.
+    Args:
+        q: The SQLAlchemy query to run.
+        sort_columns (list): Mapped columns defining a stable total order.
+        row_filter: Optional. Filter not applied to q yet, such as a
+            tag_index.TagMatch: its column (one of sort_columns) is tested
+            with contains() while walking a page, and its SQL condition is
+            applied otherwise.
+    Raises:
+        APIException: If the pagination parameters are invalid.
+    Returns:
+        tuple: (rows, page). page is an empty dict when pagination was not
+        requested, otherwise {'next_cursor': str or None} to merge into the
+        response; next_cursor is None on the last page.
+    """
+    limit, cursor = get_page_args()
+    if limit is None:
+        if row_filter is not None:
+            q = q.filter(row_filter.condition)
+        return q.all(), {}
+    if cursor:
+        values = decode_cursor(cursor, [_column_type(column) for column in sort_columns])
+        q = q.filter(tuple_(*sort_columns) > tuple_(*values))
+    if row_filter is None:
+        rows = q.order_by(*sort_columns).limit(limit + 1).all()
+    else:
+        rows = _scan_page(q, sort_columns, row_filter, limit)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [getattr(last, column.key) for column in sort_columns])
+    return rows, {'next_cursor': next_cursor}
+
+
+def paginate_ranked(rank):
+    """
+    Apply a keyset page to a ranking.
+    Args:
+        rank: Function called with after, the (score, id) key of the last
+            entry already sent or None, and limit, the number of entries
+            wanted or None for all. Returns the sorted (score, id) tuples
+            following after; lower scores come first.
+    Raises:
+        APIException: If the pagination parameters are invalid.
+    Returns:
+        tuple: (entries, page) with the same meaning as in paginate_query.
+    """
+    limit, cursor = get_page_args()
+    after = None
+    if cursor:
+        score, entity_id = decode_cursor(cursor, [float, str])
+        after = (float(score), entity_id)
+    if limit is None:
+        return rank(after, None), {}
+    ranked = rank(after, limit + 1)
+    next_cursor = encode_cursor(list(ranked[limit - 1])) if len(ranked) > limit else None
+    return ranked[:limit], {'next_cursor': next_cursor}
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Hash method and cost parameters of new hashes, as written at the start of
+# werkzeug hashes. Stored hashes with other parameters are upgraded at the
+# next successful login.
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+# Processes per server worker that hash and verify passwords; 0 hashes on
+# the request thread. Every gunicorn worker starts its own pool, so each
+# process added here is multiplied by the number of workers, in memory
+# (scrypt takes 32 MB per hash) as well as in CPU.
+PASSWORD_HASH_WORKERS = 1
+# Hashing tasks a server worker lets wait or run at once before refusing more.
+PASSWORD_HASH_QUEUE_LIMIT = 8
+
+
+class PasswordHashingBusy(Exception):
+    """Too many passwords are being hashed in this worker already."""
+
+
+def full_method(method):
+    """
+    The method as werkzeug writes it at the start of hashes, e.g.
+    'pbkdf2:sha256:1000000' for 'pbkdf2:sha256', with the cost parameters it
+    fills in by default. Costs one hash.
+    Raises:
+        ValueError: If werkzeug does not know the method.
+    """
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def _verify(stored_hash, password, method):
+    """Check password and, when it matches a hash made with other parameters, rehash it."""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if stored_hash.split('$', 1)[0] != method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded process pool.
+
+    Key stretching is deliberately CPU-heavy; on the pool it no longer holds
+    the server worker's interpreter, so its other threads keep serving. The
+    request waiting for a hash still blocks its own thread, which is why the
+    server runs threaded (gthread) workers: with sync workers nothing else
+    would be served meanwhile. The pool is started lazily in each server
+    worker, with spawned processes so no lock or connection of the worker is
+    inherited. When
+    PASSWORD_HASH_QUEUE_LIMIT tasks are pending, new ones are refused with
+    PasswordHashingBusy instead of queueing without bound.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 queue_limit=PASSWORD_HASH_QUEUE_LIMIT):
+        self.method = method
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.lock = threading.Lock()
+        self.pending = 0
+        self._pool = None
+        self._pid = None
+
+    def configure(self, method=None, workers=None, queue_limit=None):
+        """Override the defaults, e.g. from the app config; None keeps a setting."""
+        # Stored hashes are compared with the full method; a method given
+        # without its cost parameters would never match and rehash every login.
+        method = full_method(method) if method else None
+        with self.lock:
+            if method:
+                self.method = method
+            if workers is not None:
+                self.workers = int(workers)
+            if queue_limit is not None:
+                self.queue_limit = int(queue_limit)
+
+    def _submit(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        with self.lock:
+            if self.pending >= self.queue_limit:
+                raise PasswordHashingBusy()
+            self.pending += 1
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            pool = self._pool
+        try:
+            return pool.submit(function, *args).result()
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); start a new pool
+            # next time and do this one here.
+            with self.lock:
+                if self._pool is pool:
+                    self._pool = None
+            return function(*args)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def hash(self, password):
+        """
+        Hash a password with the current method.
+        Raises:
+            PasswordHashingBusy: If the queue is full.
+        Returns:
+            str: The werkzeug hash.
+        """
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        """
+        Check a password against its stored hash.
+        Raises:
+            PasswordHashingBusy: If the queue is full.
+        Returns:
+            tuple: (whether it matches, a new hash to store when the stored
+            one was made with other parameters, otherwise None).
+        """
+        return self._submit(_verify, stored_hash, password, self.method)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,126 @@
+import random
+from collections import defaultdict
+from sqlalchemy import bindparam, delete, event, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from api.models import db, Poi, Favorite, Visited, PoiPopularity
+from api.bulk import on_bulk_insert
+
+# Weight of a favorite and of a visit in a POI's popularity score.
+FAVORITE_WEIGHT = 2
+VISIT_WEIGHT = 1
+# Largest top-K pool popular POIs can be sampled from.
+MAX_SAMPLE_POOL = 200
+# Rows per executemany batch when creating popularity rows.
+POPULARITY_CHUNK_SIZE = 500
+
+
+def popularity_score(favorite_count, visited_count):
+    """Combine favorite and visit counts into a popularity score."""
+    return FAVORITE_WEIGHT * favorite_count + VISIT_WEIGHT * visited_count
+
+
+def create_popularity_rows(connection, poi_ids):
+    """
+    Insert zeroed popularity rows for newly created POIs.
+
+    Writes that bypass the ORM session (bulk imports, generators) must call
+    this for the POIs they insert; ORM inserts are handled by the flush hook.
+    Args:
+        connection: The SQLAlchemy connection of the current transaction.
+        poi_ids: Iterable of POI ids without a popularity row yet.
+    """
+    poi_ids = list(poi_ids)
+    table = PoiPopularity.__table__
+    for start in range(0, len(poi_ids), POPULARITY_CHUNK_SIZE):
+        connection.execute(insert(table), [
+            {'poi_id': poi_id, 'favorite_count': 0, 'visited_count': 0, 'score': 0}
+            for poi_id in poi_ids[start:start + POPULARITY_CHUNK_SIZE]])
+
+
+def rebuild_popularity(connection):
+    """
+    Recompute every popularity row from the favorite and visited tables.
+    Args:
+        connection: SQLAlchemy connection.
+    """
+    favorites = select(Favorite.poi_id, func.count().label('total')).group_by(
+        Favorite.poi_id).subquery()
+    visits = select(Visited.poi_id, func.count().label('total')).group_by(
+        Visited.poi_id).subquery()
+    favorite_count = func.coalesce(favorites.c.total, literal(0))
+    visited_count = func.coalesce(visits.c.total, literal(0))
+    rows = select(
+        Poi.id, favorite_count, visited_count,
+        popularity_score(favorite_count, visited_count)
+    ).outerjoin(favorites, favorites.c.poi_id == Poi.id).outerjoin(
+        visits, visits.c.poi_id == Poi.id)
+    table = PoiPopularity.__table__
+    connection.execute(delete(table))
+    connection.execute(insert(table).from_select(
+        ['poi_id', 'favorite_count', 'visited_count', 'score'], rows))
+
+
+def _apply_popularity_changes(connection, new_pois, deltas):
+    changes = [
+        {'target_id': poi_id, 'd_favorites': favorites, 'd_visits': visits,
+         'd_score': popularity_score(favorites, visits)}
+        for poi_id, (favorites, visits) in deltas.items() if favorites or visits
+    ]
+    create_popularity_rows(connection, new_pois)
+    if changes:
+        # Relative updates, so concurrent writers never overwrite each other's counts.
+        table = PoiPopularity.__table__
+        connection.execute(
+            update(table)
+            .where(table.c.poi_id == bindparam('target_id'))
+            .values(favorite_count=table.c.favorite_count + bindparam('d_favorites'),
+                    visited_count=table.c.visited_count + bindparam('d_visits'),
+                    score=table.c.score + bindparam('d_score')),
+            changes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_popularity(session, flush_context):
+    new_pois = [obj.id for obj in session.new if isinstance(obj, Poi)]
+    deltas = defaultdict(lambda: [0, 0])
+    for objects, step in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            if isinstance(obj, Favorite):
+                deltas[obj.poi_id][0] += step
+            elif isinstance(obj, Visited):
+                deltas[obj.poi_id][1] += step
+    if new_pois or deltas:
+        _apply_popularity_changes(session.connection(), new_pois, deltas)
+
+
+@on_bulk_insert
+def _bulk_popularity(session, model, rows):
+    if model is Poi:
+        create_popularity_rows(session.connection(), [row['id'] for row in rows])
+    elif model in (Favorite, Visited):
+        deltas = defaultdict(lambda: [0, 0])
+        slot = 0 if model is Favorite else 1
+        for row in rows:
+            deltas[row['poi_id']][slot] += 1
+        _apply_popularity_changes(session.connection(), [], deltas)
+
+
+def popular_poi_ids(limit, sample_from=None):
+    """
+    Ids of popular POIs, read from the score index.
+    Args:
+        limit (int): Number of ids to return.
+        sample_from (int, optional): When given, pick limit POIs at random among
+            the sample_from most popular, each weighted by its score plus one.
+    Returns:
+        list: POI ids, most popular first.
+    """
+    q = select(PoiPopularity.poi_id, PoiPopularity.score).order_by(
+        PoiPopularity.score.desc(), PoiPopularity.poi_id.desc())
+    if sample_from is None:
+        return [poi_id for poi_id, _ in db.session.execute(q.limit(limit))]
+    pool = db.session.execute(q.limit(sample_from)).all()
+    # Weighted sampling without replacement (Efraimidis-Spirakis).
+    keyed = sorted(pool, key=lambda row: random.random() ** (1.0 / (row.score + 1)), reverse=True)
+    chosen = sorted(keyed[:limit], key=lambda row: row.score, reverse=True)
+    return [row.poi_id for row in chosen]
@@ -0,0 +1,270 @@
+from collections import defaultdict
+from flask import request
+from sqlalchemy import func
+from api.models import db, User, Poi, Country, City, Favorite, Visited, PoiImage, Tag, PoiTag
+from api.utils import APIException
+from api.pagination import paginate_query
+
+# Ids sent per IN (...) clause when loading collection fields.
+COLLECTION_CHUNK_SIZE = 500
+
+
+def _date_to_iso(value):
+    return value.isoformat() if value else None
+
+
+def _load_collection(key_column, value_column, join=None):
+    """
+    Build a loader that fetches one collection field for many parents at once.
+    Args:
+        key_column: Column holding the parent id.
+        value_column: Column holding the value emitted in the list.
+        join: Optional. (target, onclause) joined to reach value_column.
+    Returns:
+        function: Loader taking a list of parent ids and returning {parent_id: [values]}.
+    """
+    def load(parent_ids):
+        grouped = defaultdict(list)
+        for start in range(0, len(parent_ids), COLLECTION_CHUNK_SIZE):
+            chunk = parent_ids[start:start + COLLECTION_CHUNK_SIZE]
+            q = db.session.query(key_column, value_column)
+            if join is not None:
+                q = q.join(*join)
+            for parent_id, value in q.filter(key_column.in_(chunk)):
+                grouped[parent_id].append(value)
+        return grouped
+    return load
+
+
+def _count_collection(key_column):
+    """
+    Build a loader that counts one collection for many parents with a grouped query.
+    Args:
+        key_column: Column holding the parent id.
+    Returns:
+        function: Loader taking a list of parent ids and returning {parent_id: count}.
+    """
+    def load(parent_ids):
+        counts = {}
+        for start in range(0, len(parent_ids), COLLECTION_CHUNK_SIZE):
+            chunk = parent_ids[start:start + COLLECTION_CHUNK_SIZE]
+            q = db.session.query(key_column, func.count()).filter(
+                key_column.in_(chunk)).group_by(key_column)
+            counts.update(q)
+        return counts
+    return load
+
+
+# Field name -> column for the scalar fields of each model's serialize() output.
+PROJECTED_COLUMNS = {
+    Poi: {
+        'id': Poi.id,
+        'name': Poi.name,
+        'description': Poi.description,
+        'latitude': Poi.latitude,
+        'longitude': Poi.longitude,
+        'city_id': Poi.city_id,
+    },
+    City: {
+        'id': City.id,
+        'name': City.name,
+        'season': City.season,
+        'country_id': City.country_id,
+    },
+    Country: {
+        'id': Country.id,
+        'name': Country.name,
+        'img': Country.img,
+    },
+    User: {
+        'id': User.id,
+        'name': User.name,
+        'user_name': User.user_name,
+        'email': User.email,
+        'birth_date': User.birth_date,
+        'location': User.location,
+        'img': User.img,
+    },
+}
+
+# Field name -> bulk loader for the list fields of each model's serialize() output.
+PROJECTED_COLLECTIONS = {
+    Poi: {
+        'images': _load_collection(PoiImage.poi_id, PoiImage.url),
+        'tags': _load_collection(PoiTag.poi_id, Tag.name, join=(Tag, Tag.id == PoiTag.tag_id)),
+    },
+    City: {
+        'pois': _load_collection(Poi.city_id, Poi.id),
+    },
+    Country: {
+        'cities': _load_collection(City.country_id, City.id),
+    },
+    User: {
+        'favorites': _load_collection(Favorite.user_id, Favorite.poi_id),
+        'visited': _load_collection(Visited.user_id, Visited.poi_id),
+    },
+}
+
+# Field name -> bulk loader for the sizes of those list fields, for clients
+# that need how many items a collection holds but not their ids.
+PROJECTED_COUNTS = {
+    Poi: {},
+    City: {
+        'poi_count': _count_collection(Poi.city_id),
+    },
+    Country: {
+        'city_count': _count_collection(City.country_id),
+    },
+    User: {
+        'favorite_count': _count_collection(Favorite.user_id),
+        'visited_count': _count_collection(Visited.user_id),
+    },
+}
+
+# Field name -> conversion applied to the raw column value.
+FIELD_CONVERTERS = {
+    User: {'birth_date': _date_to_iso},
+}
+
+
+def get_requested_fields(model):
+    """
+    Read the sparse fieldset requested through the `fields` query parameter.
+    Args:
+        model: The model whose serialize() fields may be requested.
+    Raises:
+        APIException: If an unknown field is requested.
+    Returns:
+        list: Requested field names, always starting with 'id', or None when
+        the parameter is absent and the full representation must be returned.
+    """
+    raw = request.args.get('fields')
+    if raw is None:
+        return None
+    fields = ['id']
+    for field in (part.strip() for part in raw.split(',')):
+        if field and field not in fields:
+            fields.append(field)
+    allowed = PROJECTED_COLUMNS[model].keys() | PROJECTED_COLLECTIONS[model].keys() | \
+        PROJECTED_COUNTS[model].keys()
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIException(
+            f"Unknown fields: {', '.join(unknown)}", status_code=400)
+    return fields
+
+
+def project_query(q, model, fields, sort_columns=()):
+    """
+    Restrict a model query to the columns needed for a sparse fieldset.
+
+    The query returns plain rows instead of ORM entities, so no identity map
+    entries are created and no relationship is ever lazily loaded.
+    Args:
+        q: The model query, with all filters and joins already applied.
+        model: The model being queried.
+        fields (list): Field names returned by get_requested_fields.
+        sort_columns: Optional. Columns that must also be selected, e.g. for pagination cursors.
+    Returns:
+        Query: The projected query.
+    """
+    columns = PROJECTED_COLUMNS[model]
+    selected = [columns[field].label(field) for field in fields if field in columns]
+    selected_keys = {field for field in fields if field in columns}
+    for column in sort_columns:
+        if column.key not in selected_keys:
+            selected.append(column.label(column.key))
+            selected_keys.add(column.key)
+    return q.with_entities(*selected)
+
+
+def serialize_projected(rows, model, fields):
+    """
+    Serialize rows returned by a projected query.
+
+    Collection and count fields are fetched with one query per field for
+    the whole page, not one per row.
+    Args:
+        rows (list): Rows returned by the query built with project_query.
+        model: The model being serialized.
+        fields (list): Field names returned by get_requested_fields.
+    Returns:
+        list: One dict per row containing only the requested fields.
+    """
+    converters = FIELD_CONVERTERS.get(model, {})
+    ids = [row.id for row in rows]
+    collections = {
+        field: PROJECTED_COLLECTIONS[model][field](ids)
+        for field in fields if field in PROJECTED_COLLECTIONS[model]
+    }
+    counts = {
+        field: PROJECTED_COUNTS[model][field](ids)
+        for field in fields if field in PROJECTED_COUNTS[model]
+    }
+    result = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field in collections:
+                item[field] = collections[field].get(row.id, [])
+            elif field in counts:
+                item[field] = counts[field].get(row.id, 0)
+            else:
+                value = getattr(row, field)
+                convert = converters.get(field)
+                item[field] = convert(value) if convert else value
+        result.append(item)
+    return result
+
+
+def serialize_query(q, model, sort_columns, options=(), row_filter=None):
+    """
+    Run a list query honouring the `fields` and pagination query parameters.
+    Args:
+        q: The model query, with all filters and joins already applied.
+        model: The model being listed.
+        sort_columns (list): Columns giving the keyset pagination order.
+        options: Optional. Loader options used when the full representation is returned.
+        row_filter: Optional. Filter applied by paginate_query, see there.
+    Raises:
+        APIException: If the fields or pagination parameters are invalid.
+    Returns:
+        tuple: (items, page) where items are serialized dicts and page is
+        merged into the response as described in paginate_query.
+    """
+    fields = get_requested_fields(model)
+    if fields is None:
+        rows, page = paginate_query(q.options(*options), sort_columns, row_filter)
+        return [row.serialize() for row in rows], page
+    rows, page = paginate_query(
+        project_query(q, model, fields, sort_columns), sort_columns, row_filter)
+    return serialize_projected(rows, model, fields), page
+
+
+def serialize_by_ids(model, ids, options=()):
+    """
+    Serialize the rows with the given ids, honouring the `fields` query parameter.
+    Args:
+        model: The model being serialized.
+        ids (list): Primary keys; the result keeps this order.
+        options: Optional. Loader options used when the full representation is returned.
+    Raises:
+        APIException: If the fields parameter is invalid.
+    Returns:
+        list: Serialized dicts, skipping ids that no longer exist.
+    """
+    fields = get_requested_fields(model)
+    by_id = {}
+    for start in range(0, len(ids), COLLECTION_CHUNK_SIZE):
+        chunk = ids[start:start + COLLECTION_CHUNK_SIZE]
+        q = model.query.filter(model.id.in_(chunk))
+        if fields is None:
+            for obj in q.options(*options):
+                by_id[obj.id] = obj
+        else:
+            for row in project_query(q, model, fields):
+                by_id[row.id] = row
+    rows = [by_id[row_id] for row_id in ids if row_id in by_id]
+    if fields is None:
+        return [row.serialize() for row in rows]
+    return serialize_projected(rows, model, fields)
@@ -0,0 +1,133 @@
+import heapq
+import math
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select, union
+from api.models import db, Favorite, Visited, PoiSimilarity
+from api.table_versions import bump_table_versions
+
+# Similar POIs stored per POI.
+SIMILAR_POIS_PER_POI = 20
+# Users with more interactions than this are left out of the co-occurrence
+# counts: they cost quadratic time and say little about any pair of POIs.
+MAX_USER_INTERACTIONS = 500
+# Rows per executemany batch when storing similarities, and ids per IN (...).
+SIMILARITY_CHUNK_SIZE = 1000
+
+
+def _interactions(connection):
+    """Map each POI and each user to the other side of their favorites and visits."""
+    users_by_poi = defaultdict(list)
+    pois_by_user = defaultdict(list)
+    rows = connection.execute(union(
+        select(Favorite.user_id, Favorite.poi_id), select(Visited.user_id, Visited.poi_id)))
+    for user_id, poi_id in rows:
+        pois_by_user[user_id].append(poi_id)
+    for user_id, poi_ids in list(pois_by_user.items()):
+        if len(poi_ids) > MAX_USER_INTERACTIONS:
+            del pois_by_user[user_id]
+            continue
+        for poi_id in poi_ids:
+            users_by_poi[poi_id].append(user_id)
+    return users_by_poi, pois_by_user
+
+
+def similar_pois(users_by_poi, pois_by_user, k=SIMILAR_POIS_PER_POI):
+    """
+    Compute the k most similar POIs of every POI.
+
+    Cosine similarity over binary user/POI interaction vectors: the number of
+    users who interacted with both POIs divided by the geometric mean of each
+    POI's users. The co-occurrence matrix is sparse, so it is produced one row
+    at a time by walking POI -> users -> POIs and never held in full.
+    Args:
+        users_by_poi (dict): POI id -> ids of users who favorited or visited it.
+        pois_by_user (dict): User id -> ids of the POIs they favorited or visited.
+        k (int): Similar POIs kept per POI.
+    Yields:
+        tuple: (poi_id, similar_poi_id, score), best first for each POI.
+    """
+    for poi_id, users in users_by_poi.items():
+        co_occurrences = defaultdict(int)
+        for user_id in users:
+            for other_id in pois_by_user[user_id]:
+                co_occurrences[other_id] += 1
+        co_occurrences.pop(poi_id, None)
+        norm = len(users)
+        scored = ((count / math.sqrt(norm * len(users_by_poi[other_id])), other_id)
+                  for other_id, count in co_occurrences.items())
+        for score, other_id in heapq.nlargest(k, scored):
+            yield poi_id, other_id, score
+
+
+def rebuild_similarities(connection):
+    """
+    Recompute the poi_similarity table from favorites and visits.
+
+    Runs in the caller's transaction, so readers keep seeing the previous
+    lists until it commits.
+    Args:
+        connection: SQLAlchemy connection.
+    Returns:
+        int: Number of rows written.
+    """
+    table = PoiSimilarity.__table__
+    connection.execute(delete(table))
+    batch = []
+    written = 0
+    for poi_id, similar_poi_id, score in similar_pois(*_interactions(connection)):
+        batch.append({'poi_id': poi_id, 'similar_poi_id': similar_poi_id, 'score': score})
+        if len(batch) >= SIMILARITY_CHUNK_SIZE:
+            connection.execute(insert(table), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        connection.execute(insert(table), batch)
+        written += len(batch)
+    bump_table_versions(connection, ['poi_similarity'])
+    return written
+
+
+def similar_to(poi_id, limit):
+    """
+    Read the stored similar POIs of a POI.
+    Args:
+        poi_id (str): POI id.
+        limit (int): Number of POIs to return.
+    Returns:
+        list: (similar_poi_id, score) tuples, most similar first.
+    """
+    rows = db.session.execute(
+        select(PoiSimilarity.similar_poi_id, PoiSimilarity.score)
+        .where(PoiSimilarity.poi_id == poi_id)
+        .order_by(PoiSimilarity.score.desc(), PoiSimilarity.similar_poi_id)
+        .limit(limit))
+    return [tuple(row) for row in rows]
+
+
+def recommend_for(seen_poi_ids, limit):
+    """
+    Rank POIs for a user by adding up the stored similarities to the POIs they know.
+    Args:
+        seen_poi_ids (set): POIs the user favorited or visited; never recommended.
+        limit (int): Number of POIs to return.
+    Returns:
+        list: (poi_id, score) tuples, best first.
+    """
+    seen = list(seen_poi_ids)
+    scores = defaultdict(float)
+    for start in range(0, len(seen), SIMILARITY_CHUNK_SIZE):
+        rows = db.session.execute(
+            select(PoiSimilarity.similar_poi_id, func.sum(PoiSimilarity.score))
+            .where(PoiSimilarity.poi_id.in_(seen[start:start + SIMILARITY_CHUNK_SIZE]))
+            .group_by(PoiSimilarity.similar_poi_id))
+        for poi_id, score in rows:
+            if poi_id not in seen_poi_ids:
+                scores[poi_id] += score
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def seen_pois(user_id):
+    """Ids of the POIs a user favorited or visited."""
+    return set(db.session.execute(union(
+        select(Favorite.poi_id).where(Favorite.user_id == user_id),
+        select(Visited.poi_id).where(Visited.user_id == user_id))).scalars())
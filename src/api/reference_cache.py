@@ -0,0 +1,123 @@
+import threading
+from collections import namedtuple
+from flask import request, has_request_context
+from api.models import db, Country, City, Tag
+from api.table_versions import get_table_versions
+
+# Tables mirrored by the cache; a change to any of their versions reloads it.
+REFERENCE_TABLES = ('country', 'city', 'tag')
+# Set on the WSGI environ once the versions were checked for the request.
+CHECKED_ENVIRON_KEY = 'api.reference_cache.checked'
+
+CountryRef = namedtuple('CountryRef', ['id', 'name', 'img'])
+CityRef = namedtuple('CityRef', ['id', 'name', 'season', 'country_id'])
+TagRef = namedtuple('TagRef', ['id', 'name'])
+
+
+class _Snapshot:
+    """Immutable copy of the reference tables with their lookup indexes."""
+
+    def __init__(self, versions, countries, cities, tags):
+        self.versions = versions
+        self.countries_by_id = {country.id: country for country in countries}
+        self.countries_by_name = {country.name: country for country in countries}
+        self.cities_by_id = {city.id: city for city in cities}
+        self.cities_by_key = {(city.name, city.country_id): city for city in cities}
+        self.cities_by_country = {}
+        for city in cities:
+            self.cities_by_country.setdefault(city.country_id, []).append(city)
+        self.tags_by_id = {tag.id: tag for tag in tags}
+        self.tags_by_name = {tag.name: tag for tag in tags}
+
+
+class ReferenceCache:
+    """Per-worker cache of the country, city and tag tables.
+
+    Lookups return read-only named tuples, never ORM instances. The table
+    versions are checked at most once per request, so writes committed by
+    other workers are picked up on the next request; writes made through
+    this worker's routes also call invalidate() right after committing.
+    """
+
+    def __init__(self):
+        self._snapshot_data = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.invalidations = 0
+
+    def _load(self, versions):
+        countries = [CountryRef(*row) for row in db.session.query(
+            Country.id, Country.name, Country.img)]
+        cities = [CityRef(*row) for row in db.session.query(
+            City.id, City.name, City.season, City.country_id)]
+        tags = [TagRef(*row) for row in db.session.query(Tag.id, Tag.name)]
+        self.reloads += 1
+        return _Snapshot(versions, countries, cities, tags)
+
+    def _snapshot(self):
+        snapshot = self._snapshot_data
+        checked = has_request_context() and request.environ.get(CHECKED_ENVIRON_KEY, False)
+        if snapshot is not None and checked:
+            self.hits += 1
+            return snapshot
+        versions = get_table_versions(REFERENCE_TABLES)
+        if snapshot is not None and snapshot.versions == versions:
+            self.hits += 1
+        else:
+            self.misses += 1
+            with self._lock:
+                snapshot = self._snapshot_data
+                if snapshot is None or snapshot.versions != versions:
+                    snapshot = self._load(versions)
+                    self._snapshot_data = snapshot
+        if has_request_context():
+            request.environ[CHECKED_ENVIRON_KEY] = True
+        return snapshot
+
+    def invalidate(self):
+        """Drop the cached tables; the next lookup reloads them."""
+        self._snapshot_data = None
+        self.invalidations += 1
+
+    def country_by_id(self, country_id):
+        return self._snapshot().countries_by_id.get(country_id)
+
+    def country_by_name(self, name):
+        return self._snapshot().countries_by_name.get(name)
+
+    def city_by_id(self, city_id):
+        return self._snapshot().cities_by_id.get(city_id)
+
+    def city_by_name(self, name, country_id):
+        return self._snapshot().cities_by_key.get((name, country_id))
+
+    def cities_of_country(self, country_id):
+        return list(self._snapshot().cities_by_country.get(country_id, ()))
+
+    def tag_by_id(self, tag_id):
+        return self._snapshot().tags_by_id.get(tag_id)
+
+    def tag_by_name(self, name):
+        return self._snapshot().tags_by_name.get(name)
+
+    def stats(self):
+        """
+        Report the cache counters of this worker.
+        Returns:
+            dict: hits, misses, reloads, invalidations and cached row counts.
+        """
+        snapshot = self._snapshot_data
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'invalidations': self.invalidations,
+            'countries': len(snapshot.countries_by_id) if snapshot else 0,
+            'cities': len(snapshot.cities_by_id) if snapshot else 0,
+            'tags': len(snapshot.tags_by_id) if snapshot else 0,
+        }
+
+
+reference_cache = ReferenceCache()
@@ -1,11 +1,30 @@
-from flask import Flask, request, jsonify, url_for, Blueprint, current_app
+from flask import Flask, request, jsonify, url_for, Blueprint, current_app, stream_with_context
 from api.models import db, User, Poi, Country, City, Favorite, Visited, PoiImage, Tag, PoiTag
 from api.utils import generate_sitemap, APIException
+from api.pagination import paginate_query, paginate_ranked
+from api.projection import PROJECTED_COLLECTIONS, serialize_query, serialize_by_ids
+from api.table_versions import conditional_get, get_table_versions
+from api.reference_cache import reference_cache
+from api.geo import encode_geohash, geo_predicate, haversine_km, radius_boxes, split_box
+from api.search import match_condition, ranked_matches
+from api.autocomplete import autocomplete_index, MAX_AUTOCOMPLETE_RESULTS
+from api.popularity import popular_poi_ids, MAX_SAMPLE_POOL
+from api.tag_index import tag_filter, TAG_MODES
+from api.facets import count_facets, facet_cache
+from api.bulk import bulk_insert
+from api.export import export_batches, csv_chunks, ndjson_chunks, EXPORT_FORMATS
+from api.recommendations import recommend_for, seen_pois, similar_to, SIMILAR_POIS_PER_POI
+from api.sql_stats import expect_repeated_statements
+from api.db_pool import is_database_busy, DATABASE_BUSY_MESSAGE
+from api.passwords import password_hasher, PasswordHashingBusy
+from api.user_cache import user_cache
 from flask_cors import CORS
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy import or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
+import math
+import sys
 import uuid
 
 api = Blueprint('api', __name__)
@@ -15,6 +34,28 @@ PROFILE_ALLOWED_FIELDS = {'user_name', 'email', 'location', 'password'}
 COUNTRY_ALLOWED_FIELDS = {'name', 'img'}
 CITY_ALLOWED_FIELDS = {'name', 'img', 'season', 'country_id'}
 POI_ALLOWED_FIELDS = {'name', 'description', 'latitude', 'longitude', 'city_id'}
+# Tables each cached GET response depends on, see conditional_get.
+USER_TABLES = ('user', 'favorite', 'visited')
+POI_TABLES = ('poi', 'poi_image', 'poi_tag', 'tag')
+POI_LIST_TABLES = POI_TABLES + ('city', 'country')
+# Role a user needs for the operational endpoints (cache and index stats).
+ADMIN_ROLE = 'admin'
+# Largest radius accepted by the `near` POI filter.
+MAX_RADIUS_KM = 500
+# A page of nearest POIs is first looked for within this fraction of the
+# radius past the cursor; the ring doubles until the page is filled.
+NEAREST_FIRST_RING = 1 / 16
+# Upper bound of ids sent in a single IN (...) clause, safe for SQLite and Postgres.
+IN_CLAUSE_CHUNK_SIZE = 500
+# Largest number of POIs returned by /popular-pois.
+MAX_POPULAR_POIS = 50
+# Largest number of POIs returned by /recommendations.
+MAX_RECOMMENDATIONS = 50
+# Largest number of tags in the `tags` POI filter.
+MAX_FILTER_TAGS = 20
+PASSWORD_HASHING_BUSY_MESSAGE = 'Too many password checks in progress, please retry shortly'
+# Query parameters that do not change the facet counts.
+FACET_IGNORED_ARGS = {'limit', 'cursor', 'fields'}
 
 
 def handle_unexpected_error(context: str):
@@ -23,13 +64,33 @@ def handle_unexpected_error(context: str):
     Args:
         context (str): Description of the operation where the error occurred.
     Raises:
-        APIException: A generic error message with a 500 status code.
+        APIException: A 503 when the database is overloaded (pool exhausted or
+            statement timeout), otherwise a generic error message with a 500 status code.
     """
+    if is_database_busy(sys.exc_info()[1]):
+        current_app.logger.warning(f'Database busy while {context}: {sys.exc_info()[1]}')
+        raise APIException(DATABASE_BUSY_MESSAGE, status_code=503)
     current_app.logger.exception(context)
     raise APIException(
         f"An unexpected error occurred while {context}", status_code=500)
 
 
+def hash_password(password):
+    """
+    Hash a password on the password hashing pool.
+    Args:
+        password (str): The plain-text password.
+    Raises:
+        APIException: 503 if too many passwords are being hashed already.
+    Returns:
+        str: The hash to store.
+    """
+    try:
+        return password_hasher.hash(password)
+    except PasswordHashingBusy:
+        raise APIException(PASSWORD_HASHING_BUSY_MESSAGE, status_code=503)
+
+
 def require_json_object(body, context: str):
     """
     Ensure the request body is a JSON object (dict).
@@ -56,13 +117,43 @@ def get_authenticated_user():
         User: The authenticated user object.
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = db.session.get(User, current_user_id)
     if not user:
         raise APIException('Authentication failed', status_code=404)
     return user
 
 
-def get_object_or_404(model, unique_field_value, not_found_message, field_name="id"):
+def get_authenticated_admin():
+    """
+    Retrieve the authenticated user from the JWT token, who must be an admin.
+    Raises:
+        APIException: If authentication fails, or 403 if the user does not have ADMIN_ROLE.
+    Returns:
+        User: The authenticated admin.
+    """
+    user = get_authenticated_user()
+    if user.role != ADMIN_ROLE:
+        raise APIException('Admin role required', status_code=403)
+    return user
+
+
+def get_authenticated_user_id():
+    """
+    Retrieve the id of the authenticated user from the JWT token, for routes
+    that do not need the user row. The user's existence is checked through
+    the per-worker user cache, so it usually costs no query.
+    Raises:
+        APIException: If the user does not exist.
+    Returns:
+        str: The id of the authenticated user.
+    """
+    current_user_id = get_jwt_identity()
+    if not user_cache.exists(current_user_id):
+        raise APIException('Authentication failed', status_code=404)
+    return current_user_id
+
+
+def get_object_or_404(model, unique_field_value, not_found_message, field_name="id", options=()):
     """
     Retrieve an object by a unique field from the database.
     Args:
@@ -70,18 +161,265 @@ def get_object_or_404(model, unique_field_value, not_found_message, field_name="
         unique_field_value: The value of the unique field to retrieve.
         not_found_message: The error message to return if the object is not found.
         field_name: The name of the unique field (default is 'id').
+        options: Optional. Loader options applied to the query (e.g. eager loads).
     Raises:
         APIException: If the object does not exist.
     Returns:
         db.Model: The retrieved object.
     """
-    obj = model.query.filter(getattr(model, field_name)
-                             == unique_field_value).first()
+    obj = model.query.options(*options).filter(getattr(model, field_name)
+                                               == unique_field_value).first()
     if not obj:
         raise APIException(not_found_message, status_code=404)
     return obj
 
 
+def parse_number_list(raw, count, param, format_hint):
+    """
+    Parse a comma-separated list of finite numbers from a query parameter.
+    Args:
+        raw (str): The raw parameter value.
+        count (int): Number of values expected.
+        param (str): Name of the parameter, for error messages.
+        format_hint (str): Expected format, for error messages.
+    Raises:
+        APIException: If the value is malformed.
+    Returns:
+        list: The parsed floats.
+    """
+    try:
+        values = [float(value) for value in raw.split(',')]
+    except ValueError:
+        values = []
+    if len(values) != count or not all(math.isfinite(value) for value in values):
+        raise APIException(f'{param} must be {format_hint}', status_code=400)
+    return values
+
+
+def parse_int_arg(name, default, minimum, maximum):
+    """
+    Read an optional integer query parameter within bounds.
+    Args:
+        name (str): Query parameter name.
+        default: Value returned when the parameter is absent.
+        minimum (int): Smallest accepted value.
+        maximum (int): Largest accepted value.
+    Raises:
+        APIException: If the value is not an integer or is out of bounds.
+    Returns:
+        int: The parsed value, or default.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException(f'{name} must be an integer', status_code=400)
+    if value < minimum or value > maximum:
+        raise APIException(
+            f'{name} must be between {minimum} and {maximum}', status_code=400)
+    return value
+
+
+def parse_name_list(raw, param, max_items):
+    """
+    Split a comma-separated list of names from the query string.
+    Args:
+        raw (str): The raw parameter value.
+        param (str): Parameter name, used in error messages.
+        max_items (int): Largest number of names accepted.
+    Raises:
+        APIException: If more than max_items names are given.
+    Returns:
+        list: Distinct non-empty names, in the order given.
+    """
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    if len(names) > max_items:
+        raise APIException(f'{param} accepts at most {max_items} names', status_code=400)
+    return names
+
+
+def require_coordinate(latitude, longitude, param):
+    """
+    Ensure a coordinate lies within the valid latitude/longitude ranges.
+    Args:
+        latitude (float): Latitude in degrees.
+        longitude (float): Longitude in degrees.
+        param (str): Name of the parameter, for error messages.
+    Raises:
+        APIException: If the coordinate is out of range.
+    """
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise APIException(
+            f'{param} latitude must be within [-90, 90] and longitude within [-180, 180]', status_code=400)
+
+
+def rank_nearest_pois(q, latitude, longitude, radius_km, after=None, limit=None):
+    """
+    Measure the candidate POIs of a query and keep those within radius_km of a point.
+
+    With a limit, only the POIs inside a ring around the centre are fetched,
+    widened until it holds limit POIs past after; every POI outside the ring
+    is farther than those, so they are the next ones.
+    Args:
+        q: The POI query, already restricted to the bounding boxes of the circle.
+        latitude (float): Latitude of the centre.
+        longitude (float): Longitude of the centre.
+        radius_km (float): Search radius in kilometres.
+        after (tuple): Optional. (distance_km, poi_id) of the last POI already returned.
+        limit (int): Optional. Most POIs returned.
+    Returns:
+        list: Sorted (distance_km, poi_id) tuples, nearest first.
+    """
+    start = after[0] if after is not None else 0.0
+    step = radius_km * NEAREST_FIRST_RING
+    while True:
+        ring = radius_km if limit is None else min(start + step, radius_km)
+        candidates = q if ring >= radius_km else q.filter(geo_predicate(
+            Poi.geohash, Poi.latitude, Poi.longitude, radius_boxes(latitude, longitude, ring)))
+        ranked = []
+        for poi_id, poi_latitude, poi_longitude in candidates.with_entities(
+                Poi.id, Poi.latitude, Poi.longitude):
+            entry = (haversine_km(latitude, longitude, poi_latitude, poi_longitude), poi_id)
+            if entry[0] <= ring and (after is None or entry > after):
+                ranked.append(entry)
+        if ring >= radius_km or len(ranked) >= limit:
+            ranked.sort()
+            return ranked[:limit]
+        step *= 2
+
+
+def serialize_nearest_pois(q, latitude, longitude, radius_km):
+    """
+    Serialize the POIs of a query lying within radius_km of a point, nearest first.
+
+    The query must already be restricted to the bounding box of the circle;
+    a page only fetches the candidates of the ring it needs, see
+    rank_nearest_pois, and measures them by exact haversine distance.
+    Pagination uses (distance, id) as the keyset.
+    Args:
+        q: The POI query, with all filters already applied.
+        latitude (float): Latitude of the centre.
+        longitude (float): Longitude of the centre.
+        radius_km (float): Search radius in kilometres.
+    Raises:
+        APIException: If the pagination or fields parameters are invalid.
+    Returns:
+        tuple: (items, page) as returned by serialize_query, each item with a distance_km key.
+    """
+    ranked, page = paginate_ranked(
+        lambda after, limit: rank_nearest_pois(q, latitude, longitude, radius_km, after, limit))
+
+    distances = {poi_id: distance for distance, poi_id in ranked}
+    items = serialize_by_ids(Poi, [poi_id for _, poi_id in ranked],
+                             options=Poi.serialize_options())
+    for item in items:
+        item['distance_km'] = round(distances[item['id']], 3)
+    return items, page
+
+
+def serialize_search_results(q, model, text, options=()):
+    """
+    Serialize the rows of a query matching a full-text query, most relevant first.
+    Args:
+        q: The model query, with all other filters already applied.
+        model: Poi, City or Country.
+        text (str): The user query.
+        options: Optional. Loader options used when the full representation is returned.
+    Raises:
+        APIException: If the pagination or fields parameters are invalid.
+    Returns:
+        tuple: (items, page) as returned by serialize_query.
+    """
+    ranked, page = paginate_ranked(
+        lambda after, limit: ranked_matches(q, model, text, after, limit))
+    return serialize_by_ids(model, [entity_id for _, entity_id in ranked], options=options), page
+
+
+def load_pois_for_serialization(poi_ids):
+    """
+    Load POIs by id with the relationships used by Poi.serialize() eagerly fetched.
+    Args:
+        poi_ids: Iterable of POI ids. The returned list keeps this order.
+    Returns:
+        list: The POIs found, in the order of the given ids.
+    """
+    poi_ids = list(poi_ids)
+    by_id = {}
+    for start in range(0, len(poi_ids), IN_CLAUSE_CHUNK_SIZE):
+        chunk = poi_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+        for poi in Poi.query.options(*Poi.serialize_options()).filter(Poi.id.in_(chunk)):
+            by_id[poi.id] = poi
+    return [by_id[poi_id] for poi_id in poi_ids if poi_id in by_id]
+
+
+def existing_values(values, *columns):
+    """
+    Find which of the given values are already stored.
+    Args:
+        values (list): Values of the column, or tuples when several columns are given.
+        *columns: The columns the values are compared with.
+    Returns:
+        set: The values found, one query per IN_CLAUSE_CHUNK_SIZE values.
+    """
+    target = columns[0] if len(columns) == 1 else tuple_(*columns)
+    found = set()
+    for start in range(0, len(values), IN_CLAUSE_CHUNK_SIZE):
+        rows = db.session.execute(
+            select(*columns).where(target.in_(values[start:start + IN_CLAUSE_CHUNK_SIZE])))
+        found.update(rows.scalars() if len(columns) == 1 else (tuple(row) for row in rows))
+    return found
+
+
+def first_skipped(rows, written):
+    """
+    Return the first row bulk_insert skipped because of a conflict.
+    Args:
+        rows (list): The rows passed to bulk_insert.
+        written (list): The rows it returned.
+    Returns:
+        dict: The row, or None when every row was written.
+    """
+    kept = {id(row) for row in written}
+    return next((row for row in rows if id(row) not in kept), None)
+
+
+def validate_items(items, validate_one, batch_check):
+    """
+    Validate the items of a batch create request, checking the database once for the whole batch.
+
+    Items are validated in order until one fails. validate_one calls check
+    with each value an item-by-item implementation would look up in the
+    table, at the point it would do so. Those values are then looked up in
+    one go, and only after that is the failed item's error raised, so a
+    batch fails on the same error, in item order, as one query per item.
+    Args:
+        items (list): The request items.
+        validate_one: Function (item, check) building the result of one item;
+            raises APIException when the item is invalid.
+        batch_check: Function given the values passed to check, in order;
+            raises APIException for the first one conflicting with stored rows.
+    Raises:
+        APIException: The first error, in item order.
+    Returns:
+        list: The result of validate_one for each item.
+    """
+    results = []
+    checked = []
+    pending_error = None
+    for item in items:
+        try:
+            results.append(validate_one(item, checked.append))
+        except APIException as error:
+            pending_error = error
+            break
+    batch_check(checked)
+    if pending_error is not None:
+        raise pending_error
+    return results
+
+
 def require_body_fields(body, fields, item_name=None, optional_fields=None):
     """
     Ensure that the request body contains exactly the required fields and that they are not empty.
@@ -167,7 +505,6 @@ def register():
     name = body.get('name')
     user_name = body.get('user_name')
     email = body.get('email')
-    password = generate_password_hash(body.get('password'))
     try:
         birth_date = datetime.strptime(body.get('birth_date'), "%m/%d/%Y")
     except Exception:
@@ -182,6 +519,7 @@ def register():
     existing_user = User.query.filter_by(user_name=user_name).first()
     if existing_user:
         raise APIException('Username already in use', status_code=400)
+    password = hash_password(body.get('password'))
 
     try:
         user_id = str(uuid.uuid4())
@@ -205,14 +543,18 @@ def register():
 def login():
     """
     Log in a user.
+
+    The user is looked up by email or user_name in one query, an email match
+    winning. A password hash made with outdated parameters is replaced by a
+    current one.
     Args:
         None.
     Body:
-        - user_name (str, optional): Username of the user.
-        - email (str, optional): Email address of the user.
+        - credential (str): Email address or username of the user.
         - password (str): Password for the user account.
     Raises:
-        APIException: If credentials are missing or invalid.
+        APIException: If credentials are missing or invalid, or 503 if too
+            many passwords are being checked already.
     Returns:
         Response: JSON with an access token and a success message.
     """
@@ -224,12 +566,25 @@ def login():
     if not credential or not password:
         raise APIException(
             'Email or user_name and password are required', status_code=400)
-    user = User.query.filter_by(email=credential).first(
-    ) or User.query.filter_by(user_name=credential).first()
+    users = User.query.filter(
+        or_(User.email == credential, User.user_name == credential)).limit(2).all()
+    user = next((u for u in users if u.email == credential), users[0] if users else None)
     if not user:
         raise APIException('Invalid email or user_name', status_code=401)
-    if not check_password_hash(user.password, password):
+    try:
+        matches, upgraded_hash = password_hasher.verify(user.password, password)
+    except PasswordHashingBusy:
+        raise APIException(PASSWORD_HASHING_BUSY_MESSAGE, status_code=503)
+    if not matches:
         raise APIException('Invalid password', status_code=401)
+    if upgraded_hash:
+        try:
+            user.password = upgraded_hash
+            db.session.commit()
+        except Exception:
+            # The old hash still works; try again at the next login.
+            db.session.rollback()
+            current_app.logger.exception('upgrading a password hash')
 
     access_token = create_access_token(identity=user.id)
     return jsonify({'message': 'Login successful', 'access_token': access_token}), 200
@@ -237,6 +592,7 @@ def login():
 
 @api.route('/myProfile', methods=['GET'])
 @jwt_required()
+@conditional_get(*USER_TABLES, per_user=True)
 def my_profile():
     """
     Retrieve the authenticated user's profile.
@@ -293,7 +649,7 @@ def update_profile():
             raise APIException('Username already in use', status_code=400)
         user.user_name = user_name
     if password and len(password) > 0:
-        user.password = generate_password_hash(password)
+        user.password = hash_password(password)
     if location and len(location) > 0:
         user.location = location
 
@@ -306,21 +662,25 @@ def update_profile():
 
 
 @api.route('/users', methods=['GET'])
+@conditional_get(*USER_TABLES)
 def list_users():
     """
     List users.
     Args:
         None.
-    Body:
-        None.
+    Query Parameters:
+        - limit (int, optional): Page size; enables keyset pagination ordered by id.
+        - cursor (str, optional): next_cursor returned by the previous page.
+        - fields (str, optional): Comma-separated user fields to return; id is always included.
+          favorite_count and visited_count return the list sizes instead of the poi ids.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the query parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of users and a success message. Returns an empty list if none are found.
     """
     try:
-        users = User.query.all()
-        return jsonify({'message': 'Users retrieved successfully', 'users': [user.serialize() for user in users]}), 200
+        users, page = serialize_query(User.query, User, [User.id], options=User.serialize_options())
+        return jsonify({'message': 'Users retrieved successfully', 'users': users, **page}), 200
     except APIException:
         raise
     except Exception:
@@ -357,7 +717,6 @@ def add_user():
     name = body.get('name')
     user_name = body.get('user_name')
     email = body.get('email')
-    password = generate_password_hash(body.get('password'))
     try:
         birth_date = datetime.strptime(body.get('birth_date'), "%m/%d/%Y")
     except Exception:
@@ -372,6 +731,7 @@ def add_user():
     existing_user = User.query.filter_by(user_name=user_name).first()
     if existing_user:
         raise APIException('Username already in use', status_code=400)
+    password = hash_password(body.get('password'))
 
     try:
         user_id = str(uuid.uuid4())
@@ -419,6 +779,7 @@ def delete_user(username):
 
 @api.route('/favorites', methods=['GET'])
 @jwt_required()
+@conditional_get('favorite', 'poi', per_user=True)
 def favorites():
     """
     Retrieve the authenticated user's favorite POIs.
@@ -431,10 +792,10 @@ def favorites():
     Returns:
         Response: JSON list of pairs [poi_id, poi_name]. Returns an empty list if none are found.
     """
-    user = get_authenticated_user()
+    user_id = get_authenticated_user_id()
     try:
         favorites = db.session.query(Favorite, Poi).join(
-            Poi, Favorite.poi_id == Poi.id).filter(Favorite.user_id == user.id).all()
+            Poi, Favorite.poi_id == Poi.id).filter(Favorite.user_id == user_id).all()
         favorites_list = [
             {
                 'poi_id': poi.id,
@@ -464,7 +825,7 @@ def add_favorite():
     Returns:
         Response: JSON with added favorite or error message.
     """
-    user = get_authenticated_user()
+    user_id = get_authenticated_user_id()
     body = request.get_json()
     body = require_json_object(body, context='adding favorite')
     poi_id = body.get('poi_id')
@@ -477,13 +838,13 @@ def add_favorite():
     )
 
     existing_favorite = Favorite.query.filter_by(
-        user_id=user.id, poi_id=poi.id).first()
+        user_id=user_id, poi_id=poi.id).first()
     if existing_favorite:
         raise APIException(
             'Point of interest is already in favorites', status_code=400)
 
     try:
-        favorite = Favorite(user=user, poi=poi)
+        favorite = Favorite(user_id=user_id, poi=poi)
         db.session.add(favorite)
         db.session.commit()
         return jsonify({'message': 'Favorite added successfully', 'favorite': favorite.serialize()}), 201
@@ -511,8 +872,8 @@ def remove_favorite(poi_id):
     Returns:
         Response: JSON with success or error message.
     """
-    user = get_authenticated_user()
-    favorite = Favorite.query.filter_by(user_id=user.id, poi_id=poi_id).first()
+    user_id = get_authenticated_user_id()
+    favorite = Favorite.query.filter_by(user_id=user_id, poi_id=poi_id).first()
     if not favorite:
         raise APIException('Favorite not found', status_code=404)
     try:
@@ -524,7 +885,91 @@ def remove_favorite(poi_id):
         handle_unexpected_error('removing favorite')
 
 
+def filter_pois(page_tags=False):
+    """
+    Build the POI query described by the filter parameters shared by the POI list endpoints.
+
+    See get_pois for the parameters. The near filter is only applied as its
+    bounding boxes; callers measure exact distances with rank_nearest_pois.
+    Args:
+        page_tags (bool): Optional. Leave a tag filter matching more than
+            MAX_BITMAP_IDS POIs off the query, for paginate_query to apply.
+            Only done without q and near, whose rankings need the full filter.
+    Raises:
+        APIException: If a filter parameter is invalid.
+    Returns:
+        tuple: (query, text, near, tag_match) where text is the full-text query
+        or None, near is (latitude, longitude, radius_km) or None and tag_match
+        is the TagMatch left off the query or None.
+    """
+    q = Poi.query
+    tag_match = None
+
+    name = request.args.get('name')
+    if name:
+        q = q.filter(Poi.name.ilike(f'%{name}%'))
+
+    country_name = request.args.get('country_name')
+    city_name = request.args.get('city_name')
+    if country_name or city_name:
+        q = q.join(City, Poi.city_id == City.id).join(
+            Country, City.country_id == Country.id)
+        if country_name:
+            q = q.filter(Country.name == country_name)
+        if city_name:
+            q = q.filter(City.name == city_name)
+
+    tag_names = parse_name_list(request.args.get('tags', ''), 'tags', MAX_FILTER_TAGS)
+    tag_name = request.args.get('tag_name')
+    if tag_name and tag_name not in tag_names:
+        tag_names.append(tag_name)
+    if tag_names:
+        tag_mode = request.args.get('tag_mode', 'all')
+        if tag_mode not in TAG_MODES:
+            raise APIException('tag_mode must be all or any', status_code=400)
+        tags = [reference_cache.tag_by_name(name) for name in tag_names]
+        if tag_mode == 'all' and None in tags:
+            tag_ids = []
+        else:
+            tag_ids = [tag.id for tag in tags if tag is not None]
+        condition, tag_match = tag_filter(tag_ids, tag_mode)
+        if not page_tags or request.args.get('q') or request.args.get('near'):
+            tag_match = None
+        if tag_match is None:
+            q = q.filter(condition)
+
+    bbox = request.args.get('bbox')
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = parse_number_list(
+            bbox, 4, 'bbox', 'min_lon,min_lat,max_lon,max_lat')
+        require_coordinate(min_lat, min_lon, 'bbox')
+        require_coordinate(max_lat, max_lon, 'bbox')
+        if min_lat > max_lat:
+            raise APIException('bbox min_lat must not exceed max_lat', status_code=400)
+        q = q.filter(geo_predicate(Poi.geohash, Poi.latitude, Poi.longitude,
+                                   split_box(min_lat, min_lon, max_lat, max_lon)))
+
+    text = request.args.get('q') or None
+    near = request.args.get('near')
+    if text and near:
+        raise APIException('q cannot be combined with near', status_code=400)
+    if not near:
+        return q, text, None, tag_match
+
+    latitude, longitude = parse_number_list(near, 2, 'near', 'lat,lon')
+    require_coordinate(latitude, longitude, 'near')
+    radius_km = parse_number_list(
+        request.args.get('radius_km', ''), 1, 'radius_km', 'a number')[0]
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise APIException(
+            f'radius_km must be greater than 0 and at most {MAX_RADIUS_KM}', status_code=400)
+    q = q.filter(geo_predicate(Poi.geohash, Poi.latitude, Poi.longitude,
+                               radius_boxes(latitude, longitude, radius_km)))
+    return q, text, (latitude, longitude, radius_km), tag_match
+
+
 @api.route('/pois', methods=['GET'])
+@conditional_get(*POI_LIST_TABLES)
 def get_pois():
     """
     Retrieve POIs with optional filters via query string.
@@ -532,46 +977,190 @@ def get_pois():
         None.
     Query Parameters:
         - name (str, optional): Partial match on POI name.
-        - tag_name (str, optional): Exact match on tag name.
+        - q (str, optional): Full-text search over name, description, city and country names.
+          Results are sorted by relevance. Cannot be combined with near.
+        - tags (str, optional): Comma-separated tag names, combined according to tag_mode.
+        - tag_mode (str, optional): 'all' (default) keeps POIs carrying every tag, 'any' at least one.
+        - tag_name (str, optional): Exact match on a single tag name; added to tags.
         - country_name (str, optional): Exact match on country name.
         - city_name (str, optional): Exact match on city name.
+        - bbox (str, optional): min_lon,min_lat,max_lon,max_lat box; min_lon > max_lon crosses the antimeridian.
+        - near (str, optional): lat,lon centre of a radius search. Results are sorted by distance
+          and carry distance_km.
+        - radius_km (float, optional): Radius of the near search, required with near.
+        - limit (int, optional): Page size; enables keyset pagination ordered by name and id,
+          or by distance with near.
+        - cursor (str, optional): next_cursor returned by the previous page.
+        - fields (str, optional): Comma-separated POI fields to return; id is always included.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the query parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of POIs. Returns an empty list if none are found.
     """
     try:
-        q = Poi.query
+        q, text, near, tag_match = filter_pois(page_tags=True)
+        if text:
+            pois, page = serialize_search_results(q, Poi, text, options=Poi.serialize_options())
+            return jsonify({'message': 'POIs retrieved successfully', 'pois': pois, **page}), 200
+        if near:
+            pois, page = serialize_nearest_pois(q, *near)
+            return jsonify({'message': 'POIs retrieved successfully', 'pois': pois, **page}), 200
+
+        pois, page = serialize_query(
+            q, Poi, [Poi.name, Poi.id], options=Poi.serialize_options(), row_filter=tag_match)
+        return jsonify({'message': 'POIs retrieved successfully', 'pois': pois, **page}), 200
+    except APIException:
+        raise
+    except Exception:
+        handle_unexpected_error('retrieving POIs')
 
-        name = request.args.get('name')
-        if name:
-            q = q.filter(Poi.name.ilike(f'%{name}%'))
 
-        country_name = request.args.get('country_name')
-        city_name = request.args.get('city_name')
-        if country_name or city_name:
-            q = q.join(City, Poi.city_id == City.id).join(
-                Country, City.country_id == Country.id)
-            if country_name:
-                q = q.filter(Country.name == country_name)
-            if city_name:
-                q = q.filter(City.name == city_name)
-
-        tag_name = request.args.get('tag_name')
-        if tag_name:
-            q = q.join(PoiTag, PoiTag.poi_id == Poi.id)
-            q = q.join(Tag, Tag.id == PoiTag.tag_id).filter(
-                Tag.name == tag_name)
-
-        pois = q.all()
-        return jsonify({'message': 'POIs retrieved successfully', 'pois': [poi.serialize() for poi in pois]}), 200
+@api.route('/pois/facets', methods=['GET'])
+@conditional_get(*POI_LIST_TABLES)
+def get_poi_facets():
+    """
+    Count the POIs matching the get_pois filters per tag, country and city season.
+    Args:
+        None.
+    Query Parameters:
+        - name, q, tags, tag_mode, tag_name, country_name, city_name, bbox, near, radius_km:
+          Same filters as get_pois; pagination and fields are ignored.
+    Raises:
+        APIException: If the query parameters are invalid or an unexpected error occurs.
+    Returns:
+        Response: JSON with the total and the tags, countries and seasons counts.
+    """
+    try:
+        signature = tuple(sorted(
+            (key, value) for key, value in request.args.items(multi=True)
+            if key not in FACET_IGNORED_ARGS))
+        cache_key = (signature, get_table_versions(POI_LIST_TABLES))
+        facets = facet_cache.get(cache_key)
+        if facets is None:
+            q, text, near, _ = filter_pois()
+            if text:
+                facets = count_facets(q.filter(match_condition(Poi, text)))
+            elif near:
+                facets = count_facets(poi_ids=[poi_id for _, poi_id in rank_nearest_pois(q, *near)])
+            else:
+                facets = count_facets(q)
+            facet_cache.put(cache_key, facets)
+        return jsonify({'message': 'POI facets retrieved successfully', **facets}), 200
     except APIException:
         raise
     except Exception:
-        handle_unexpected_error('retrieving POIs')
+        handle_unexpected_error('counting POI facets')
+
+
+@api.route('/export/pois', methods=['GET'])
+@conditional_get(*POI_LIST_TABLES)
+def export_pois():
+    """
+    Stream the whole POI catalog, with city, country, tags and images, for bulk consumers.
+    Args:
+        None.
+    Query Parameters:
+        - format (str, optional): 'ndjson' (default) or 'csv'. In CSV, tags and
+          images are joined with '|'.
+    Body:
+        None.
+    Raises:
+        APIException: If the format is not supported.
+    Returns:
+        Response: The catalog, written out batch by batch as it is read.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise APIException(f"format must be {' or '.join(EXPORT_FORMATS)}", status_code=400)
+    render = ndjson_chunks if export_format == 'ndjson' else csv_chunks
+
+    def generate():
+        try:
+            yield from render(export_batches())
+        except Exception:
+            # Headers are already sent; the client sees a truncated body.
+            current_app.logger.exception('exporting POIs')
+            raise
+
+    # Tags and images are read with one query per batch, not per POI.
+    expect_repeated_statements()
+    return current_app.response_class(
+        stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename=pois.{export_format}'})
+
+
+@api.route('/pois/<string:poi_id>/similar', methods=['GET'])
+@conditional_get(*POI_TABLES, 'poi_similarity')
+def get_similar_pois(poi_id):
+    """
+    Retrieve the POIs most often favorited or visited by the same users as a POI.
+    Args:
+        poi_id (str): POI ID.
+    Query Parameters:
+        - limit (int, optional): Number of POIs, 10 by default and at most 20.
+        - fields (str, optional): Comma-separated POI fields to return; id is always included.
+    Body:
+        None.
+    Raises:
+        APIException: If the POI is not found or the query parameters are invalid.
+    Returns:
+        Response: JSON list of POIs, most similar first, each with its similarity score.
+    """
+    limit = parse_int_arg('limit', 10, 1, SIMILAR_POIS_PER_POI)
+    try:
+        get_object_or_404(Poi, poi_id, 'POI not found')
+        similar = similar_to(poi_id, limit)
+        scores = dict(similar)
+        pois = serialize_by_ids(Poi, [similar_id for similar_id, _ in similar],
+                                options=Poi.serialize_options())
+        for poi in pois:
+            poi['similarity'] = round(scores[poi['id']], 4)
+        return jsonify({'message': 'Similar POIs retrieved successfully', 'pois': pois}), 200
+    except APIException:
+        raise
+    except Exception:
+        handle_unexpected_error('retrieving similar POIs')
+
+
+@api.route('/recommendations', methods=['GET'])
+@jwt_required()
+@conditional_get(*POI_TABLES, 'favorite', 'visited', 'poi_similarity', per_user=True)
+def get_recommendations():
+    """
+    Recommend POIs to the authenticated user from the POIs they favorited or visited.
+
+    Users without history, or with too little of it, get popular POIs instead.
+    Args:
+        None.
+    Query Parameters:
+        - limit (int, optional): Number of POIs, 10 by default and at most 50.
+        - fields (str, optional): Comma-separated POI fields to return; id is always included.
+    Body:
+        None.
+    Raises:
+        APIException: If the query parameters are invalid or an unexpected error occurs.
+    Returns:
+        Response: JSON list of recommended POIs, best first.
+    """
+    user_id = get_authenticated_user_id()
+    limit = parse_int_arg('limit', 10, 1, MAX_RECOMMENDATIONS)
+    try:
+        seen = seen_pois(user_id)
+        poi_ids = [poi_id for poi_id, _ in recommend_for(seen, limit)]
+        if len(poi_ids) < limit:
+            chosen = seen.union(poi_ids)
+            popular = popular_poi_ids(limit + len(chosen))
+            poi_ids += [poi_id for poi_id in popular if poi_id not in chosen][:limit - len(poi_ids)]
+        pois = serialize_by_ids(Poi, poi_ids, options=Poi.serialize_options())
+        return jsonify({'message': 'Recommendations retrieved successfully', 'pois': pois}), 200
+    except APIException:
+        raise
+    except Exception:
+        handle_unexpected_error('retrieving recommendations')
 
 
 @api.route('/pois/<string:poi_id>', methods=['GET'])
+@conditional_get(*POI_TABLES)
 def get_poi(poi_id):
     """
     Retrieve details of a POI by its ID.
@@ -588,7 +1177,8 @@ def get_poi(poi_id):
         poi = get_object_or_404(
             Poi,
             unique_field_value=poi_id,
-            not_found_message='Point of interest not found'
+            not_found_message='Point of interest not found',
+            options=Poi.serialize_options()
         )
         return jsonify({'message': 'POI retrieved successfully', 'poi': poi.serialize()}), 200
     except APIException:
@@ -598,6 +1188,7 @@ def get_poi(poi_id):
 
 
 @api.route('/countries', methods=['GET'])
+@conditional_get('country', 'city')
 def get_countries():
     """
     Retrieve countries with optional filters via query string.
@@ -605,8 +1196,13 @@ def get_countries():
         None.
     Query Parameters:
         - name (str, optional): Partial match on country name.
+        - q (str, optional): Full-text search on the country name, sorted by relevance.
+        - limit (int, optional): Page size; enables keyset pagination ordered by name and id.
+        - cursor (str, optional): next_cursor returned by the previous page.
+        - fields (str, optional): Comma-separated country fields to return; id is always included.
+          city_count returns the number of cities instead of their ids.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the query parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of countries. Returns an empty list if none are found.
     """
@@ -616,8 +1212,13 @@ def get_countries():
         name = request.args.get('name')
         if name:
             q = q.filter(Country.name.ilike(f'%{name}%'))
-        countries = q.all()
-        return jsonify({'message': 'Countries retrieved successfully', 'countries': [country.serialize() for country in countries]}), 200
+        text = request.args.get('q')
+        if text:
+            countries, page = serialize_search_results(q, Country, text, options=Country.serialize_options())
+            return jsonify({'message': 'Countries retrieved successfully', 'countries': countries, **page}), 200
+        countries, page = serialize_query(
+            q, Country, [Country.name, Country.id], options=Country.serialize_options())
+        return jsonify({'message': 'Countries retrieved successfully', 'countries': countries, **page}), 200
     except APIException:
         raise
     except Exception:
@@ -625,6 +1226,7 @@ def get_countries():
 
 
 @api.route('/countries/<string:country_name>', methods=['GET'])
+@conditional_get('country', 'city')
 def get_country(country_name):
     """
     Retrieve details of a country by its name.
@@ -638,13 +1240,12 @@ def get_country(country_name):
         Response: JSON with country details.
     """
     try:
-        country = get_object_or_404(
-            Country,
-            unique_field_value=country_name,
-            not_found_message='Country not found',
-            field_name='name'
-        )
-        return jsonify({'message': 'Country retrieved successfully', 'country': country.serialize()}), 200
+        country = reference_cache.country_by_name(country_name)
+        if not country:
+            raise APIException('Country not found', status_code=404)
+        cities = reference_cache.cities_of_country(country.id)
+        return jsonify({'message': 'Country retrieved successfully',
+                        'country': {**country._asdict(), 'cities': [city.id for city in cities]}}), 200
     except APIException:
         raise
     except Exception:
@@ -652,6 +1253,7 @@ def get_country(country_name):
 
 
 @api.route('/cities', methods=['GET'])
+@conditional_get('city', 'poi', 'country')
 def get_cities():
     """
     Retrieve cities with optional filters via query string.
@@ -661,8 +1263,13 @@ def get_cities():
         - season (str, optional): Exact match on preferred season.
         - country_name (str, optional): Exact match on country name.
         - name (str, optional): Partial match on city name.
+        - q (str, optional): Full-text search on city and country names, sorted by relevance.
+        - limit (int, optional): Page size; enables keyset pagination ordered by name and id.
+        - cursor (str, optional): next_cursor returned by the previous page.
+        - fields (str, optional): Comma-separated city fields to return; id is always included.
+          poi_count returns the number of POIs instead of their ids.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the query parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of cities. Returns an empty list if none are found.
     """
@@ -682,8 +1289,14 @@ def get_cities():
         if name:
             q = q.filter(City.name.ilike(f'%{name}%'))
 
-        cities = q.all()
-        return jsonify({'message': 'Cities retrieved successfully', 'cities': [city.serialize() for city in cities]}), 200
+        text = request.args.get('q')
+        if text:
+            cities, page = serialize_search_results(q, City, text, options=City.serialize_options())
+            return jsonify({'message': 'Cities retrieved successfully', 'cities': cities, **page}), 200
+
+        cities, page = serialize_query(
+            q, City, [City.name, City.id], options=City.serialize_options())
+        return jsonify({'message': 'Cities retrieved successfully', 'cities': cities, **page}), 200
     except APIException:
         raise
     except Exception:
@@ -691,6 +1304,7 @@ def get_cities():
 
 
 @api.route('/cities/<string:city_id>', methods=['GET'])
+@conditional_get('city', 'poi')
 def get_city(city_id):
     """
     Retrieve details of a city by its ID.
@@ -719,19 +1333,25 @@ def get_city(city_id):
 @api.route('/popular-pois', methods=['GET'])
 def get_popular_pois():
     """
-    Retrieve a random list of up to 8 POIs.
+    Retrieve the most popular POIs, ranked by favorites and visits.
     Args:
         None.
-    Body:
-        None.
+    Query Parameters:
+        - limit (int, optional): Number of POIs, 8 by default and at most 50.
+        - sample_from (int, optional): Pick the POIs at random among this many top POIs,
+          weighted by popularity, instead of returning the top ones. Between limit and 200.
+        - fields (str, optional): Comma-separated POI fields to return; id is always included.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the query parameters are invalid or an unexpected error occurs.
     Returns:
-        Response: JSON list of POIs. Returns an empty list if none are found.
+        Response: JSON list of POIs, most popular first. Returns an empty list if none are found.
     """
+    limit = parse_int_arg('limit', 8, 1, MAX_POPULAR_POIS)
+    sample_from = parse_int_arg('sample_from', None, limit, MAX_SAMPLE_POOL)
     try:
-        pois = Poi.query.order_by(db.func.random()).limit(8).all()
-        return jsonify({'message': 'Popular POIs retrieved successfully', 'pois': [poi.serialize() for poi in pois]}), 200
+        poi_ids = popular_poi_ids(limit, sample_from)
+        pois = serialize_by_ids(Poi, poi_ids, options=Poi.serialize_options())
+        return jsonify({'message': 'Popular POIs retrieved successfully', 'pois': pois}), 200
     except APIException:
         raise
     except Exception:
@@ -740,6 +1360,7 @@ def get_popular_pois():
 
 @api.route('/visited', methods=['GET'])
 @jwt_required()
+@conditional_get('visited', 'poi', per_user=True)
 def get_visited_pois():
     """
     Retrieve the authenticated user's visited POIs.
@@ -752,10 +1373,10 @@ def get_visited_pois():
     Returns:
         Response: JSON list of visited POIs. Returns an empty list if none are found.
     """
-    user = get_authenticated_user()
+    user_id = get_authenticated_user_id()
     try:
         visited = db.session.query(Visited, Poi).join(
-            Poi, Visited.poi_id == Poi.id).filter(Visited.user_id == user.id).all()
+            Poi, Visited.poi_id == Poi.id).filter(Visited.user_id == user_id).all()
         visited_list = [
             {
                 'poi_id': poi.id,
@@ -785,7 +1406,7 @@ def add_visited_poi():
     Returns:
         Response: JSON with added POI or error message.
     """
-    user = get_authenticated_user()
+    user_id = get_authenticated_user_id()
 
     body = request.get_json()
     body = require_json_object(body, context='adding visited POI')
@@ -798,11 +1419,11 @@ def add_visited_poi():
     )
 
     existing_visited = Visited.query.filter_by(
-        user_id=user.id, poi_id=poi.id).first()
+        user_id=user_id, poi_id=poi.id).first()
     if existing_visited:
         raise APIException('POI already visited', status_code=400)
 
-    visited = Visited(poi_id=poi.id, user_id=user.id)
+    visited = Visited(poi_id=poi.id, user_id=user_id)
 
     try:
         db.session.add(visited)
@@ -830,8 +1451,8 @@ def delete_visited_poi(poi_id):
     Returns:
         Response: JSON with success or error message.
     """
-    user = get_authenticated_user()
-    visited = Visited.query.filter_by(user_id=user.id, poi_id=poi_id).first()
+    user_id = get_authenticated_user_id()
+    visited = Visited.query.filter_by(user_id=user_id, poi_id=poi_id).first()
     if not visited:
         raise APIException('Visited POI not found', status_code=404)
     try:
@@ -858,25 +1479,34 @@ def create_tag():
     """
     body = request.get_json()
     items = normalize_body_to_list(body)
-    created = []
     seen_keys = set()
-    for item in items:
+
+    def validate(item, check):
         name = item.get('name')
         require_body_fields(item, ['name'], item_name=name)
-        key = name
-        if key in seen_keys:
-            raise APIException(f"Duplicate entry: {key}", status_code=400)
-        seen_keys.add(key)
-        existing_tag = Tag.query.filter_by(name=name).first()
-        if existing_tag:
-            raise APIException(f"Tag '{name}' already exists", status_code=400)
-        id = str(uuid.uuid4())
-        tag = Tag(id=id, name=name)
-        created.append(tag)
+        if name in seen_keys:
+            raise APIException(f"Duplicate entry: {name}", status_code=400)
+        seen_keys.add(name)
+        check(name)
+        return {'id': str(uuid.uuid4()), 'name': name}
+
+    def check_existing(names):
+        existing = existing_values(names, Tag.name)
+        for name in names:
+            if name in existing:
+                raise APIException(f"Tag '{name}' already exists", status_code=400)
+
+    rows = validate_items(items, validate, check_existing)
     try:
-        db.session.add_all(created)
+        skipped = first_skipped(rows, bulk_insert(Tag, rows, ignore_conflicts=True))
+        if skipped:
+            db.session.rollback()
+            raise APIException(f"Tag '{skipped['name']}' already exists", status_code=400)
         db.session.commit()
-        return jsonify({'message': 'Tags created successfully', 'created': [tag.serialize() for tag in created]}), 201
+        reference_cache.invalidate()
+        return jsonify({'message': 'Tags created successfully', 'created': rows}), 201
+    except APIException:
+        raise
     except IntegrityError as e:
         db.session.rollback()
         current_app.logger.warning(
@@ -888,21 +1518,23 @@ def create_tag():
 
 
 @api.route('/tags', methods=['GET'])
+@conditional_get('tag')
 def list_tags():
     """
     List all tags.
     Args:
         None.
-    Body:
-        None.
+    Query Parameters:
+        - limit (int, optional): Page size; enables keyset pagination ordered by name and id.
+        - cursor (str, optional): next_cursor returned by the previous page.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the pagination parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of tags. Returns an empty list if none are found.
     """
     try:
-        tags = Tag.query.all()
-        return jsonify({'message': 'Tags retrieved successfully', 'tags': [tag.serialize() for tag in tags]}), 200
+        tags, page = paginate_query(Tag.query, [Tag.name, Tag.id])
+        return jsonify({'message': 'Tags retrieved successfully', 'tags': [tag.serialize() for tag in tags], **page}), 200
     except APIException:
         raise
     except Exception:
@@ -910,6 +1542,7 @@ def list_tags():
 
 
 @api.route('/tags/<string:tag_name>', methods=['GET'])
+@conditional_get('tag')
 def get_tag(tag_name):
     """
     Retrieve a tag by its name.
@@ -923,13 +1556,10 @@ def get_tag(tag_name):
         Response: JSON with tag details.
     """
     try:
-        tag = get_object_or_404(
-            Tag,
-            unique_field_value=tag_name,
-            not_found_message='Tag not found',
-            field_name='name'
-        )
-        return jsonify({'message': 'Tag retrieved successfully', 'tag': tag.serialize()}), 200
+        tag = reference_cache.tag_by_name(tag_name)
+        if not tag:
+            raise APIException('Tag not found', status_code=404)
+        return jsonify({'message': 'Tag retrieved successfully', 'tag': tag._asdict()}), 200
     except APIException:
         raise
     except Exception:
@@ -958,6 +1588,7 @@ def delete_tag(tag_name):
     try:
         db.session.delete(tag)
         db.session.commit()
+        reference_cache.invalidate()
         return jsonify({'message': 'Tag deleted successfully'}), 200
     except Exception:
         db.session.rollback()
@@ -984,12 +1615,9 @@ def add_tag_to_poi(poi_id, tag_name):
             unique_field_value=poi_id,
             not_found_message='POI not found'
         )
-        tag = get_object_or_404(
-            Tag,
-            unique_field_value=tag_name,
-            not_found_message='Tag not found',
-            field_name='name'
-        )
+        tag = reference_cache.tag_by_name(tag_name)
+        if not tag:
+            raise APIException('Tag not found', status_code=404)
 
         existing = PoiTag.query.filter_by(poi_id=poi.id, tag_id=tag.id).first()
         if existing:
@@ -1031,11 +1659,9 @@ def remove_tag_from_poi(poi_id, tag_name):
             not_found_message='Tag not found',
             field_name='name'
         )
-        poi_tag = get_object_or_404(
-            PoiTag,
-            unique_field_value=(poi.id, tag.id),
-            not_found_message='Tag not associated with this POI'
-        )
+        poi_tag = db.session.get(PoiTag, (poi.id, tag.id))
+        if not poi_tag:
+            raise APIException('Tag not associated with this POI', status_code=404)
         db.session.delete(poi_tag)
         db.session.commit()
         return jsonify({'message': 'Tag removed from POI'}), 200
@@ -1046,6 +1672,7 @@ def remove_tag_from_poi(poi_id, tag_name):
 
 
 @api.route('/pois/<string:poi_id>/tags', methods=['GET'])
+@conditional_get('poi', 'poi_tag', 'tag')
 def get_tags_of_poi(poi_id):
     """
     Retrieve all tags associated with a given POI.
@@ -1074,6 +1701,7 @@ def get_tags_of_poi(poi_id):
 
 
 @api.route('/pois/<string:poi_id>/poiimages', methods=['GET'])
+@conditional_get('poi', 'poi_image')
 def get_images_of_poi(poi_id):
     """
     Retrieve all images associated with a given POI.
@@ -1117,34 +1745,35 @@ def create_poi_image():
     body = request.get_json()
     items = normalize_body_to_list(body)
 
-    created = []
     seen_pairs = set()
-    for item in items:
+
+    def validate(item, check):
         url = item.get('url')
         poi_id = item.get('poi_id')
         require_body_fields(item, ['url', 'poi_id'], item_name=url)
-        key = (url, poi_id)
-        if key in seen_pairs:
+        if (url, poi_id) in seen_pairs:
             raise APIException(f"Duplicate entry: {url}", status_code=400)
-        seen_pairs.add(key)
-        poi = get_object_or_404(
-            Poi,
-            unique_field_value=poi_id,
-            not_found_message='POI not found'
-        )
-        id = str(uuid.uuid4())
-        poi_image = PoiImage(id=id, url=url, poi_id=poi_id)
-        created.append(poi_image)
+        seen_pairs.add((url, poi_id))
+        check(poi_id)
+        return {'id': str(uuid.uuid4()), 'url': url, 'poi_id': poi_id}
+
+    def check_pois_exist(poi_ids):
+        found = existing_values(list(set(poi_ids)), Poi.id)
+        if any(poi_id not in found for poi_id in poi_ids):
+            raise APIException('POI not found', status_code=404)
+
+    rows = validate_items(items, validate, check_pois_exist)
     try:
-        db.session.add_all(created)
+        bulk_insert(PoiImage, rows)
         db.session.commit()
-        return jsonify({'message': 'POI images created successfully', 'created': [img.serialize() for img in created]}), 201
+        return jsonify({'message': 'POI images created successfully', 'created': rows}), 201
     except Exception:
         db.session.rollback()
         handle_unexpected_error('creating POI images')
 
 
 @api.route('/poiimages/<string:image_id>', methods=['GET'])
+@conditional_get('poi_image')
 def get_poi_image(image_id):
     """
     Retrieve a POI image by its ID.
@@ -1193,11 +1822,9 @@ def create_poi():
     body = request.get_json()
     items = normalize_body_to_list(body)
 
-    created = []
-    poi_tag_relations = []
-    poi_images_relations = []
     seen_keys = set()
-    for item in items:
+
+    def validate(item, check):
         name = item.get('name')
         require_body_fields(
             item, ['name', 'description', 'latitude', 'longitude', 'country_name', 'city_name'], item_name=name, optional_fields=['tags', 'poiimages'])
@@ -1206,19 +1833,17 @@ def create_poi():
             longitude = float(item.get('longitude'))
         except (TypeError, ValueError):
             raise APIException('latitude/longitude must be numeric', 400)
-        country = Country.query.filter_by(name=item.get('country_name')).first()
+        country = reference_cache.country_by_name(item.get('country_name'))
         if not country:
             raise APIException(f"Country '{item.get('country_name')}' not found", status_code=400)
-        city = City.query.filter_by(name=item.get('city_name'), country_id=country.id).first()
+        city = reference_cache.city_by_name(item.get('city_name'), country.id)
         if not city:
             raise APIException(f"City '{item.get('city_name')}' in country '{item.get('country_name')}' not found", status_code=400)
         key = f"{name}:{city.id}"
         if key in seen_keys:
             raise APIException(f"Duplicate entry: {key}", status_code=400)
         seen_keys.add(key)
-        existing = Poi.query.filter_by(name=name, city_id=city.id).first()
-        if existing:
-            raise APIException(f"POI '{name}' already exists in this city", status_code=400)
+        check((name, city.id))
         tags = item.get('tags', [])
         if not isinstance(tags, list):
             raise APIException('tags must be a list', 400)
@@ -1231,29 +1856,43 @@ def create_poi():
         for img in poiimages:
             if not isinstance(img, str) or not img:
                 raise APIException('each poiimage must be a non-empty string', 400)
-        poi = Poi(
-            id=str(uuid.uuid4()),
-            name=name,
-            description=item.get('description'),
-            latitude=latitude,
-            longitude=longitude,
-            city_id=city.id
-        )
-        created.append(poi)
+        poi_id = str(uuid.uuid4())
+        tag_rows = []
         for tag_name in tags:
-            tag = Tag.query.filter_by(name=tag_name).first()
+            tag = reference_cache.tag_by_name(tag_name)
             if not tag:
                 raise APIException(f"Tag '{tag_name}' not found", status_code=404)
-            poi_tag_relations.append(PoiTag(poi_id=poi.id, tag_id=tag.id))
-        for img in poiimages:
-            poi_images_relations.append(PoiImage(id=str(uuid.uuid4()), url=img, poi_id=poi.id))
+            tag_rows.append({'poi_id': poi_id, 'tag_id': tag.id})
+        poi_row = {
+            'id': poi_id,
+            'name': name,
+            'description': item.get('description'),
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': encode_geohash(latitude, longitude),
+            'city_id': city.id,
+        }
+        image_rows = [{'id': str(uuid.uuid4()), 'url': img, 'poi_id': poi_id} for img in poiimages]
+        return poi_row, tag_rows, image_rows
+
+    def check_existing(keys):
+        existing = existing_values(keys, Poi.name, Poi.city_id)
+        for name, city_id in keys:
+            if (name, city_id) in existing:
+                raise APIException(f"POI '{name}' already exists in this city", status_code=400)
+
+    validated = validate_items(items, validate, check_existing)
+    poi_rows = [poi_row for poi_row, _, _ in validated]
+    poi_tag_rows = [row for _, tag_rows, _ in validated for row in tag_rows]
+    poi_image_rows = [row for _, _, image_rows in validated for row in image_rows]
     try:
-        db.session.add_all(created)
-        db.session.flush()  # Flush to assign IDs before creating PoiTag entries
-        db.session.add_all(poi_tag_relations)
-        db.session.add_all(poi_images_relations)
+        bulk_insert(Poi, poi_rows)
+        bulk_insert(PoiTag, poi_tag_rows)
+        bulk_insert(PoiImage, poi_image_rows)
+        created_ids = [row['id'] for row in poi_rows]
 
         db.session.commit()
+        created = load_pois_for_serialization(created_ids)
         return jsonify({'message': 'POIs created successfully',
                         'created': [poi.serialize() for poi in created]}), 201
     except IntegrityError as e:
@@ -1381,25 +2020,38 @@ def create_country():
     """
     body = request.get_json()
     items = normalize_body_to_list(body)
-    created = []
     seen_keys = set()
-    for item in items:
+
+    def validate(item, check):
         name = item.get('name')
         require_body_fields(item, ['name', 'img'], item_name=name)
-        key = name
-        if key in seen_keys:
-            raise APIException(f"Duplicate entry: {key}", status_code=400)
-        seen_keys.add(key)
-        existing_country = Country.query.filter_by(name=name).first()
-        if existing_country:
-            raise APIException(
-                f'Country {name} already exists', status_code=400)
-        country = Country(id=str(uuid.uuid4()), name=name, img=item.get('img'))
-        created.append(country)
+        if name in seen_keys:
+            raise APIException(f"Duplicate entry: {name}", status_code=400)
+        seen_keys.add(name)
+        check(name)
+        return {'id': str(uuid.uuid4()), 'name': name, 'img': item.get('img')}
+
+    def check_existing(names):
+        existing = existing_values(names, Country.name)
+        for name in names:
+            if name in existing:
+                raise APIException(
+                    f"Country {name} already exists", status_code=400)
+
+    rows = validate_items(items, validate, check_existing)
     try:
-        db.session.add_all(created)
+        skipped = first_skipped(rows, bulk_insert(Country, rows, ignore_conflicts=True))
+        if skipped:
+            db.session.rollback()
+            raise APIException(
+                f"Country {skipped['name']} already exists", status_code=400)
         db.session.commit()
-        return jsonify({'message': 'Countries created successfully', 'created': [country.serialize() for country in created]}), 201
+        reference_cache.invalidate()
+        # New countries have no cities yet.
+        return jsonify({'message': 'Countries created successfully',
+                        'created': [{**row, 'cities': []} for row in rows]}), 201
+    except APIException:
+        raise
     except IntegrityError as e:
         db.session.rollback()
         current_app.logger.warning(
@@ -1442,6 +2094,7 @@ def update_country(country_name):
         country.img = body.get('img')
     try:
         db.session.commit()
+        reference_cache.invalidate()
         return jsonify({'message': 'Country updated successfully', 'country': country.serialize()}), 200
     except IntegrityError as e:
         db.session.rollback()
@@ -1471,6 +2124,7 @@ def delete_country(country_name):
     try:
         db.session.delete(country)
         db.session.commit()
+        reference_cache.invalidate()
         return jsonify({'message': 'Country deleted successfully'}), 200
     except Exception:
         db.session.rollback()
@@ -1495,9 +2149,9 @@ def create_city():
     body = request.get_json()
     items = normalize_body_to_list(body)
 
-    created = []
     seen_keys = set()
-    for item in items:
+
+    def validate(item, check):
         name = item.get('name')
         require_body_fields(
             item, ['name', 'season', 'country_name'], item_name=name)
@@ -1505,29 +2159,38 @@ def create_city():
         if key in seen_keys:
             raise APIException(f"Duplicate entry: {key}", status_code=400)
         seen_keys.add(key)
-        country = get_object_or_404(
-            Country,
-            unique_field_value=item.get('country_name'),
-            not_found_message='Country not found',
-            field_name='name'
-        )
-        existing = City.query.filter_by(
-            name=name, country_id=country.id).first()
-        if existing:
-            raise APIException(
-                f"City '{name}' already exists in this country", status_code=400)
-        city = City(
-            id=str(uuid.uuid4()),
-            name=name,
-            season=item.get('season'),
-            country_id=country.id
-        )
-        created.append(city)
+        country = reference_cache.country_by_name(item.get('country_name'))
+        if not country:
+            raise APIException('Country not found', status_code=404)
+        check((name, country.id))
+        return {
+            'id': str(uuid.uuid4()),
+            'name': name,
+            'season': item.get('season'),
+            'country_id': country.id
+        }
+
+    def check_existing(keys):
+        existing = existing_values(keys, City.name, City.country_id)
+        for name, country_id in keys:
+            if (name, country_id) in existing:
+                raise APIException(
+                    f"City '{name}' already exists in this country", status_code=400)
+
+    rows = validate_items(items, validate, check_existing)
     try:
-        db.session.add_all(created)
+        skipped = first_skipped(rows, bulk_insert(City, rows, ignore_conflicts=True))
+        if skipped:
+            db.session.rollback()
+            raise APIException(
+                f"City '{skipped['name']}' already exists in this country", status_code=400)
         db.session.commit()
+        reference_cache.invalidate()
+        # New cities have no POIs yet.
         return jsonify({'message': 'Cities created successfully',
-                        'created': [city.serialize() for city in created]}), 201
+                        'created': [{**row, 'pois': []} for row in rows]}), 201
+    except APIException:
+        raise
     except IntegrityError as e:
         db.session.rollback()
         current_app.logger.warning(
@@ -1593,6 +2256,7 @@ def update_city(city_id):
         city.season = body.get('season')
     try:
         db.session.commit()
+        reference_cache.invalidate()
         return jsonify({'message': 'City updated successfully', 'city': city.serialize()}), 200
     except IntegrityError as e:
         db.session.rollback()
@@ -1622,6 +2286,7 @@ def delete_city(city_id):
     try:
         db.session.delete(city)
         db.session.commit()
+        reference_cache.invalidate()
         return jsonify({'message': 'City deleted successfully'}), 200
     except Exception:
         db.session.rollback()
@@ -1629,21 +2294,23 @@ def delete_city(city_id):
 
 
 @api.route('/poiimages', methods=['GET'])
+@conditional_get('poi_image')
 def list_poi_images():
     """
     List all POI images.
     Args:
         None.
-    Body:
-        None.
+    Query Parameters:
+        - limit (int, optional): Page size; enables keyset pagination ordered by id.
+        - cursor (str, optional): next_cursor returned by the previous page.
     Raises:
-        APIException: If an unexpected error occurs.
+        APIException: If the pagination parameters are invalid or an unexpected error occurs.
     Returns:
         Response: JSON list of POI images. Returns an empty list if none are found.
     """
     try:
-        images = PoiImage.query.all()
-        return jsonify({'message': 'POI images retrieved successfully', 'images': [img.serialize() for img in images]}), 200
+        images, page = paginate_query(PoiImage.query, [PoiImage.id])
+        return jsonify({'message': 'POI images retrieved successfully', 'images': [img.serialize() for img in images], **page}), 200
     except APIException:
         raise
     except Exception:
@@ -1676,6 +2343,7 @@ def delete_poi_image(image_id):
 
 
 @api.route('/<string:country_name>/cities', methods=['GET'])
+@conditional_get('country', 'city', 'poi')
 def get_cities_by_country(country_name):
     """
     Retrieve all cities within a given country.
@@ -1689,15 +2357,76 @@ def get_cities_by_country(country_name):
         Response: JSON list of cities. Returns an empty list if none are found.
     """
     try:
-        country = get_object_or_404(
-            Country,
-            unique_field_value=country_name,
-            not_found_message='Country not found',
-            field_name='name'
-        )
-        cities = City.query.filter_by(country_id=country.id).all()
-        return jsonify({'message': 'Cities retrieved successfully', 'cities': [city.serialize() for city in cities]}), 200
+        country = reference_cache.country_by_name(country_name)
+        if not country:
+            raise APIException('Country not found', status_code=404)
+        cities = reference_cache.cities_of_country(country.id)
+        pois_by_city = PROJECTED_COLLECTIONS[City]['pois']([city.id for city in cities])
+        return jsonify({'message': 'Cities retrieved successfully',
+                        'cities': [{**city._asdict(), 'pois': pois_by_city.get(city.id, [])} for city in cities]}), 200
+    except APIException:
+        raise
+    except Exception:
+        handle_unexpected_error('retrieving cities by country')
+
+
+@api.route('/reference-cache/stats', methods=['GET'])
+@jwt_required()
+def get_reference_cache_stats():
+    """
+    Report the country/city/tag cache counters of the worker serving the request.
+    Args:
+        None.
+    Body:
+        None.
+    Raises:
+        APIException: If the authenticated user is not an admin.
+    Returns:
+        Response: JSON with hit, miss, reload and invalidation counters.
+    """
+    get_authenticated_admin()
+    return jsonify({'message': 'Reference cache stats retrieved successfully', 'stats': reference_cache.stats()}), 200
+
+
+@api.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    """
+    Suggest countries, cities, POIs and tags whose name starts with what the user typed.
+    Args:
+        None.
+    Query Parameters:
+        - q (str): Text typed so far; it may match the start of any of the first words of a name.
+        - limit (int, optional): Number of suggestions, 10 by default and at most 20.
+    Body:
+        None.
+    Raises:
+        APIException: If limit is invalid.
+    Returns:
+        Response: JSON with the suggestions (type, id and name), most popular first.
+    """
+    limit = parse_int_arg('limit', 10, 1, MAX_AUTOCOMPLETE_RESULTS)
+    try:
+        suggestions = autocomplete_index.suggest(request.args.get('q', ''), limit)
+        return jsonify({'message': 'Suggestions retrieved successfully', 'suggestions': suggestions}), 200
     except APIException:
         raise
     except Exception:
-        handle_unexpected_error('retrieving cities by country')
\ No newline at end of file
+        handle_unexpected_error('retrieving suggestions')
+
+
+@api.route('/autocomplete/stats', methods=['GET'])
+@jwt_required()
+def get_autocomplete_stats():
+    """
+    Report the autocomplete index counters of the worker serving the request.
+    Args:
+        None.
+    Body:
+        None.
+    Raises:
+        APIException: If the authenticated user is not an admin.
+    Returns:
+        Response: JSON with build and incremental update counters and the index size.
+    """
+    get_authenticated_admin()
+    return jsonify({'message': 'Autocomplete stats retrieved successfully', 'stats': autocomplete_index.stats()}), 200
@@ -0,0 +1,307 @@
+import re
+from sqlalchemy import and_, column, delete, event, false, func, insert, inspect, literal, literal_column, or_, select, table, tuple_
+from sqlalchemy.orm import Session
+from api.models import db, Poi, City, Country, SearchEntry
+from api.bulk import on_bulk_insert, on_bulk_update
+
+# Words of the query taken into account, the rest are ignored.
+MAX_QUERY_TERMS = 8
+# Ids per IN (...) clause when reindexing.
+REINDEX_CHUNK_SIZE = 500
+
+SEARCH_COLUMNS = ['entity_type', 'entity_id', 'title', 'body']
+FTS_TABLE = table('search_entry_fts', column('rowid'))
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_entry_fts USING fts5(
+        title, body, content='search_entry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_entry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_entry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS search_entry_au",
+    "DROP TRIGGER IF EXISTS search_entry_ad",
+    "DROP TRIGGER IF EXISTS search_entry_ai",
+    "DROP TABLE IF EXISTS search_entry_fts",
+]
+POSTGRES_DDL = [
+    """ALTER TABLE search_entry ADD COLUMN IF NOT EXISTS document tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') ||
+            setweight(to_tsvector('simple', body), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_search_entry_document ON search_entry USING GIN (document)",
+]
+POSTGRES_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_search_entry_document",
+    "ALTER TABLE search_entry DROP COLUMN IF EXISTS document",
+]
+
+
+def create_search_structures(connection):
+    """
+    Create the dialect-specific full-text index on top of search_entry.
+    Args:
+        connection: SQLAlchemy connection; search_entry must already exist.
+    """
+    ddl = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}
+    for statement in ddl.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+def drop_search_structures(connection):
+    """
+    Drop what create_search_structures created.
+    Args:
+        connection: SQLAlchemy connection.
+    """
+    ddl = {'sqlite': SQLITE_DROP_DDL, 'postgresql': POSTGRES_DROP_DDL}
+    for statement in ddl.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(SearchEntry.__table__, 'after_create')
+def _create_search_structures_after_create(target, connection, **kw):
+    create_search_structures(connection)
+
+
+@event.listens_for(SearchEntry.__table__, 'before_drop')
+def _drop_search_structures_before_drop(target, connection, **kw):
+    drop_search_structures(connection)
+
+
+def _document_query(entity_type):
+    """Select (entity_type, entity_id, title, body) rows for one kind of entity."""
+    if entity_type == 'poi':
+        return select(
+            literal('poi'), Poi.id, Poi.name,
+            Poi.description + ' ' + City.name + ' ' + Country.name
+        ).join(City, Poi.city_id == City.id).join(Country, City.country_id == Country.id)
+    if entity_type == 'city':
+        return select(literal('city'), City.id, City.name, Country.name).join(
+            Country, City.country_id == Country.id)
+    return select(literal('country'), Country.id, Country.name, literal(''))
+
+
+ENTITY_MODELS = {'poi': Poi, 'city': City, 'country': Country}
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), REINDEX_CHUNK_SIZE):
+        yield ids[start:start + REINDEX_CHUNK_SIZE]
+
+
+def remove_entities(connection, entity_type, ids):
+    """
+    Remove entities from the search index.
+    Args:
+        connection: The SQLAlchemy connection of the current transaction.
+        entity_type (str): 'poi', 'city' or 'country'.
+        ids: Iterable of entity ids.
+    """
+    entries = SearchEntry.__table__
+    for chunk in _chunks(ids):
+        connection.execute(delete(entries).where(
+            entries.c.entity_type == entity_type, entries.c.entity_id.in_(chunk)))
+
+
+def index_entities(connection, entity_type, ids):
+    """
+    (Re)build the search entries of the given entities from their current rows.
+    Args:
+        connection: The SQLAlchemy connection of the current transaction.
+        entity_type (str): 'poi', 'city' or 'country'.
+        ids: Iterable of entity ids.
+    """
+    model = ENTITY_MODELS[entity_type]
+    entries = SearchEntry.__table__
+    for chunk in _chunks(ids):
+        connection.execute(delete(entries).where(
+            entries.c.entity_type == entity_type, entries.c.entity_id.in_(chunk)))
+        connection.execute(insert(entries).from_select(
+            SEARCH_COLUMNS, _document_query(entity_type).where(model.id.in_(chunk))))
+
+
+def rebuild_search_index(connection):
+    """
+    Rebuild every search entry from the poi, city and country tables.
+    Args:
+        connection: SQLAlchemy connection.
+    """
+    entries = SearchEntry.__table__
+    connection.execute(delete(entries))
+    for entity_type in ENTITY_MODELS:
+        connection.execute(insert(entries).from_select(
+            SEARCH_COLUMNS, _document_query(entity_type)))
+
+
+def _has_changes(obj, *attributes):
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_entries(session, flush_context):
+    changed = {entity_type: set() for entity_type in ENTITY_MODELS}
+    removed = {entity_type: set() for entity_type in ENTITY_MODELS}
+    renamed_cities = set()
+    renamed_countries = set()
+    for obj in session.new:
+        if isinstance(obj, (Poi, City, Country)):
+            changed[obj.__tablename__].add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, (Poi, City, Country)):
+            removed[obj.__tablename__].add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Poi) and _has_changes(obj, 'name', 'description', 'city_id'):
+            changed['poi'].add(obj.id)
+        elif isinstance(obj, City) and _has_changes(obj, 'name', 'country_id'):
+            changed['city'].add(obj.id)
+            renamed_cities.add(obj.id)
+        elif isinstance(obj, Country) and _has_changes(obj, 'name'):
+            changed['country'].add(obj.id)
+            renamed_countries.add(obj.id)
+    if not any(changed.values()) and not any(removed.values()):
+        return
+
+    connection = session.connection()
+    # A city or country name is part of the text of everything below it.
+    for chunk in _chunks(renamed_countries):
+        renamed_cities.update(connection.execute(
+            select(City.id).where(City.country_id.in_(chunk))).scalars())
+    changed['city'].update(renamed_cities)
+    for chunk in _chunks(renamed_cities):
+        changed['poi'].update(connection.execute(
+            select(Poi.id).where(Poi.city_id.in_(chunk))).scalars())
+
+    for entity_type in ENTITY_MODELS:
+        remove_entities(connection, entity_type, removed[entity_type])
+        index_entities(connection, entity_type, changed[entity_type] - removed[entity_type])
+
+
+@on_bulk_insert
+@on_bulk_update
+def _index_bulk_written(session, model, rows):
+    if model in (Poi, City, Country):
+        index_entities(session.connection(), model.__tablename__, [row['id'] for row in rows])
+
+
+def search_terms(text):
+    """
+    Split a user query into lowercase words.
+    Args:
+        text (str): The raw query.
+    Returns:
+        list: At most MAX_QUERY_TERMS words.
+    """
+    return re.findall(r'\w+', text.lower())[:MAX_QUERY_TERMS]
+
+
+def _fts5_query(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _full_text_filter(q, terms):
+    """
+    Keep the rows of q whose search entry matches every term, each as a prefix.
+    Args:
+        q: Query or select already joined to search_entry.
+        terms (list): Words returned by search_terms.
+    Returns:
+        tuple: (q, score) where score orders the matches, best first.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        fts = literal_column('search_entry_fts')
+        q = q.join(FTS_TABLE, FTS_TABLE.c.rowid == SearchEntry.id).filter(
+            fts.op('MATCH')(_fts5_query(terms)))
+        return q, func.bm25(fts, 10.0, 1.0)
+    if dialect == 'postgresql':
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        document = literal_column('search_entry.document')
+        return q.filter(document.op('@@')(tsquery)), -func.ts_rank_cd(document, tsquery)
+    q = q.filter(*(or_(SearchEntry.title.ilike(f'%{term}%'), SearchEntry.body.ilike(f'%{term}%'))
+                   for term in terms))
+    return q, literal(0.0)
+
+
+def ranked_matches(q, model, text, after=None, limit=None):
+    """
+    Rank the rows of a query by full-text relevance to a user query.
+
+    Every word of the query must match as a prefix of a word, so results
+    follow the user while typing. Names weigh more than descriptions. The
+    ranking is resumed in SQL after a (score, id) key, so pages go as deep
+    as the matches do.
+    Args:
+        q: Query over a POI, City or Country model, with other filters applied.
+        model: Poi, City or Country.
+        text (str): The user query.
+        after (tuple): Optional. (score, id) of the last match already returned.
+        limit (int): Optional. Most matches returned.
+    Returns:
+        list: Sorted (score, id) tuples, best match first.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+    q = q.join(SearchEntry, and_(SearchEntry.entity_type == model.__tablename__,
+                                 SearchEntry.entity_id == model.id))
+    q, score = _full_text_filter(q, terms)
+    if after is not None:
+        q = q.filter(tuple_(score, model.id) > tuple_(*after))
+    rows = q.with_entities(score, model.id).order_by(score, model.id).limit(limit)
+    return [(float(row[0]), row[1]) for row in rows]
+
+
+def match_condition(model, text):
+    """
+    Condition keeping every row matching a user query, unranked and unlimited.
+
+    Matches the same rows as ranked_matches, for counting them all rather
+    than listing the best ones.
+    Args:
+        model: Poi, City or Country.
+        text (str): The user query.
+    Returns:
+        ColumnElement: Condition on model.id; matches nothing when text has no words.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return false()
+    matching = select(SearchEntry.entity_id).where(SearchEntry.entity_type == model.__tablename__)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # Joined, SQLite runs the MATCH once per search entry; as a subquery
+        # it runs once.
+        fts = literal_column('search_entry_fts')
+        matched = select(FTS_TABLE.c.rowid).where(fts.op('MATCH')(_fts5_query(terms)))
+        matching = matching.where(SearchEntry.id.in_(matched))
+    else:
+        matching, _ = _full_text_filter(matching, terms)
+    return model.id.in_(matching)
+
+
+def include_in_autogenerate(obj, name, type_, reflected, compare_to):
+    """
+    Alembic include_object hook hiding the objects created by create_search_structures.
+
+    They are not part of the models' metadata, so autogenerate would
+    otherwise emit migrations dropping them.
+    """
+    if type_ == 'table' and name.startswith('search_entry_fts'):
+        return False
+    if reflected and compare_to is None and name in ('document', 'ix_search_entry_document'):
+        return False
+    return True
@@ -0,0 +1,114 @@
+import time
+from collections import Counter
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statements slower than this many milliseconds are logged unless
+# SLOW_QUERY_MS says otherwise.
+SLOW_QUERY_MS = 500
+# Executions of one statement text within one request reported as a likely
+# N+1 pattern (a query per row of a previous result).
+N_PLUS_ONE_THRESHOLD = 10
+# Characters of a statement or of its parameter types kept in log lines.
+LOGGED_SQL_LENGTH = 500
+SQL_STATS_ENVIRON_KEY = 'api.sql_stats'
+BATCHED_ENVIRON_KEY = 'api.sql_stats.batched'
+_STARTED_KEY = 'api.sql_stats.started'
+
+
+class RequestSqlStats:
+    """Statements executed while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+
+def request_sql_stats(environ):
+    """The RequestSqlStats of the request with this WSGI environ, or None if it ran no statement."""
+    return environ.get(SQL_STATS_ENVIRON_KEY)
+
+
+def expect_repeated_statements():
+    """Mark the current request as running one statement per batch on purpose, so it is not reported as an N+1."""
+    request.environ[BATCHED_ENVIRON_KEY] = True
+
+
+def _route():
+    if not has_request_context():
+        return 'outside a request'
+    rule = request.url_rule
+    return f'{request.method} {rule.rule if rule is not None else request.path}'
+
+
+def _shorten(value):
+    text = str(value)
+    return text if len(text) <= LOGGED_SQL_LENGTH else text[:LOGGED_SQL_LENGTH] + '...'
+
+
+def _parameter_types(parameters, executemany):
+    """Describe bound parameters by type only; their values may be emails or password hashes."""
+    if executemany:
+        rows = list(parameters)
+        return f'{len(rows)} rows of {_parameter_types(rows[0], False)}' if rows else '0 rows'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{name}: {type(value).__name__}' for name, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters or ()) + ')'
+
+
+def setup_sql_stats(app):
+    """
+    Account for the SQL statements of every request of app.
+
+    Counts statements and their time per request; in debug mode the totals
+    are sent back in the X-SQL-Statements and X-SQL-Time-Ms headers (of
+    non-streamed responses). A statement text run N_PLUS_ONE_THRESHOLD times
+    or more in one request is logged as a likely N+1 with the route, and so
+    is any statement slower than SLOW_QUERY_MS, with the types of its
+    parameters; their values are never logged.
+    """
+    slow_seconds = float(app.config.get('SLOW_QUERY_MS') or SLOW_QUERY_MS) / 1000
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info[_STARTED_KEY] = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def account(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop(_STARTED_KEY, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if has_request_context():
+            environ = request.environ
+            stats = environ.get(SQL_STATS_ENVIRON_KEY)
+            if stats is None:
+                stats = environ[SQL_STATS_ENVIRON_KEY] = RequestSqlStats()
+            stats.count += 1
+            stats.db_time += elapsed
+            stats.shapes[statement] += 1
+        if elapsed >= slow_seconds:
+            app.logger.warning(
+                f'Slow query ({elapsed * 1000:.0f} ms) on {_route()}: '
+                f'{_shorten(statement)} parameters: {_shorten(_parameter_types(parameters, executemany))}')
+
+    @app.after_request
+    def add_debug_headers(response):
+        if app.debug:
+            stats = request_sql_stats(request.environ) or RequestSqlStats()
+            response.headers['X-SQL-Statements'] = str(stats.count)
+            response.headers['X-SQL-Time-Ms'] = f'{stats.db_time * 1000:.1f}'
+        return response
+
+    @app.teardown_request
+    def report_repeated_statements(error=None):
+        stats = request_sql_stats(request.environ)
+        if stats is None or request.environ.get(BATCHED_ENVIRON_KEY):
+            return
+        for statement, count in stats.shapes.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                app.logger.warning(
+                    f'Possible N+1 on {_route()} ({request.endpoint}): statement run '
+                    f'{count} times in one request: {_shorten(statement)}')
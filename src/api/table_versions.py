@@ -0,0 +1,187 @@
+import hashlib
+from functools import wraps
+from itertools import chain
+from flask import request, current_app, make_response, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from api.models import db, TableVersion
+from api.bulk import on_bulk_insert, on_bulk_update
+
+# Tables whose writes are counted in table_version.
+TRACKED_TABLES = ('user', 'country', 'city', 'poi', 'poi_image',
+                  'tag', 'poi_tag', 'favorite', 'visited', 'poi_similarity')
+
+# Bump when the JSON shape of a cached endpoint changes, so clients holding
+# an ETag from a previous deploy do not get a 304 for the old representation.
+REPRESENTATION_VERSION = 1
+# Versions read during the current request, see get_table_versions.
+VERSIONS_ENVIRON_KEY = 'api.table_versions'
+# Session key of the tracked tables written by the current transaction.
+CHANGED_TABLES_KEY = 'api.table_versions.changed'
+
+
+def bump_table_versions(connection, table_names):
+    """
+    Increment the change counter of the given tables, in one statement.
+
+    Writes made through the session or bulk_insert are bumped right after
+    their transaction commits; call this directly only when writing on a
+    bare connection, as rebuild_similarities does.
+    Args:
+        connection: The SQLAlchemy connection to run the update on.
+        table_names: Iterable of table names that were written.
+    """
+    names = sorted(set(table_names).intersection(TRACKED_TABLES))
+    if not names:
+        return
+    table = TableVersion.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.name.in_(names))
+        .values(version=table.c.version + 1)
+    )
+
+
+def get_table_versions(table_names):
+    """
+    Read the current change counters of the given tables.
+
+    Within a request every counter is read by the first call, in one query,
+    and reused by the following ones until the session flushes or commits.
+    Args:
+        table_names: Sequence of table names.
+    Returns:
+        tuple: The versions, in the order of table_names (0 for unknown tables).
+    """
+    versions = request.environ.get(VERSIONS_ENVIRON_KEY) if has_request_context() else None
+    if versions is None:
+        rows = db.session.execute(select(TableVersion.name, TableVersion.version))
+        versions = dict(rows.all())
+        if has_request_context():
+            request.environ[VERSIONS_ENVIRON_KEY] = versions
+    return tuple(versions.get(name, 0) for name in table_names)
+
+
+@event.listens_for(Session, 'after_flush')
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_request_versions(session, *args):
+    if has_request_context():
+        request.environ.pop(VERSIONS_ENVIRON_KEY, None)
+
+
+def changed_tables(session):
+    """
+    Names of the tracked tables written by the flush being processed.
+
+    Meant to be called from an after_flush hook, where session.new, dirty and
+    deleted still describe what was just flushed.
+    Args:
+        session: The flushing session.
+    Returns:
+        set: Table names; each of them gets its version bumped by one when
+        the transaction commits, however many flushes wrote it.
+    """
+    changed = set()
+    for obj in chain(session.new, session.deleted):
+        changed.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            changed.add(obj.__table__.name)
+    return changed.intersection(TRACKED_TABLES)
+
+
+def _record_changed_tables(session, tables):
+    if tables:
+        session.info.setdefault(CHANGED_TABLES_KEY, set()).update(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flushed_tables(session, flush_context):
+    _record_changed_tables(session, changed_tables(session))
+
+
+@on_bulk_insert
+@on_bulk_update
+def _record_bulk_written_table(session, model, rows):
+    _record_changed_tables(session, {model.__tablename__}.intersection(TRACKED_TABLES))
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions_after_commit(session):
+    # Bumping inside the writer's transaction would hold the shared
+    # table_version rows locked until it commits, serializing every writer
+    # of a table. A separate one-statement transaction holds them only for
+    # that statement. Until it runs, readers may pair the new rows with the
+    # old versions, which only costs them one more reload.
+    changed = session.info.pop(CHANGED_TABLES_KEY, None)
+    if not changed:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            bump_table_versions(connection, changed)
+    except Exception:
+        current_app.logger.exception(f"bumping table versions of {', '.join(sorted(changed))}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop(CHANGED_TABLES_KEY, None)
+
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def _seed_table_versions(target, connection, **kw):
+    connection.execute(
+        target.insert(), [{'name': name, 'version': 0} for name in TRACKED_TABLES])
+
+
+def compute_etag(table_names, per_user=False):
+    """
+    Build the strong ETag of the current GET request.
+    Args:
+        table_names: Tables whose content the response depends on.
+        per_user (bool): Whether the response depends on the JWT identity.
+    Returns:
+        str: Hex digest identifying the representation.
+    """
+    parts = [
+        str(REPRESENTATION_VERSION),
+        request.full_path,
+        ','.join(map(str, get_table_versions(table_names))),
+    ]
+    if per_user:
+        parts.append(str(get_jwt_identity()))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_get(*table_names, per_user=False):
+    """
+    Decorate a GET view with ETag / If-None-Match handling.
+
+    The ETag is derived from the table change counters, so a matching
+    If-None-Match is answered with 304 before the view queries or serializes
+    anything. For per-user views this must be placed below @jwt_required().
+    Args:
+        *table_names: Tables whose content the response depends on.
+        per_user (bool): Whether the response depends on the JWT identity.
+    Returns:
+        function: The decorator.
+    """
+    cache_control = 'private, no-cache' if per_user else 'no-cache'
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(table_names, per_user=per_user)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
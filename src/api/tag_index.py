@@ -0,0 +1,189 @@
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import and_, or_
+from sqlalchemy import false, func, select
+from api.models import db, Poi, PoiTag
+from api.worker_index import WorkerIndex
+
+# Deleting a POI or a tag deletes its poi_tag rows too, so this is enough.
+TAG_INDEX_TABLES = ('poi_tag',)
+TAG_MODES = ('all', 'any')
+# Up to this many matches the bitmap result is sent as an id list; past it
+# list pages are filtered in memory with a TagMatch, and other uses of the
+# filter are evaluated by the database. The id list goes into one IN (...),
+# so this stays within the size routes.IN_CLAUSE_CHUNK_SIZE deems safe.
+MAX_BITMAP_IDS = 500
+
+
+def _bitmap(positions):
+    """Int with the given bits set, built in one go instead of one OR per bit."""
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+class _Bitmaps:
+    """POI positions plus, per tag, an int whose set bits are the POIs carrying it."""
+
+    def __init__(self):
+        self.positions = {}
+        self.poi_ids = []
+        self.tags = {}
+
+    def position(self, poi_id):
+        position = self.positions.get(poi_id)
+        if position is None:
+            position = self.positions[poi_id] = len(self.poi_ids)
+            self.poi_ids.append(poi_id)
+        return position
+
+    def load(self, rows):
+        """Set the bitmaps from (poi_id, tag_id) rows, each built once all its positions are known."""
+        positions = defaultdict(list)
+        for poi_id, tag_id in rows:
+            positions[tag_id].append(self.position(poi_id))
+        self.tags = {tag_id: _bitmap(tag_positions) for tag_id, tag_positions in positions.items()}
+
+    def tag(self, poi_id, tag_id):
+        self.tags[tag_id] = self.tags.get(tag_id, 0) | (1 << self.position(poi_id))
+
+    def untag(self, poi_id, tag_id):
+        position = self.positions.get(poi_id)
+        if position is None or tag_id not in self.tags:
+            return
+        bits = self.tags[tag_id] & ~(1 << position)
+        if bits:
+            self.tags[tag_id] = bits
+        else:
+            del self.tags[tag_id]
+
+    def match(self, tag_ids, mode):
+        bitmaps = [self.tags.get(tag_id, 0) for tag_id in tag_ids]
+        return reduce(and_ if mode == 'all' else or_, bitmaps)
+
+    def ids(self, bits):
+        # Scanning the binary representation runs in C, unlike a loop over bits.
+        digits = format(bits, 'b')
+        last = len(digits) - 1
+        return [self.poi_ids[last - match.start()] for match in re.finditer('1', digits)]
+
+
+class TagMatch:
+    """Snapshot of the POIs matched by the bitmap index, tested one id at a time.
+
+    Lets a list page walk the POIs in its own order and keep the matching
+    ones without sending every matching id to the database.
+
+    Attributes:
+        column: Poi.id, the column contains() is given.
+        condition: The equivalent SQL condition, for what is not filtered in memory.
+        count (int): Number of matching POIs.
+    """
+
+    def __init__(self, bits, positions, condition):
+        self.column = Poi.id
+        self.condition = condition
+        self.count = bits.bit_count()
+        self._bytes = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        self._positions = positions
+
+    def contains(self, poi_id):
+        position = self._positions.get(poi_id)
+        if position is None or position >> 3 >= len(self._bytes):
+            return False
+        return bool(self._bytes[position >> 3] >> (position & 7) & 1)
+
+
+class TagBitmapIndex(WorkerIndex):
+    """Per-worker bitmap index answering multi-tag POI filters.
+
+    Combining tags is an AND/OR of a few ints instead of one join per tag.
+    Only exact data is ever used: until the index matches the database the
+    caller falls back to a single grouped subquery over poi_tag.
+    """
+
+    def __init__(self):
+        super().__init__('tag_bitmaps', TAG_INDEX_TABLES)
+
+    def load(self):
+        bitmaps = _Bitmaps()
+        bitmaps.load(db.session.execute(
+            select(PoiTag.poi_id, PoiTag.tag_id).execution_options(yield_per=5000)))
+        return bitmaps
+
+    def record(self, session):
+        operations = []
+        for objects, name in ((session.new, 'tag'), (session.deleted, 'untag')):
+            for obj in objects:
+                if isinstance(obj, PoiTag):
+                    operations.append((name, obj.poi_id, obj.tag_id))
+        return operations
+
+    def record_bulk(self, model, rows):
+        if model is not PoiTag:
+            return []
+        return [('tag', row['poi_id'], row['tag_id']) for row in rows]
+
+    def apply(self, bitmaps, operation):
+        name, poi_id, tag_id = operation
+        getattr(bitmaps, name)(poi_id, tag_id)
+
+    def match(self, tag_ids, mode):
+        """
+        POIs carrying all or any of the given tags.
+        Args:
+            tag_ids (list): Tag ids.
+            mode (str): 'all' or 'any'.
+        Returns:
+            tuple: (bits, bitmaps) where bits has the positions of the
+            matching POIs set, or None when the index is not available.
+        """
+        bitmaps = self.current(allow_stale=False)
+        if bitmaps is None:
+            return None
+        with self.lock:
+            return bitmaps.match(tag_ids, mode), bitmaps
+
+    def stats(self):
+        bitmaps = self._data
+        return {
+            **super().stats(),
+            'pois': len(bitmaps.positions) if bitmaps else 0,
+            'tags': len(bitmaps.tags) if bitmaps else 0,
+        }
+
+
+tag_bitmap_index = TagBitmapIndex()
+
+
+def tag_filter(tag_ids, mode):
+    """
+    Filter keeping the POIs that carry all or any of the given tags.
+
+    When the bitmap index is current and the match is small enough it is
+    sent as an id list, otherwise the condition is one grouped subquery
+    over poi_tag. A larger bitmap match is also returned as a TagMatch, so
+    list pages can test it in memory rather than run that subquery.
+    Args:
+        tag_ids (list): Distinct, existing tag ids; an empty list matches nothing.
+        mode (str): 'all' or 'any'.
+    Returns:
+        tuple: (condition, match). condition is an SQL condition on Poi.id;
+        match is a TagMatch when more than MAX_BITMAP_IDS POIs match, otherwise None.
+    """
+    if not tag_ids:
+        return false(), None
+    tagged = select(PoiTag.poi_id).where(PoiTag.tag_id.in_(tag_ids))
+    if mode == 'all':
+        tagged = tagged.group_by(PoiTag.poi_id).having(func.count() == len(tag_ids))
+    condition = Poi.id.in_(tagged)
+    matched = tag_bitmap_index.match(tag_ids, mode)
+    if matched is None:
+        return condition, None
+    bits, bitmaps = matched
+    if bits.bit_count() > MAX_BITMAP_IDS:
+        return condition, TagMatch(bits, bitmaps.positions, condition)
+    poi_ids = bitmaps.ids(bits)
+    return (Poi.id.in_(poi_ids) if poi_ids else false()), None
@@ -0,0 +1,222 @@
+import hashlib
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+from api.models import db, User, Country, City, Tag, Poi, PoiTag, PoiImage, Favorite, Visited
+from api.bulk import bulk_insert
+from api.geo import encode_geohash
+from api.passwords import password_hasher
+
+# Rows written and committed together.
+TEST_DATA_CHUNK_SIZE = 10000
+# Exponent of the Zipf-like weights of POIs, cities, tags and users: the
+# item ranked r gets weight 1 / r ** exponent.
+POPULARITY_EXPONENT = 1.1
+# Spread of the POIs around their city center and of the cities around
+# their country center, in degrees.
+POI_SPREAD = 0.05
+CITY_SPREAD = 4.0
+MAX_TAGS_PER_POI = 4
+# Rounds of draws per user when picking distinct POIs to interact with.
+INTERACTION_DRAWS = 4
+SEASONS = ('spring', 'summer', 'autumn', 'winter')
+TAG_WORDS = (
+    'beach', 'museum', 'park', 'castle', 'cathedral', 'market', 'viewpoint', 'garden',
+    'bridge', 'lake', 'mountain', 'waterfall', 'cave', 'island', 'harbour', 'palace',
+    'ruins', 'temple', 'gallery', 'zoo', 'aquarium', 'stadium', 'theatre', 'library',
+    'monument', 'square', 'street food', 'nightlife', 'hiking', 'cycling', 'family',
+    'history', 'architecture', 'nature', 'wildlife', 'shopping', 'wine', 'festival',
+)
+FIRST_NAMES = ('Ana', 'Luis', 'Marta', 'Jorge', 'Lucia', 'Pablo', 'Elena', 'Diego',
+               'Sara', 'Hugo', 'Noa', 'Leo', 'Irene', 'Mateo', 'Julia', 'Alex')
+TEST_USER_PASSWORD = 'test-password'
+# RFC 4122 variant: the first hex digit of the fourth group is 8, 9, a or b.
+VARIANT_DIGITS = {digit: '89ab'[int(digit, 16) % 4] for digit in '0123456789abcdef'}
+
+
+def _id(seed, kind, index):
+    """Deterministic UUID of the index-th generated row of a kind."""
+    digest = hashlib.md5(f'{seed}:{kind}:{index}'.encode()).hexdigest()
+    # Formatted by hand: building uuid.UUID objects costs more than the hash.
+    return f'{digest[:8]}-{digest[8:12]}-4{digest[13:16]}-{VARIANT_DIGITS[digest[16]]}{digest[17:20]}-{digest[20:]}'
+
+
+def _cum_weights(count, exponent=POPULARITY_EXPONENT):
+    return list(accumulate(1.0 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+
+class _Writer:
+    """Buffers rows per model; bulk inserts and commits them in chunks.
+
+    Buffers are always flushed together, in the order their models were first
+    added, so rows are written after the rows they reference.
+    """
+
+    def __init__(self, chunk_size, report):
+        self.chunk_size = chunk_size
+        self.report = report
+        self.rows = {}
+        self.counts = {}
+        self.started = time.monotonic()
+
+    def add(self, model, row):
+        rows = self.rows.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        written = []
+        for model, rows in self.rows.items():
+            if rows:
+                bulk_insert(model, rows)
+                self.rows[model] = []
+                name = model.__tablename__
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+                written.append(name)
+        db.session.commit()
+        if written:
+            totals = ', '.join(f'{name} {self.counts[name]}' for name in written)
+            self.report(f'{totals} ({time.monotonic() - self.started:.0f}s)')
+
+
+def _interactions(rng, model, total, user_count, poi_ranking, poi_weights, user_weights,
+                  seed, writer):
+    """Spread total favorites or visits over users and POIs, both power-law distributed."""
+    per_user = array('l', [0]) * user_count
+    for user_index in rng.choices(range(user_count), cum_weights=user_weights, k=total):
+        per_user[user_index] += 1
+    for user_index, count in enumerate(per_user):
+        if not count:
+            continue
+        user_id = _id(seed, 'user', user_index)
+        # Popular POIs get drawn again and again; redraw a few times to get
+        # close to count distinct ones.
+        ranks = set()
+        for _ in range(INTERACTION_DRAWS):
+            if len(ranks) >= count:
+                break
+            ranks.update(rng.choices(range(len(poi_ranking)), cum_weights=poi_weights,
+                                     k=count - len(ranks)))
+        for rank in sorted(ranks):
+            writer.add(model, {'user_id': user_id, 'poi_id': _id(seed, 'poi', poi_ranking[rank])})
+    writer.flush()
+
+
+def generate_test_data(countries=10, cities=200, pois=10000, tags=30, users=1000,
+                       images_per_poi=2, favorites=20000, visits=50000, seed=42,
+                       chunk_size=TEST_DATA_CHUNK_SIZE, report=print):
+    """
+    Fill an empty database with a reproducible synthetic dataset.
+
+    Every random choice comes from one generator seeded with seed, and row
+    ids are derived from the seed too, so the same arguments always produce
+    the same rows; only the users' password hash is salted at random. Cities
+    are scattered around their country's center and POIs around their city's
+    center. Big cities get more POIs. Favorites and visits follow power laws
+    over both users and POIs, with the popular POIs shuffled across cities.
+    Rows go through api.bulk, so search entries, popularity counters and
+    table versions are maintained as they are written.
+    Args:
+        countries, cities, pois, tags, users (int): Rows to create of each.
+        images_per_poi (int): Images attached to every POI.
+        favorites, visits (int): Interactions to create. A user never gets
+            the same POI twice, so the heaviest users may end up with fewer.
+        seed (int): Seed of the generator.
+        chunk_size (int): Rows per bulk insert and commit.
+        report: Called with a progress line after each chunk.
+    Raises:
+        ValueError: If the database already has users or countries, or a
+            size is inconsistent (cities without countries, POIs without cities).
+    Returns:
+        dict: Rows written per table.
+    """
+    if db.session.execute(select(Country.id).limit(1)).first() or \
+            db.session.execute(select(User.id).limit(1)).first():
+        raise ValueError('the database already has data; use an empty database')
+    if (cities and not countries) or (pois and not cities) or tags > len(TAG_WORDS) * 100:
+        raise ValueError('cities need countries, POIs need cities, and at most '
+                         f'{len(TAG_WORDS) * 100} tags can be named')
+    rng = random.Random(seed)
+    writer = _Writer(chunk_size, report)
+
+    country_centers = []
+    for index in range(countries):
+        country_centers.append((rng.uniform(-50, 60), rng.uniform(-170, 170)))
+        writer.add(Country, {'id': _id(seed, 'country', index), 'name': f'Country {index + 1}',
+                             'img': f'https://picsum.photos/seed/country-{seed}-{index}/800/600'})
+    writer.flush()
+
+    tag_ids = [_id(seed, 'tag', index) for index in range(tags)]
+    for index, tag_id in enumerate(tag_ids):
+        word = TAG_WORDS[index % len(TAG_WORDS)]
+        name = word if index < len(TAG_WORDS) else f'{word} {index // len(TAG_WORDS) + 1}'
+        writer.add(Tag, {'id': tag_id, 'name': name})
+    writer.flush()
+
+    city_centers = []
+    for index in range(cities):
+        country_index = index % countries
+        latitude, longitude = country_centers[country_index]
+        city_centers.append((
+            _clamp(rng.gauss(latitude, CITY_SPREAD), -85, 85),
+            _clamp(rng.gauss(longitude, CITY_SPREAD), -179, 179)))
+        writer.add(City, {'id': _id(seed, 'city', index), 'name': f'City {index + 1}',
+                          'season': rng.choice(SEASONS),
+                          'country_id': _id(seed, 'country', country_index)})
+    writer.flush()
+
+    city_weights = _cum_weights(cities)
+    tag_weights = _cum_weights(tags)
+    for index in range(pois):
+        poi_id = _id(seed, 'poi', index)
+        city_index = rng.choices(range(cities), cum_weights=city_weights)[0]
+        center_latitude, center_longitude = city_centers[city_index]
+        latitude = _clamp(rng.gauss(center_latitude, POI_SPREAD), -90, 90)
+        longitude = _clamp(rng.gauss(center_longitude, POI_SPREAD), -180, 180)
+        writer.add(Poi, {
+            'id': poi_id, 'name': f'Poi {index + 1}',
+            'description': f'Synthetic point of interest number {index + 1}.',
+            'latitude': latitude, 'longitude': longitude,
+            'geohash': encode_geohash(latitude, longitude),
+            'city_id': _id(seed, 'city', city_index)})
+        if tags:
+            picked = rng.choices(range(tags), cum_weights=tag_weights,
+                                 k=rng.randint(1, MAX_TAGS_PER_POI))
+            for tag_index in sorted(set(picked)):
+                writer.add(PoiTag, {'poi_id': poi_id, 'tag_id': tag_ids[tag_index]})
+        for image in range(images_per_poi):
+            writer.add(PoiImage, {'id': _id(seed, 'poi_image', index * images_per_poi + image),
+                                  'url': f'https://picsum.photos/seed/poi-{seed}-{index}-{image}/800/600',
+                                  'poi_id': poi_id})
+    writer.flush()
+
+    # Hashing is deliberately slow, so every user shares one hash.
+    password = generate_password_hash(TEST_USER_PASSWORD, method=password_hasher.method)
+    epoch = datetime(1950, 1, 1)
+    for index in range(users):
+        writer.add(User, {
+            'id': _id(seed, 'user', index), 'name': rng.choice(FIRST_NAMES),
+            'user_name': f'user{index + 1}', 'email': f'user{index + 1}@example.com',
+            'password': password, 'role': 'user', 'location': None, 'img': None,
+            'birth_date': epoch + timedelta(days=rng.randrange(365 * 55))})
+    writer.flush()
+
+    if pois and users:
+        poi_ranking = array('l', range(pois))
+        rng.shuffle(poi_ranking)
+        poi_weights = _cum_weights(pois)
+        user_weights = _cum_weights(users)
+        _interactions(rng, Favorite, favorites, users, poi_ranking, poi_weights, user_weights,
+                      seed, writer)
+        _interactions(rng, Visited, visits, users, poi_ranking, poi_weights, user_weights,
+                      seed, writer)
+    return writer.counts
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from api.models import db, User
+
+# Seconds a looked-up user is trusted without asking the database again.
+# Bounds how long a user deleted through another worker stays logged in.
+USER_CACHE_TTL = 30
+# Users kept per worker; the least recently used are dropped first.
+USER_CACHE_SIZE = 10000
+# Session key of the user ids changed by the current transaction.
+CHANGED_USERS_KEY = 'api.user_cache.changed'
+
+
+class UserCache:
+    """Per-worker cache of which JWT identities belong to existing users.
+
+    Protected routes mostly need the user id, which the token already
+    carries; the cache only saves confirming that the user still exists.
+    Users updated or deleted through this worker are dropped when the
+    transaction commits; changes made by other workers are seen once the
+    entry is older than USER_CACHE_TTL. Unknown ids are never cached.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._expiry = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, user_id):
+        """Whether a user with this id exists, from the cache when fresh enough."""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._expiry.get(user_id)
+            if expires_at is not None and expires_at > now:
+                self._expiry.move_to_end(user_id)
+                self.hits += 1
+                return True
+        self.misses += 1
+        found = db.session.execute(select(User.id).where(User.id == user_id)).first() is not None
+        if found:
+            with self._lock:
+                self._expiry[user_id] = now + self.ttl
+                self._expiry.move_to_end(user_id)
+                while len(self._expiry) > self.size:
+                    self._expiry.popitem(last=False)
+        return found
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._expiry.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changed_users(session, flush_context):
+    changed = [obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault(CHANGED_USERS_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop(CHANGED_USERS_KEY, None)
+    if changed:
+        user_cache.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop(CHANGED_USERS_KEY, None)
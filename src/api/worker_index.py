@@ -0,0 +1,198 @@
+import threading
+import time
+from flask import current_app, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.bulk import on_bulk_insert, on_bulk_update
+from api.table_versions import changed_tables, get_table_versions
+
+
+class WorkerIndex:
+    """Base of the per-worker in-memory indexes derived from database tables.
+
+    Subclasses implement load(), record() and apply(). Writes committed
+    through this worker's session are recorded at flush time and applied
+    incrementally right after the commit, together with the table version
+    bumps they caused. Writes from other workers leave the versions apart;
+    this is checked once per request and triggers a rebuild in a background
+    thread. Only the first use of an index in a worker may wait for a build.
+    """
+
+    def __init__(self, name, tables, max_operations=None):
+        """
+        Args:
+            name (str): Short name used for the request and session keys and in logs.
+            tables (tuple): Tables the index is derived from.
+            max_operations (int): Largest committed batch replayed on the index;
+                bigger ones leave it stale for the background rebuild.
+        """
+        self.name = name
+        self.tables = tables
+        self.max_operations = max_operations
+        self.lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+        self._data = None
+        self._versions = None
+        self._built_at = None
+        self._rebuilding = False
+        self._checked_key = f'api.{name}.checked'
+        self._session_key = f'api.{name}.pending'
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        on_bulk_insert(self._after_bulk_insert)
+        on_bulk_update(self._after_bulk_update)
+
+    def load(self):
+        """Build the index data from the database."""
+        raise NotImplementedError
+
+    def record(self, session):
+        """Return the operations describing what the flushing session wrote."""
+        return []
+
+    def record_bulk(self, model, rows):
+        """Return the operations describing rows written by bulk_insert."""
+        return []
+
+    def prepare(self, data, operations):
+        """Compute, without holding the lock, what applying operations to data needs."""
+        return None
+
+    def install(self, data, prepared):
+        """Put what prepare computed in place, under the lock, before the operations are applied."""
+
+    def apply(self, data, operation):
+        """Apply one recorded operation to the index data."""
+        raise NotImplementedError
+
+    def is_stale(self, versions):
+        """Whether data built at self._versions must be rebuilt to match versions."""
+        return self._versions != versions
+
+    def age(self):
+        """Seconds since the current data was loaded."""
+        return time.monotonic() - self._built_at
+
+    def _build(self, versions):
+        # versions were read before the rows, so a write committed meanwhile
+        # leaves the new data stale (and rebuilt again) rather than lost.
+        data = self.load()
+        with self.lock:
+            self._data = data
+            self._versions = dict(versions)
+            self._built_at = time.monotonic()
+            self.builds += 1
+        return data
+
+    def _rebuild_in_background(self, versions):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        app = current_app._get_current_object()
+
+        def rebuild():
+            try:
+                with app.app_context():
+                    self._build(versions)
+            except Exception:
+                app.logger.exception(f'rebuilding the {self.name} index')
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    def current(self, allow_stale=True):
+        """
+        Return the index data, checking the table versions once per request.
+        Args:
+            allow_stale (bool): Serve the previous data while a rebuild runs;
+                when False, None is returned until the data matches the database.
+        Returns:
+            The index data, or None.
+        """
+        data = self._data
+        if data is not None and has_request_context() and \
+                request.environ.get(self._checked_key, False):
+            return data
+        versions = dict(zip(self.tables, get_table_versions(self.tables)))
+        with self.lock:
+            data = self._data
+            if data is None and allow_stale:
+                data = self._build(versions)
+            elif data is None or self.is_stale(versions):
+                self._rebuild_in_background(versions)
+                if not allow_stale:
+                    return None
+                return data
+        if has_request_context():
+            request.environ[self._checked_key] = True
+        return data
+
+    def invalidate(self):
+        """Drop the index; the next use rebuilds it."""
+        with self.lock:
+            self._data = None
+
+    def stats(self):
+        """
+        Report the counters of this worker's index.
+        Returns:
+            dict: Builds, incremental updates and whether the index is loaded.
+        """
+        return {'builds': self.builds, 'updates': self.updates, 'loaded': self._data is not None}
+
+    def _after_flush(self, session, flush_context):
+        operations = self.record(session)
+        tables = changed_tables(session).intersection(self.tables)
+        if operations or tables:
+            pending = session.info.setdefault(self._session_key, ([], []))
+            pending[0].extend(operations)
+            pending[1].append(tables)
+
+    def _after_bulk_insert(self, session, model, rows):
+        self._record_bulk_write(session, model, self.record_bulk(model, rows))
+
+    def _after_bulk_update(self, session, model, rows):
+        # Bulk updates never touch the columns indexes are built from (names,
+        # parents, keys); only the version bump has to be accounted for.
+        self._record_bulk_write(session, model, [])
+
+    def _record_bulk_write(self, session, model, operations):
+        tables = {model.__tablename__}.intersection(self.tables)
+        if operations or tables:
+            pending = session.info.setdefault(self._session_key, ([], []))
+            pending[0].extend(operations)
+            pending[1].append(tables)
+
+    def _after_commit(self, session):
+        operations, flushed_tables = session.info.pop(self._session_key, ([], []))
+        if not operations and not flushed_tables:
+            return
+        if self.max_operations is not None and len(operations) > self.max_operations:
+            # Replaying a bulk write would hold the lock readers wait on; the
+            # versions stay behind so the next request rebuilds the index instead.
+            return
+        # Writers take turns, so the data only changes under the lock below
+        # and readers keep being served while prepare runs.
+        with self._write_lock:
+            data = self._data
+            if data is None:
+                return
+            prepared = self.prepare(data, operations)
+            with self.lock:
+                if self._data is not data:
+                    # Rebuilt meanwhile; its versions decide whether it holds these writes.
+                    return
+                self.install(data, prepared)
+                for operation in operations:
+                    self.apply(data, operation)
+                # Versions are bumped once per committed transaction, not per flush.
+                for table_name in set().union(*flushed_tables):
+                    self._versions[table_name] += 1
+                self.updates += 1
+
+    def _after_rollback(self, session):
+        session.info.pop(self._session_key, None)
@@ -10,6 +10,12 @@ from api.models import db
 from api.routes import api
 from api.admin import setup_admin
 from api.commands import setup_commands
+from api.search import include_in_autogenerate
+from api.metrics import setup_metrics
+from api.sql_stats import setup_sql_stats
+from api.db_pool import engine_options, DATABASE_BUSY_MESSAGE
+from api.passwords import password_hasher
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from flask_jwt_extended import JWTManager
 
 
@@ -29,9 +35,21 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-MIGRATE = Migrate(app, db, compare_type=True)
+# pool size/overflow/timeout/recycle/pre-ping and the Postgres statement
+# timeout come from the DB_* environment variables, see api/db_pool.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'], os.environ)
+MIGRATE = Migrate(app, db, compare_type=True,
+                  include_object=include_in_autogenerate)
 db.init_app(app)
 
+# password hashing: method and cost of new hashes, pool processes, queue limit
+app.config['PASSWORD_HASH_METHOD'] = os.getenv("PASSWORD_HASH_METHOD")
+app.config['PASSWORD_HASH_WORKERS'] = os.getenv("PASSWORD_HASH_WORKERS")
+app.config['PASSWORD_HASH_QUEUE_LIMIT'] = os.getenv("PASSWORD_HASH_QUEUE_LIMIT")
+password_hasher.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                          app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+
 #JWT configuration
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 jwt = JWTManager(app)
@@ -45,6 +63,15 @@ setup_commands(app)
 # Add all endpoints form the API with a "api" prefix
 app.register_blueprint(api, url_prefix='/api')
 
+# SQL accounting: slow-query threshold in milliseconds, N+1 warnings, debug headers
+app.config['SLOW_QUERY_MS'] = os.getenv("SLOW_QUERY_MS")
+setup_sql_stats(app)
+
+# request metrics, served on /metrics for Prometheus to scrapers sending METRICS_TOKEN
+app.config['METRICS_DIR'] = os.getenv("METRICS_DIR")
+app.config['METRICS_TOKEN'] = os.getenv("METRICS_TOKEN")
+setup_metrics(app)
+
 # Handle/serialize errors like a JSON object
 
 
@@ -52,6 +79,13 @@ app.register_blueprint(api, url_prefix='/api')
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+# no free database connection within DB_POOL_TIMEOUT
+
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(error):
+    return handle_invalid_usage(APIException(DATABASE_BUSY_MESSAGE, status_code=503))
+
 # generate sitemap with all your endpoints
 
 
@@ -0,0 +1,422 @@
+"""
+In-process benchmark of every route of the api blueprint.
+
+Each dataset size runs in its own process against its own database, seeded
+once with the insert-test-data generator and reused by later runs. Routes are
+called through the Flask test client, so the numbers cover routing, queries
+and serialization but no network or WSGI server.
+
+    python src/benchmark.py --sizes 1000,100000 --output benchmarks/baseline.json
+    python src/benchmark.py --sizes 1000 --compare benchmarks/baseline.json
+
+SQLite databases are kept in --data-dir; for Postgres pass a URL template
+such as --database-url 'postgresql://localhost/bench_{size}' (the databases
+must exist and be empty or previously seeded with the same --seed).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = '1000,100000,1000000'
+# Timed requests per route and untimed ones sent first to warm the caches.
+DEFAULT_ITERATIONS = 50
+DEFAULT_WARMUP = 5
+# Relative p50 slowdown (and absolute, in ms) reported as a regression.
+REGRESSION_RATIO = 0.25
+REGRESSION_MIN_MS = 1.0
+PERCENTILES = (50, 90, 95, 99)
+
+Step = namedtuple('Step', ['method', 'path', 'json', 'auth', 'variant'], defaults=(None, False, None))
+Case = namedtuple('Case', ['steps', 'iterations'], defaults=(None,))
+
+
+def dataset_sizes(pois):
+    """Arguments of generate_test_data for a catalog of the given number of POIs."""
+    return {
+        'countries': max(2, pois // 20000), 'cities': max(10, pois // 200), 'pois': pois,
+        'tags': 30, 'users': max(50, pois // 20), 'images_per_poi': 2,
+        'favorites': pois // 2, 'visits': pois,
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# ---------------------------------------------------------------- child side
+
+def _fixtures(app, client, seed):
+    """Pick the ids and names the benchmarked requests refer to."""
+    from sqlalchemy import select
+    from api.models import db, Poi, City, Country, Tag, PoiImage, User
+    from api.popularity import popular_poi_ids
+    from api.recommendations import seen_pois
+    from api.test_data import TEST_USER_PASSWORD
+
+    poi_id = popular_poi_ids(1)[0]
+    poi = db.session.execute(
+        select(Poi.id, Poi.name, Poi.latitude, Poi.longitude, Poi.city_id, City.name, Country.name)
+        .join(City, City.id == Poi.city_id).join(Country, Country.id == City.country_id)
+        .where(Poi.id == poi_id)).one()
+    user = db.session.execute(select(User.id, User.user_name).order_by(User.user_name).limit(1)).one()
+    seen = seen_pois(user.id)
+    fresh_pois = [candidate for candidate in db.session.execute(
+        select(Poi.id).order_by(Poi.id).limit(len(seen) + 500)).scalars() if candidate not in seen]
+    tags = db.session.execute(select(Tag.name).order_by(Tag.name).limit(2)).scalars().all()
+    image_id = db.session.execute(
+        select(PoiImage.id).where(PoiImage.poi_id == poi_id).limit(1)).scalar()
+    response = client.post('/api/login', json={'credential': user.user_name, 'password': TEST_USER_PASSWORD})
+    if response.status_code != 200:
+        raise RuntimeError(f'cannot log in the benchmark user: {response.get_json()}')
+    db.session.remove()
+    return {
+        'poi': poi, 'user': user, 'fresh_pois': fresh_pois, 'tags': tags, 'image_id': image_id,
+        'token': response.get_json()['access_token'], 'seed': seed,
+    }
+
+
+def _once(step):
+    yield step
+
+
+def _read_cases(f):
+    poi = f['poi']
+    lat, lon = poi.latitude, poi.longitude
+    bbox = f'{lon - 0.5},{lat - 0.5},{lon + 0.5},{lat + 0.5}'
+    reads = [
+        Step('GET', '/api/pois?limit=20', variant='page'),
+        Step('GET', '/api/pois?limit=20&fields=name,latitude,longitude', variant='fields'),
+        Step('GET', f'/api/pois?limit=20&q={poi.name}', variant='q'),
+        Step('GET', f"/api/pois?limit=20&tags={','.join(f['tags'])}", variant='tags'),
+        Step('GET', f'/api/pois?limit=20&country_name={poi[6]}&city_name={poi[5]}', variant='city'),
+        Step('GET', f'/api/pois?limit=20&bbox={bbox}', variant='bbox'),
+        Step('GET', f'/api/pois?limit=20&near={lat},{lon}&radius_km=5', variant='near'),
+        Step('GET', '/api/pois/facets'),
+        Step('GET', f"/api/pois/facets?tags={f['tags'][0]}", variant='tags'),
+        Step('GET', f"/api/pois/{poi.id}"),
+        Step('GET', f"/api/pois/{poi.id}/similar"),
+        Step('GET', f"/api/pois/{poi.id}/tags"),
+        Step('GET', f"/api/pois/{poi.id}/poiimages"),
+        Step('GET', '/api/popular-pois'),
+        Step('GET', '/api/autocomplete?q=cit'),
+        Step('GET', '/api/autocomplete/stats'),
+        Step('GET', '/api/reference-cache/stats'),
+        Step('GET', '/api/countries'),
+        Step('GET', f'/api/countries/{poi[6]}'),
+        Step('GET', f'/api/{poi[6]}/cities'),
+        Step('GET', '/api/cities?limit=50'),
+        Step('GET', f'/api/cities/{poi.city_id}'),
+        Step('GET', '/api/tags'),
+        Step('GET', f"/api/tags/{f['tags'][0]}"),
+        Step('GET', '/api/poiimages?limit=50'),
+        Step('GET', f"/api/poiimages/{f['image_id']}"),
+        Step('GET', '/api/users?limit=50'),
+        Step('GET', '/api/myProfile', auth=True),
+        Step('GET', '/api/favorites', auth=True),
+        Step('GET', '/api/visited', auth=True),
+        Step('GET', '/api/recommendations', auth=True),
+    ]
+    cases = [Case(lambda i, step=step: _once(step)) for step in reads]
+    # A full dump is far slower than everything else; once is enough.
+    cases.append(Case(lambda i: _once(Step('GET', '/api/export/pois?format=ndjson')), iterations=1))
+    return cases
+
+
+def _write_cases(f):
+    """Cycles that create and then remove what they wrote, leaving the dataset unchanged."""
+    poi = f['poi']
+    country, city = poi[6], poi[5]
+
+    def favorite_and_visit(i):
+        poi_id = f['fresh_pois'][i % len(f['fresh_pois'])]
+        yield Step('POST', '/api/favorites', {'poi_id': poi_id}, auth=True)
+        yield Step('DELETE', f'/api/favorites/{poi_id}', auth=True)
+        yield Step('POST', '/api/visited', {'poi_id': poi_id}, auth=True)
+        yield Step('DELETE', f'/api/visited/{poi_id}', auth=True)
+
+    def poi_cycle(i):
+        name = f'Benchmark POI {i}'
+        response = yield Step('POST', '/api/pois', {
+            'name': name, 'description': 'Benchmark', 'latitude': poi.latitude, 'longitude': poi.longitude,
+            'country_name': country, 'city_name': city, 'tags': f['tags'][:1], 'poiimages': ['https://example.com/a.jpg']})
+        poi_id = response.get_json()['created'][0]['id']
+        yield Step('PUT', f'/api/pois/{poi_id}', {'description': f'Benchmark {i}'})
+        response = yield Step('POST', '/api/poiimages', {'url': 'https://example.com/b.jpg', 'poi_id': poi_id})
+        yield Step('DELETE', f"/api/poiimages/{response.get_json()['created'][0]['id']}")
+        yield Step('POST', f"/api/pois/{poi_id}/tags/{f['tags'][1]}")
+        yield Step('DELETE', f"/api/pois/{poi_id}/tags/{f['tags'][1]}")
+        yield Step('DELETE', f'/api/pois/{poi_id}')
+
+    def reference_cycle(i):
+        tag = f'benchmark tag {i}'
+        yield Step('POST', '/api/tags', {'name': tag})
+        yield Step('DELETE', f'/api/tags/{tag}')
+        name = f'Benchmark country {i}'
+        yield Step('POST', '/api/countries', {'name': name, 'img': 'https://example.com/c.jpg'})
+        yield Step('PUT', f'/api/countries/{name}', {'img': 'https://example.com/d.jpg'})
+        response = yield Step('POST', '/api/cities', {'name': f'Benchmark city {i}', 'season': 'summer', 'country_name': name})
+        city_id = response.get_json()['created'][0]['id']
+        yield Step('PUT', f'/api/cities/{city_id}', {'season': 'winter'})
+        yield Step('DELETE', f'/api/cities/{city_id}')
+        yield Step('DELETE', f'/api/countries/{name}')
+
+    def account_cycle(i):
+        yield Step('POST', '/api/login', {'credential': f['user'].user_name, 'password': 'test-password'})
+        yield Step('PUT', '/api/myProfile', {'location': f'Benchmark {i % 2}'}, auth=True)
+        for path in ('/api/register', '/api/users'):
+            user_name = f"bench{path.rsplit('/', 1)[1]}{i}"
+            yield Step('POST', path, {'name': 'Bench', 'user_name': user_name, 'email': f'{user_name}@example.com',
+                                      'password': 'benchmark', 'birth_date': '01/01/1990', 'role': 'user'})
+            yield Step('DELETE', f'/api/users/{user_name}')
+
+    return [Case(favorite_and_visit), Case(poi_cycle), Case(reference_cycle), Case(account_cycle)]
+
+
+def run_size(size, data_url, iterations, warmup, seed):
+    """Seed the database if needed and benchmark every case; runs in the child process."""
+    os.environ['DATABASE_URL'] = data_url
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-benchmark-secret-key')
+    from sqlalchemy import event, select
+    from flask_migrate import upgrade
+    from app import app
+    from api.models import db, Poi
+    from api.test_data import generate_test_data
+    from api.recommendations import rebuild_similarities
+
+    app.logger.disabled = True
+    client = app.test_client()
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        seeding_seconds = None
+        if db.session.execute(select(Poi.id).limit(1)).first() is None:
+            seeded_at = time.monotonic()
+            generate_test_data(**dataset_sizes(size), seed=seed, report=lambda line: None)
+            with db.engine.begin() as connection:
+                rebuild_similarities(connection)
+            seeding_seconds = round(time.monotonic() - seeded_at, 1)
+        fixtures = _fixtures(app, client, seed)
+        engine = db.engine
+    headers = {'Authorization': f"Bearer {fixtures['token']}"}
+    adapter = app.url_map.bind('localhost')
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count_statement)
+
+    def send(step):
+        path = step.path.split('?', 1)[0]
+        rule, _ = adapter.match(path, method=step.method, return_rule=True)
+        label = f'{step.method} {rule.rule}' + (f' [{step.variant}]' if step.variant else '')
+        statements[0] = 0
+        started = time.perf_counter()
+        response = client.open(step.path, method=step.method, json=step.json,
+                               headers=headers if step.auth else None)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        return label, response, elapsed, statements[0]
+
+    def drive(case, iteration, on_response):
+        steps = case.steps(iteration)
+        response = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration:
+                return
+            label, response, elapsed, sql = send(step)
+            on_response(label, response, elapsed, sql)
+            if response.status_code >= 400:
+                # Later steps depend on this one; drop the rest of the cycle.
+                steps.close()
+                return
+
+    results = {}
+
+    def record(label, response, elapsed, sql):
+        entry = results.setdefault(label, {'latencies': [], 'sql': [], 'errors': 0, 'peak': 0})
+        entry['latencies'].append(elapsed * 1000)
+        entry['sql'].append(sql)
+        if response.status_code >= 400:
+            entry['errors'] += 1
+            entry['error_sample'] = f'{response.status_code} {response.get_data(as_text=True)[:200]}'
+
+    cases = _read_cases(fixtures) + _write_cases(fixtures)
+    iteration = 0
+    for case in cases:
+        count = case.iterations or iterations
+        for _ in range(warmup if case.iterations is None else 0):
+            drive(case, iteration, lambda *args: None)
+            iteration += 1
+        for _ in range(count):
+            drive(case, iteration, record)
+            iteration += 1
+
+    # Peak Python allocations, in a separate pass: tracing slows everything down.
+    tracemalloc.start()
+
+    def record_peak(label, response, elapsed, sql):
+        entry = results.get(label)
+        if entry is not None:
+            entry['peak'] = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    for case in cases:
+        tracemalloc.reset_peak()
+        drive(case, iteration, record_peak)
+        iteration += 1
+    tracemalloc.stop()
+
+    routes = {}
+    for label, entry in sorted(results.items()):
+        latencies = sorted(entry['latencies'])
+        routes[label] = {
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            **{f'p{pct}_ms': round(percentile(latencies, pct), 3) for pct in PERCENTILES},
+            'max_ms': round(latencies[-1], 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'sql_statements': statistics.median_low(entry['sql']),
+            'sql_statements_max': max(entry['sql']),
+            'peak_python_kb': round(entry['peak'] / 1024, 1),
+        }
+        if 'error_sample' in entry:
+            routes[label]['error_sample'] = entry['error_sample']
+    measured = {label.split(' [')[0] for label in routes}
+    expected = set()
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.startswith('api.'):
+            for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+                expected.add(f'{method} {rule.rule}')
+    return {
+        'pois': size, 'dialect': engine.dialect.name, 'seeding_seconds': seeding_seconds,
+        'dataset': dataset_sizes(size), 'routes': routes,
+        'not_benchmarked': sorted(expected - measured),
+    }
+
+
+# --------------------------------------------------------------- parent side
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """
+    List the routes whose p50 latency or SQL statement count got worse.
+    Args:
+        baseline (dict): A previous benchmark report.
+        current (dict): The new report.
+    Returns:
+        list: Human-readable lines, one per regression.
+    """
+    regressions = []
+    for size, result in current['sizes'].items():
+        before = baseline.get('sizes', {}).get(size)
+        if before is None:
+            continue
+        for label, stats in result['routes'].items():
+            old = before['routes'].get(label)
+            if old is None:
+                continue
+            slower = stats['p50_ms'] - old['p50_ms']
+            if slower > REGRESSION_MIN_MS and stats['p50_ms'] > old['p50_ms'] * (1 + REGRESSION_RATIO):
+                regressions.append(f"{size} POIs {label}: p50 {old['p50_ms']:.2f} -> {stats['p50_ms']:.2f} ms")
+            if stats['sql_statements'] > old['sql_statements']:
+                regressions.append(f"{size} POIs {label}: SQL statements "
+                                   f"{old['sql_statements']} -> {stats['sql_statements']}")
+    return regressions
+
+
+def _print_result(size, result):
+    seeding = 'reused database' if result['seeding_seconds'] is None else f"seeded in {result['seeding_seconds']}s"
+    print(f"\n{size} POIs ({result['dialect']}, {seeding})")
+    print(f"{'route':<58}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>5}{'peak kB':>10}{'err':>5}")
+    for label, stats in result['routes'].items():
+        print(f"{label:<58}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['sql_statements']:>5}{stats['peak_python_kb']:>10.0f}{stats['errors']:>5}")
+    if result['not_benchmarked']:
+        print('not benchmarked: ' + ', '.join(result['not_benchmarked']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated POI counts.')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'api-benchmark'),
+                        help='Where the SQLite databases are kept between runs.')
+    parser.add_argument('--database-url', help="URL template with {size}, e.g. postgresql://localhost/bench_{size}.")
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Previous JSON report to compare against.')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on regressions.')
+    parser.add_argument('--run-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_size:
+        result = run_size(args.run_size, args.database_url, args.iterations, args.warmup, args.seed)
+        with open(args.result_file, 'w') as result_file:
+            json.dump(result, result_file)
+        return 0
+
+    report = {
+        'commit': _git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations, 'warmup': args.warmup, 'seed': args.seed,
+        'sizes': {},
+    }
+    os.makedirs(args.data_dir, exist_ok=True)
+    for size in (int(value) for value in args.sizes.split(',')):
+        if args.database_url:
+            data_url = args.database_url.format(size=size)
+        else:
+            data_url = f"sqlite:///{os.path.join(args.data_dir, f'benchmark-{size}-seed{args.seed}.db')}"
+        with tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__), '--run-size', str(size),
+                '--database-url', data_url, '--iterations', str(args.iterations),
+                '--warmup', str(args.warmup), '--seed', str(args.seed),
+                '--result-file', result_file.name], check=True)
+            with open(result_file.name) as written:
+                result = json.load(written)
+        report['sizes'][str(size)] = result
+        _print_result(size, result)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), report)
+        print('\nRegressions against ' + args.compare + ':' if regressions else '\nNo regressions against ' + args.compare)
+        for line in regressions:
+            print('  ' + line)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
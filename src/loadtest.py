@@ -0,0 +1,385 @@
+"""
+End-to-end load test of the API under gunicorn.
+
+Starts wsgi:application under gunicorn against an already seeded database
+(see flask insert-test-data) and replays a traffic mix from many concurrent
+asyncio clients, spread over several client processes so the load generator
+is not the bottleneck. Reports throughput and p50/p95/p99 latency per route, leaving out a
+warm-up period during which the workers build their in-memory indexes.
+
+    python src/loadtest.py --database-url sqlite:////tmp/api.db --workers 4 --clients 64
+    python src/loadtest.py --url http://127.0.0.1:3001 --duration 60
+
+Every client logs in as one of the generated users and then loops over
+actions picked at random with the weights of TRAFFIC_MIX. Favorites and
+visits added by a client are removed again when it stops.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+# Relative weight of each client action.
+TRAFFIC_MIX = {
+    'home': 30,
+    'search': 25,
+    'detail': 25,
+    'login': 4,
+    'favorite': 8,
+    'visited': 8,
+}
+DEFAULT_PASSWORD = 'test-password'
+# Seconds to wait for gunicorn to answer its first request.
+STARTUP_TIMEOUT = 60
+REQUEST_TIMEOUT = 30
+PERCENTILES = (50, 95, 99)
+
+
+class HttpError(Exception):
+    """The server closed the connection or sent something unparseable."""
+
+
+class Connection:
+    """Minimal HTTP/1.1 client over one keep-alive connection, reopened when the server closes it."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, token=None):
+        """
+        Send one request and read the whole response.
+        Returns:
+            tuple: (status code, parsed JSON body or None, body size in bytes).
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = b'' if body is None else json.dumps(body).encode()
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                f'Content-Length: {len(payload)}']
+        if body is not None:
+            head.append('Content-Type: application/json')
+        if token:
+            head.append(f'Authorization: Bearer {token}')
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError('connection closed')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        parsed = None
+        if data and headers.get('content-type', '').startswith('application/json'):
+            parsed = json.loads(data)
+        return status, parsed, len(data)
+
+
+class Client:
+    """One simulated user: logs in, then performs weighted random actions."""
+
+    def __init__(self, connection, fixtures, rng, record):
+        self.connection = connection
+        self.fixtures = fixtures
+        self.rng = rng
+        self.record = record
+        self.token = None
+        self.user_name = rng.choice(fixtures['users'])
+        # POIs this client added to its favorites / visited, to toggle back.
+        self.added = {'favorites': set(), 'visited': set()}
+
+    async def call(self, label, method, path, body=None, auth=False):
+        started = time.perf_counter()
+        try:
+            status, data, size = await asyncio.wait_for(
+                self.connection.request(method, path, body, self.token if auth else None),
+                REQUEST_TIMEOUT)
+        except (OSError, HttpError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            await self.connection.close()
+            status, data, size = 0, None, 0
+        self.record(label, time.perf_counter() - started, status, size)
+        return status, data
+
+    async def home(self):
+        await self.call('GET /api/popular-pois', 'GET', '/api/popular-pois?sample_from=50')
+
+    async def search(self):
+        f = self.fixtures
+        kind = self.rng.random()
+        if kind < 0.5:
+            path = f"/api/pois?limit=20&q={quote(self.rng.choice(f['pois'])['name'])}"
+        elif kind < 0.75:
+            path = f"/api/pois?limit=20&tags={quote(self.rng.choice(f['tags']))}"
+        else:
+            poi = self.rng.choice(f['pois'])
+            path = f"/api/pois?limit=20&near={poi['latitude']},{poi['longitude']}&radius_km=10"
+        await self.call('GET /api/pois', 'GET', path)
+
+    async def detail(self):
+        poi_id = self.rng.choice(self.fixtures['pois'])['id']
+        await self.call('GET /api/pois/<poi_id>', 'GET', f'/api/pois/{poi_id}')
+        await self.call('GET /api/pois/<poi_id>/similar', 'GET', f'/api/pois/{poi_id}/similar')
+
+    async def login(self):
+        status, data = await self.call('POST /api/login', 'POST', '/api/login', {
+            'credential': self.user_name, 'password': self.fixtures['password']})
+        if status == 200:
+            self.token = data['access_token']
+
+    async def toggle(self, collection):
+        if self.token is None:
+            return await self.login()
+        added = self.added[collection]
+        if added and self.rng.random() < 0.5:
+            poi_id = added.pop()
+            await self.call(f'DELETE /api/{collection}/<poi_id>', 'DELETE',
+                            f'/api/{collection}/{poi_id}', auth=True)
+        else:
+            poi_id = self.rng.choice(self.fixtures['pois'])['id']
+            if poi_id in added:
+                return
+            status, _ = await self.call(f'POST /api/{collection}', 'POST', f'/api/{collection}',
+                                        {'poi_id': poi_id}, auth=True)
+            if status < 300:
+                added.add(poi_id)
+
+    async def favorite(self):
+        await self.toggle('favorites')
+
+    async def visited(self):
+        await self.toggle('visited')
+
+    async def run(self, deadline):
+        actions = list(TRAFFIC_MIX)
+        weights = list(TRAFFIC_MIX.values())
+        await self.login()
+        while time.monotonic() < deadline:
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+
+    async def clean_up(self):
+        """Undo this client's favorites and visits; not recorded."""
+        self.record = lambda *args: None
+        for collection, poi_ids in self.added.items():
+            for poi_id in poi_ids:
+                await self.call('', 'DELETE', f'/api/{collection}/{poi_id}', auth=True)
+        await self.connection.close()
+
+
+def _client_process(host, port, clients, warmup, duration, fixtures, seed):
+    """Run clients concurrent clients for warmup + duration seconds in this process."""
+    results = {}
+    measure_from = time.monotonic() + warmup
+
+    def record(label, elapsed, status, size):
+        if time.monotonic() < measure_from:
+            return
+        entry = results.setdefault(label, {'latencies': [], 'statuses': {}, 'bytes': 0})
+        entry['latencies'].append(elapsed)
+        entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+        entry['bytes'] += size
+
+    async def main():
+        deadline = measure_from + duration
+        rng = random.Random(seed)
+        users = [Client(Connection(host, port), fixtures, random.Random(rng.random()), record)
+                 for _ in range(clients)]
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        await asyncio.gather(*(user.clean_up() for user in users))
+
+    asyncio.run(main())
+    return results
+
+
+async def _fetch_fixtures(host, port, password):
+    connection = Connection(host, port)
+    try:
+        _, pois, _ = await connection.request('GET', '/api/pois?limit=1000&fields=name,latitude,longitude')
+        _, users, _ = await connection.request('GET', '/api/users?limit=500&fields=user_name')
+        _, tags, _ = await connection.request('GET', '/api/tags')
+    finally:
+        await connection.close()
+    fixtures = {
+        'pois': pois['pois'] if pois else [],
+        'users': [user['user_name'] for user in (users or {}).get('users', [])],
+        'tags': [tag['name'] for tag in (tags or {}).get('tags', [])],
+        'password': password,
+    }
+    if not fixtures['pois'] or not fixtures['users'] or not fixtures['tags']:
+        raise SystemExit('The database needs POIs, users and tags; seed it with flask insert-test-data')
+    return fixtures
+
+
+async def _wait_until_up(host, port, server):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {server.returncode}')
+        connection = Connection(host, port)
+        try:
+            status, _, _ = await connection.request('GET', '/api/reference-cache/stats')
+            if status == 200:
+                return
+        except (OSError, HttpError):
+            pass
+        finally:
+            await connection.close()
+        await asyncio.sleep(0.2)
+    raise SystemExit(f'the server did not answer within {STARTUP_TIMEOUT}s')
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _start_gunicorn(args, port):
+    env = dict(os.environ)
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    command = [sys.executable, '-m', 'gunicorn', 'wsgi:application', '--chdir', SRC,
+               '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+               '--threads', str(args.threads), '--worker-class', args.worker_class,
+               '--log-level', 'warning']
+    return subprocess.Popen(command, env=env)
+
+
+def summarize(results, duration):
+    """
+    Merge the results of every client process into per-route statistics.
+    Returns:
+        dict: Route label -> requests, throughput, error count, status counts and percentiles.
+    """
+    merged = {}
+    for result in results:
+        for label, entry in result.items():
+            target = merged.setdefault(label, {'latencies': [], 'statuses': {}, 'bytes': 0})
+            target['latencies'].extend(entry['latencies'])
+            target['bytes'] += entry['bytes']
+            for status, count in entry['statuses'].items():
+                target['statuses'][status] = target['statuses'].get(status, 0) + count
+    routes = {}
+    for label, entry in sorted(merged.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        routes[label] = {
+            'requests': count,
+            'requests_per_second': round(count / duration, 1),
+            'errors': sum(n for status, n in entry['statuses'].items() if not 0 < status < 400),
+            'statuses': {str(status): n for status, n in sorted(entry['statuses'].items())},
+            'mean_bytes': round(entry['bytes'] / count),
+            **{f'p{pct}_ms': round(latencies[min(count - 1, max(0, round(pct / 100 * count) - 1))] * 1000, 2)
+               for pct in PERCENTILES},
+            'max_ms': round(latencies[-1] * 1000, 2),
+        }
+    return routes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Load an already running server instead of starting gunicorn.')
+    parser.add_argument('--database-url', help='DATABASE_URL of the gunicorn server; defaults to the environment.')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes.')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker.')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class, e.g. sync or gthread.')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent simulated users.')
+    parser.add_argument('--client-processes', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Processes the clients are spread over.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of measured load.')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='Seconds of unmeasured load first, while the workers fill their caches.')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password of the seeded users.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report here.')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        address = urlsplit(args.url)
+        host, port = address.hostname, address.port or 80
+    else:
+        host, port = '127.0.0.1', _free_port()
+        server = _start_gunicorn(args, port)
+    try:
+        asyncio.run(_wait_until_up(host, port, server))
+        fixtures = asyncio.run(_fetch_fixtures(host, port, args.password))
+        processes = max(1, min(args.client_processes, args.clients))
+        shares = [args.clients // processes + (index < args.clients % processes) for index in range(processes)]
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(_client_process, host, port, share, args.warmup, args.duration, fixtures,
+                                   args.seed + index) for index, share in enumerate(shares)]
+            results = [future.result() for future in futures]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    routes = summarize(results, args.duration)
+    total = sum(route['requests'] for route in routes.values())
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'server': args.url or {'workers': args.workers, 'threads': args.threads,
+                               'worker_class': args.worker_class},
+        'clients': args.clients, 'client_processes': len(shares), 'duration_seconds': args.duration,
+        'requests': total, 'requests_per_second': round(total / args.duration, 1),
+        'errors': sum(route['errors'] for route in routes.values()),
+        'routes': routes,
+    }
+    print(f"{total} requests in {args.duration:.0f}s from {args.clients} clients: "
+          f"{report['requests_per_second']} req/s, {report['errors']} errors")
+    print(f"{'route':<36}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err':>6}")
+    for label, stats in routes.items():
+        print(f"{label:<36}{stats['requests_per_second']:>9.1f}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+              f"{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}{stats['errors']:>6}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py reads its configuration when imported.
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-long-enough-for-hs256')
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+from app import app as flask_app  # noqa: E402
+from api.models import db  # noqa: E402
+from api.autocomplete import autocomplete_index  # noqa: E402
+from api.reference_cache import reference_cache  # noqa: E402
+from api.tag_index import tag_bitmap_index  # noqa: E402
+from api.user_cache import user_cache  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    # Every test starts from table versions 0 again, so data cached by the
+    # previous one could look current.
+    autocomplete_index.invalidate()
+    tag_bitmap_index.invalidate()
+    reference_cache.invalidate()
+    user_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def count_statements():
+    """Collect the SQL statements run by this thread, not by index builds in the background."""
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
@@ -0,0 +1,90 @@
+import pytest
+from conftest import count_statements
+
+
+def seed_city(client):
+    assert client.post('/api/tags', json={'name': 'beach'}).status_code == 201
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'}).status_code == 201
+
+
+def poi(name, **fields):
+    return {'name': name, 'description': 'd', 'latitude': 40, 'longitude': -3,
+            'country_name': 'Spain', 'city_name': 'Madrid', **fields}
+
+
+def poi_names(client):
+    return {poi['name'] for poi in client.get('/api/pois?fields=name').json['pois']}
+
+
+def test_batch_is_created_whole(client):
+    seed_city(client)
+    response = client.post('/api/pois', json=[poi(f'Poi {k}', tags=['beach']) for k in range(3)])
+    assert response.status_code == 201, response.json
+    assert poi_names(client) == {'Poi 0', 'Poi 1', 'Poi 2'}
+
+
+def test_duplicate_within_the_batch_creates_nothing(client):
+    seed_city(client)
+    response = client.post('/api/pois', json=[poi('Poi 0'), poi('Poi 1'), poi('Poi 0')])
+    assert response.status_code == 400
+    assert response.json['message'].startswith('Duplicate entry')
+    assert poi_names(client) == set()
+
+
+def test_stored_conflict_creates_nothing(client):
+    seed_city(client)
+    assert client.post('/api/pois', json=[poi('Poi 1')]).status_code == 201
+    response = client.post('/api/pois', json=[poi('Poi 0'), poi('Poi 1'), poi('Poi 2')])
+    assert response.status_code == 400
+    assert response.json['message'] == "POI 'Poi 1' already exists in this city"
+    assert poi_names(client) == {'Poi 1'}
+
+
+@pytest.mark.parametrize('items, message', [
+    # The stored conflict comes first, although it is only found after the
+    # later item has failed validation.
+    ([poi('Poi 1'), poi('Poi 2', city_name='Toledo')],
+     "POI 'Poi 1' already exists in this city"),
+    ([poi('Poi 2', city_name='Toledo'), poi('Poi 1')],
+     "City 'Toledo' in country 'Spain' not found"),
+    ([poi('Poi 2', tags=['unknown']), poi('Poi 1')],
+     "Tag 'unknown' not found"),
+    ([poi('Poi 2'), poi('Poi 1', tags=['unknown'])],
+     "POI 'Poi 1' already exists in this city"),
+])
+def test_first_failing_item_decides_the_error(client, items, message):
+    seed_city(client)
+    assert client.post('/api/pois', json=[poi('Poi 1')]).status_code == 201
+    response = client.post('/api/pois', json=items)
+    assert response.status_code in (400, 404)
+    assert response.json['message'] == message
+    assert poi_names(client) == {'Poi 1'}
+
+
+@pytest.mark.parametrize('url, items, message', [
+    ('/api/tags', [{'name': 'museum'}, {'name': 'beach'}], "Tag 'beach' already exists"),
+    ('/api/countries', [{'name': 'France', 'img': 'x'}, {'name': 'Spain', 'img': 'x'}],
+     'Country Spain already exists'),
+])
+def test_reference_tables_reject_stored_names(client, url, items, message):
+    seed_city(client)
+    response = client.post(url, json=items)
+    assert response.status_code == 400
+    assert response.json['message'] == message
+    assert client.post(url, json=items[:1]).status_code == 201
+
+
+def test_existence_check_does_not_grow_with_the_batch(client):
+    seed_city(client)
+    # The first create also loads the reference data; only later ones are counted.
+    assert client.post('/api/pois', json=[poi('Warm up', tags=['beach'])]).status_code == 201
+    counts = []
+    for start, count in ((0, 2), (2, 40)):
+        items = [poi(f'Poi {k}', tags=['beach']) for k in range(start, start + count)]
+        with count_statements() as statements:
+            response = client.post('/api/pois', json=items)
+        assert response.status_code == 201, response.json
+        counts.append(len(statements))
+    assert counts[0] == counts[1], counts
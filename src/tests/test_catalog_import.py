@@ -0,0 +1,104 @@
+import json
+import os
+import pytest
+from api.catalog_import import CatalogImportError, import_catalog
+from api.models import db, City, Poi, PoiImage, PoiTag
+
+
+def catalog_lines(poi_count):
+    lines = [
+        {'type': 'country', 'name': 'Spain', 'img': 'x'},
+        {'type': 'tag', 'name': 'beach'},
+        {'type': 'city', 'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'},
+    ]
+    lines += [{'type': 'poi', 'name': f'Poi {k}', 'description': 'd', 'latitude': 40,
+               'longitude': -3, 'country_name': 'Spain', 'city_name': 'Madrid',
+               'tags': ['beach'], 'poiimages': [f'http://img/{k}']} for k in range(poi_count)]
+    return [json.dumps(line) for line in lines]
+
+
+def write_catalog(tmp_path, lines):
+    path = tmp_path / 'catalog.ndjson'
+    path.write_text(''.join(f'{line}\n' for line in lines))
+    return str(path)
+
+
+def test_catalog_is_imported_once(app, tmp_path):
+    path = write_catalog(tmp_path, catalog_lines(5) + [json.dumps(
+        {'type': 'poi_image', 'url': 'http://img/extra', 'poi_name': 'Poi 0',
+         'city_name': 'Madrid', 'country_name': 'Spain'})])
+    totals = import_catalog(path, chunk_size=3, report=lambda line: None)
+    assert totals['poi'] == {'inserted': 5, 'existing': 0}
+    assert totals['poi_image']['inserted'] == 6
+    assert Poi.query.count() == 5 and PoiTag.query.count() == 5 and PoiImage.query.count() == 6
+    assert not os.path.exists(f'{path}.checkpoint')
+
+    # Importing again only matches the stored rows.
+    totals = import_catalog(path, chunk_size=3, report=lambda line: None)
+    assert totals['poi'] == {'inserted': 0, 'existing': 5}
+    assert totals['poi_image']['inserted'] == 0
+    assert Poi.query.count() == 5 and PoiImage.query.count() == 6
+
+
+def test_import_resumes_after_the_last_committed_chunk(app, tmp_path):
+    lines = catalog_lines(7)
+    good_line = lines[8]
+    lines[8] = '{not json'
+    path = write_catalog(tmp_path, lines)
+
+    with pytest.raises(CatalogImportError) as error:
+        import_catalog(path, chunk_size=3, report=lambda line: None)
+    assert error.value.line_number == 9
+    # The chunks of lines 1-3 and 4-6 are kept.
+    assert Poi.query.count() == 3
+    assert os.path.exists(f'{path}.checkpoint')
+
+    lines[8] = good_line
+    write_catalog(tmp_path, lines)
+    reports = []
+    totals = import_catalog(path, chunk_size=3, report=reports.append)
+    assert reports[0] == 'Resuming after line 6'
+    assert totals['poi'] == {'inserted': 4, 'existing': 0}
+    assert Poi.query.count() == 7
+    assert not os.path.exists(f'{path}.checkpoint')
+
+
+def test_restart_ignores_the_checkpoint(app, tmp_path):
+    lines = catalog_lines(4)
+    path = write_catalog(tmp_path, lines + ['{not json'])
+    with pytest.raises(CatalogImportError):
+        import_catalog(path, chunk_size=2, report=lambda line: None)
+
+    write_catalog(tmp_path, lines)
+    totals = import_catalog(path, chunk_size=2, restart=True, report=lambda line: None)
+    assert totals['city'] == {'inserted': 0, 'existing': 1}
+    # Poi 3 shared its chunk with the invalid line.
+    assert totals['poi'] == {'inserted': 1, 'existing': 3}
+
+
+def test_missing_references_name_their_line(app, tmp_path):
+    lines = catalog_lines(2)
+    lines[4] = lines[4].replace('"Madrid"', '"Toledo"')
+    path = write_catalog(tmp_path, lines)
+    with pytest.raises(CatalogImportError) as error:
+        import_catalog(path, report=lambda line: None)
+    assert error.value.line_number == 5
+    assert "City 'Toledo' in country 'Spain' not found" in str(error.value)
+    assert City.query.count() == 0
+
+
+def test_database_rejection_names_the_line_and_its_offset(app, tmp_path):
+    db.session.execute(db.text(
+        "CREATE TRIGGER reject_poi BEFORE INSERT ON poi WHEN new.name = 'Poi 4' "
+        "BEGIN SELECT RAISE(ABORT, 'rejected name'); END"))
+    db.session.commit()
+    lines = catalog_lines(6)
+    path = write_catalog(tmp_path, lines)
+
+    with pytest.raises(CatalogImportError) as error:
+        import_catalog(path, chunk_size=4, report=lambda line: None)
+    assert error.value.line_number == 8
+    assert error.value.offset == sum(len(line) + 1 for line in lines[:7])
+    assert 'rejected name' in str(error.value)
+    # Lines 1-4 were committed, the chunk of lines 5-8 was rolled back.
+    assert Poi.query.count() == 1
@@ -0,0 +1,67 @@
+import uuid
+from conftest import count_statements
+from api.models import db, Country, City
+from api.table_versions import get_table_versions
+
+
+def create_country(client, name):
+    assert client.post('/api/countries', json={'name': name, 'img': 'x'}).status_code == 201
+
+
+def test_unchanged_list_is_answered_304_from_the_versions_alone(client):
+    create_country(client, 'Spain')
+    response = client.get('/api/countries')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    with count_statements() as statements:
+        response = client.get('/api/countries', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    # Only the table versions are read.
+    assert len(statements) == 1, statements
+
+
+def test_etag_changes_once_a_write_commits(client):
+    create_country(client, 'Spain')
+    etag = client.get('/api/countries').headers['ETag']
+
+    create_country(client, 'France')
+    response = client.get('/api/countries', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert {country['name'] for country in response.json['countries']} == {'Spain', 'France'}
+
+
+def test_etag_depends_on_the_query_string(client):
+    create_country(client, 'Spain')
+    etag = client.get('/api/countries').headers['ETag']
+    response = client.get('/api/countries?limit=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_versions_are_bumped_once_per_transaction_after_it_commits(app):
+    before = get_table_versions(('country', 'city'))
+    country = Country(id=str(uuid.uuid4()), name='Spain', img='x')
+    db.session.add(country)
+    db.session.flush()
+    db.session.add(City(id=str(uuid.uuid4()), name='Madrid', season='summer', country_id=country.id))
+    db.session.flush()
+    country.img = 'y'
+    db.session.flush()
+    # Nothing is bumped inside the writing transaction.
+    assert get_table_versions(('country', 'city')) == before
+
+    db.session.commit()
+    assert get_table_versions(('country', 'city')) == (before[0] + 1, before[1] + 1)
+
+
+def test_rolled_back_writes_bump_nothing(app):
+    before = get_table_versions(('country',))
+    db.session.add(Country(id=str(uuid.uuid4()), name='Spain', img='x'))
+    db.session.flush()
+    db.session.rollback()
+
+    db.session.commit()
+    assert get_table_versions(('country',)) == before
@@ -0,0 +1,86 @@
+import pytest
+from api.geo import encode_geohash, haversine_km
+
+# (name, latitude, longitude) around a centre on the antimeridian, so the
+# radius boxes are split in two.
+CENTRE = (10.0, 179.99)
+PLACES = [
+    ('East 1', 10.0, 179.995),
+    ('West 2', 10.0, -179.985),
+    ('North 5', 10.045, 179.99),
+    ('West 20', 10.0, -179.808),
+    ('South 40', 9.64, 179.99),
+    ('Far', 12.0, 179.99),
+]
+
+
+def seed_places(client):
+    assert client.post('/api/countries', json={'name': 'Fiji', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Suva', 'season': 'summer', 'country_name': 'Fiji'}).status_code == 201
+    response = client.post('/api/pois', json=[{
+        'name': name, 'description': 'd', 'latitude': latitude, 'longitude': longitude,
+        'country_name': 'Fiji', 'city_name': 'Suva',
+    } for name, latitude, longitude in PLACES])
+    assert response.status_code == 201, response.json
+
+
+def expected_nearest(radius_km):
+    distances = sorted((haversine_km(*CENTRE, latitude, longitude), name)
+                       for name, latitude, longitude in PLACES)
+    return [name for distance, name in distances if distance <= radius_km]
+
+
+def nearest_names(client, radius_km, limit=None):
+    names = []
+    distances = []
+    cursor = None
+    while True:
+        url = f'/api/pois?near={CENTRE[0]},{CENTRE[1]}&radius_km={radius_km}'
+        if limit:
+            url += f'&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.json
+        names.extend(poi['name'] for poi in response.json['pois'])
+        distances.extend(poi['distance_km'] for poi in response.json['pois'])
+        cursor = response.json.get('next_cursor')
+        if cursor is None:
+            break
+    assert distances == sorted(distances)
+    return names
+
+
+def test_encode_geohash():
+    assert encode_geohash(42.605, -5.603, 5) == 'ezs42'
+    # Nearby points share a prefix.
+    assert encode_geohash(40.4168, -3.7038)[:5] == encode_geohash(40.4169, -3.7037)[:5]
+
+
+def test_haversine_km():
+    assert haversine_km(0, 0, 0, 0) == 0
+    assert haversine_km(0, 0, 0, 1) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km(0, 179.5, 0, -179.5) == pytest.approx(111.195, abs=0.01)
+
+
+@pytest.mark.parametrize('radius_km', [3, 30, 100])
+def test_nearest_pois_are_sorted_by_distance_within_the_radius(client, radius_km):
+    seed_places(client)
+    assert nearest_names(client, radius_km) == expected_nearest(radius_km)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 10])
+def test_nearest_pages_follow_the_unpaged_order(client, limit):
+    # Small pages are answered from the inner rings only.
+    seed_places(client)
+    assert nearest_names(client, 100, limit=limit) == expected_nearest(100)
+
+
+@pytest.mark.parametrize('query', [
+    'near=10,179.99',
+    'near=10,179.99&radius_km=0',
+    'near=91,0&radius_km=5',
+    'near=10&radius_km=5',
+])
+def test_invalid_near_searches_are_rejected(client, query):
+    response = client.get(f'/api/pois?{query}')
+    assert response.status_code == 400
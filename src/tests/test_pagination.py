@@ -0,0 +1,82 @@
+import pytest
+from api.pagination import decode_cursor, encode_cursor
+from api.utils import APIException
+
+
+def seed_pois(client, count):
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json=[
+        {'name': city, 'season': 'summer', 'country_name': 'Spain'}
+        for city in ('Madrid', 'Toledo')]).status_code == 201
+    # Both cities get the same names, so the id has to break ties between pages.
+    response = client.post('/api/pois', json=[{
+        'name': f'Poi {k}', 'description': 'd', 'latitude': 40, 'longitude': -3,
+        'country_name': 'Spain', 'city_name': city,
+    } for k in range(count) for city in ('Madrid', 'Toledo')])
+    assert response.status_code == 201, response.json
+
+
+def test_cursor_round_trips():
+    values = ['Poi 1', 'b0a2c1d4', 2.5, 7]
+    assert decode_cursor(encode_cursor(values), [str, str, float, int]) == values
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    encode_cursor({'name': 'Poi 1'}),
+    encode_cursor(['Poi 1']),
+    encode_cursor(['Poi 1', 'id', 'extra']),
+])
+def test_decode_cursor_rejects_malformed_cursors(cursor):
+    with pytest.raises(APIException) as error:
+        decode_cursor(cursor, [str, str])
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('values, types', [
+    ([1, 'id'], [str, str]),
+    (['Poi 1', None], [str, str]),
+    ([True, 'id'], [int, str]),
+    (['1.5', 'id'], [float, str]),
+    ([['Poi 1'], 'id'], [str, str]),
+])
+def test_decode_cursor_rejects_values_of_the_wrong_type(values, types):
+    with pytest.raises(APIException) as error:
+        decode_cursor(encode_cursor(values), types)
+    assert error.value.status_code == 400
+
+
+def test_decode_cursor_accepts_integral_floats():
+    # JSON encoders may write 1.0 as 1.
+    assert decode_cursor(encode_cursor([1, 'id']), [float, str]) == [1, 'id']
+
+
+def test_poi_pages_return_every_poi_once(client):
+    seed_pois(client, 7)
+    expected = [poi['id'] for poi in client.get('/api/pois').json['pois']]
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/pois?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.json
+        seen.extend(poi['id'] for poi in response.json['pois'])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize('values', [[1, 2], ['Poi 1'], ['Poi 1', {'id': 1}]])
+def test_poi_list_rejects_cursors_not_matching_its_sort_key(client, values):
+    seed_pois(client, 3)
+    response = client.get(f'/api/pois?limit=2&cursor={encode_cursor(values)}')
+    assert response.status_code == 400
+    assert response.json['message'] == 'Invalid cursor'
+
+
+def test_cursor_requires_a_limit(client):
+    response = client.get(f"/api/pois?cursor={encode_cursor(['Poi 1', 'id'])}")
+    assert response.status_code == 400
@@ -0,0 +1,67 @@
+from conftest import count_statements
+
+TAGS = ['beach', 'museum', 'park']
+LIST_URLS = [
+    '/api/pois',
+    '/api/pois?limit=100',
+    '/api/pois?fields=name,images,tags',
+    '/api/pois?tags=beach',
+    '/api/popular-pois',
+]
+
+
+def create_pois(client, start, count):
+    items = [{
+        'name': f'Poi {k}',
+        'description': f'Place number {k}',
+        'latitude': 40 + k * 0.001,
+        'longitude': -3 + k * 0.001,
+        'country_name': 'Spain',
+        'city_name': 'Madrid',
+        'tags': TAGS[:1 + k % len(TAGS)],
+        'poiimages': [f'http://img/{k}/a', f'http://img/{k}/b'],
+    } for k in range(start, start + count)]
+    response = client.post('/api/pois', json=items)
+    assert response.status_code == 201, response.json
+
+
+def statements_per_url(client):
+    counts = {}
+    for url in LIST_URLS:
+        # The first request may build per-worker indexes; only the second is counted.
+        client.get(url)
+        with count_statements() as statements:
+            response = client.get(url)
+        assert response.status_code == 200, response.json
+        counts[url] = len(statements)
+    return counts
+
+
+def test_poi_lists_run_the_same_statements_for_any_number_of_pois(client):
+    assert client.post('/api/tags', json=[{'name': name} for name in TAGS]).status_code == 201
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'}).status_code == 201
+
+    create_pois(client, 0, 5)
+    few = statements_per_url(client)
+    create_pois(client, 5, 95)
+    many = statements_per_url(client)
+
+    assert many == few
+    assert max(many.values()) <= 6, many
+
+
+def test_poi_detail_runs_a_fixed_number_of_statements(client):
+    assert client.post('/api/tags', json=[{'name': name} for name in TAGS]).status_code == 201
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'}).status_code == 201
+    create_pois(client, 0, 3)
+
+    poi_id = client.get('/api/pois?limit=1').json['pois'][0]['id']
+    with count_statements() as statements:
+        response = client.get(f'/api/pois/{poi_id}')
+    assert response.status_code == 200
+    assert response.json['poi']['images'] and response.json['poi']['tags']
+    assert len(statements) <= 4, statements
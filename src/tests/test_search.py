@@ -0,0 +1,75 @@
+import pytest
+from api.search import search_terms
+
+POIS = [
+    ('Prado Museum', 'Art museum on the Paseo del Prado'),
+    ('Reina Sofia', 'Museum of modern art'),
+    ('Retiro Park', 'Large park with a lake'),
+    ('Royal Palace', 'Official residence of the royal family'),
+]
+
+
+def seed_pois(client):
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'}).status_code == 201
+    response = client.post('/api/pois', json=[{
+        'name': name, 'description': description, 'latitude': 40, 'longitude': -3,
+        'country_name': 'Spain', 'city_name': 'Madrid',
+    } for name, description in POIS])
+    assert response.status_code == 201, response.json
+
+
+def searched_names(client, text, limit=None):
+    names = []
+    cursor = None
+    while True:
+        url = f'/api/pois?q={text}&fields=name'
+        if limit:
+            url += f'&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.json
+        names.extend(poi['name'] for poi in response.json['pois'])
+        cursor = response.json.get('next_cursor')
+        if cursor is None:
+            break
+    assert len(names) == len(set(names))
+    return names
+
+
+def test_search_terms():
+    assert search_terms('  Prado, MUSEUM!') == ['prado', 'museum']
+    assert search_terms('a b c d e f g h i j') == list('abcdefgh')
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('museum', {'Prado Museum', 'Reina Sofia'}),
+    ('mus', {'Prado Museum', 'Reina Sofia'}),
+    # Every term has to match.
+    ('mus prad', {'Prado Museum'}),
+    ('mus lake', set()),
+    ('mad', {name for name, _ in POIS}),
+    ('ro', {'Royal Palace'}),
+])
+def test_every_term_matches_as_a_prefix(client, text, expected):
+    seed_pois(client)
+    assert set(searched_names(client, text)) == expected
+
+
+def test_names_weigh_more_than_descriptions(client):
+    seed_pois(client)
+    assert searched_names(client, 'museum')[0] == 'Prado Museum'
+
+
+@pytest.mark.parametrize('limit', [1, 3])
+def test_search_pages_follow_the_unpaged_ranking(client, limit):
+    seed_pois(client)
+    assert searched_names(client, 'madrid', limit=limit) == searched_names(client, 'madrid')
+
+
+def test_renamed_pois_are_found_by_their_new_name(client):
+    seed_pois(client)
+    poi_id = client.get('/api/pois?q=retiro').json['pois'][0]['id']
+    response = client.put(f'/api/pois/{poi_id}', json={'name': 'Buen Retiro Gardens'})
+    assert response.status_code == 200, response.json
+    assert searched_names(client, 'gard') == ['Buen Retiro Gardens']
@@ -0,0 +1,102 @@
+import pytest
+from api import tag_index
+from api.tag_index import _Bitmaps, tag_bitmap_index
+
+TAGS = ['beach', 'museum', 'park']
+# Tags of POI k are TAG_PATTERNS[k % len(TAG_PATTERNS)].
+TAG_PATTERNS = [['beach', 'museum'], ['beach'], ['museum', 'park'], [], ['beach', 'museum', 'park']]
+POI_COUNT = 15
+QUERIES = [
+    ('beach', 'all'),
+    ('beach,museum', 'all'),
+    ('museum,park', 'all'),
+    ('beach,park', 'any'),
+    ('park', 'any'),
+]
+
+
+def create_pois(client, start, count):
+    response = client.post('/api/pois', json=[{
+        'name': f'Poi {k}', 'description': 'd', 'latitude': 40, 'longitude': -3,
+        'country_name': 'Spain', 'city_name': 'Madrid',
+        'tags': TAG_PATTERNS[k % len(TAG_PATTERNS)],
+    } for k in range(start, start + count)])
+    assert response.status_code == 201, response.json
+
+
+@pytest.fixture
+def tagged_pois(client):
+    assert client.post('/api/tags', json=[{'name': name} for name in TAGS]).status_code == 201
+    assert client.post('/api/countries', json={'name': 'Spain', 'img': 'x'}).status_code == 201
+    assert client.post('/api/cities', json={
+        'name': 'Madrid', 'season': 'summer', 'country_name': 'Spain'}).status_code == 201
+    create_pois(client, 0, POI_COUNT)
+    # Loaded now rather than in the background on the first request.
+    assert tag_bitmap_index.current() is not None
+    return client
+
+
+def expected_names(tags, mode, count=POI_COUNT):
+    wanted = set(tags.split(','))
+    combine = wanted.issubset if mode == 'all' else wanted.intersection
+    return {f'Poi {k}' for k in range(count) if combine(TAG_PATTERNS[k % len(TAG_PATTERNS)])}
+
+
+def listed_names(client, tags, mode, limit=None):
+    names = []
+    cursor = None
+    while True:
+        url = f'/api/pois?tags={tags}&tag_mode={mode}&fields=name'
+        if limit:
+            url += f'&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.json
+        names.extend(poi['name'] for poi in response.json['pois'])
+        cursor = response.json.get('next_cursor')
+        if cursor is None:
+            break
+    assert len(names) == len(set(names))
+    return set(names)
+
+
+def test_bitmaps_combine_tags():
+    bitmaps = _Bitmaps()
+    bitmaps.load([('p1', 't1'), ('p2', 't1'), ('p2', 't2'), ('p3', 't2')])
+    assert sorted(bitmaps.ids(bitmaps.match(['t1', 't2'], 'all'))) == ['p2']
+    assert sorted(bitmaps.ids(bitmaps.match(['t1', 't2'], 'any'))) == ['p1', 'p2', 'p3']
+    assert bitmaps.ids(bitmaps.match(['t1', 'unknown'], 'all')) == []
+
+    bitmaps.untag('p2', 't1')
+    bitmaps.tag('p4', 't1')
+    assert sorted(bitmaps.ids(bitmaps.match(['t1'], 'all'))) == ['p1', 'p4']
+
+
+@pytest.mark.parametrize('tags, mode', QUERIES)
+def test_bitmap_id_lists_match_the_tags(tagged_pois, tags, mode):
+    assert listed_names(tagged_pois, tags, mode) == expected_names(tags, mode)
+    assert listed_names(tagged_pois, tags, mode, limit=2) == expected_names(tags, mode)
+
+
+@pytest.mark.parametrize('tags, mode', QUERIES)
+def test_tag_match_pages_match_the_tags(tagged_pois, monkeypatch, tags, mode):
+    # Every match is too large for an id list, so pages test a TagMatch in memory.
+    monkeypatch.setattr(tag_index, 'MAX_BITMAP_IDS', 0)
+    assert listed_names(tagged_pois, tags, mode, limit=2) == expected_names(tags, mode)
+    assert listed_names(tagged_pois, tags, mode, limit=1000) == expected_names(tags, mode)
+    assert listed_names(tagged_pois, tags, mode) == expected_names(tags, mode)
+
+
+@pytest.mark.parametrize('tags, mode', QUERIES)
+def test_sql_fallback_matches_the_tags(tagged_pois, monkeypatch, tags, mode):
+    # As while the index is being rebuilt.
+    monkeypatch.setattr(tag_bitmap_index, 'match', lambda tag_ids, mode: None)
+    assert listed_names(tagged_pois, tags, mode) == expected_names(tags, mode)
+    assert listed_names(tagged_pois, tags, mode, limit=2) == expected_names(tags, mode)
+
+
+def test_tagging_updates_the_loaded_index_in_place(tagged_pois):
+    builds = tag_bitmap_index.builds
+    create_pois(tagged_pois, POI_COUNT, 5)
+    expected = expected_names('beach,park', 'all', POI_COUNT + 5)
+    assert listed_names(tagged_pois, 'beach,park', 'all') == expected
+    assert tag_bitmap_index.builds == builds